@@ -1,20 +1,26 @@
 # FastAPI + REST API example (Contacts) + Authorization + ...
+import asyncio
+import logging
 
 from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi_limiter.depends import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates  # poetry add jinja2
-import redis.asyncio as redis
-from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import uvicorn
 from starlette.templating import _TemplateResponse
 
 from src.conf.config import settings
-from src.database.db_connect import get_db
-from src.routes import auth, contacts, users
+from src.database.db_connect import get_db, replica_router
+from src.routes import auth, contacts, internal, users
+from src.services.auth import auth_service
+from src.services.circuit_breaker import REDIS_ERRORS, redis_breaker
+from src.services.hash_cost import calibrate
+from src.services.redis_client import redis_client
+from src.services.user_cache import user_cache
 
 
 # export PYTHONPATH="${PYTHONPATH}:/1prj/pyweb_hw13/"
@@ -33,6 +39,7 @@ app.add_middleware(
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+app.include_router(internal.router, prefix='/api')
 
 
 templates = Jinja2Templates(directory='templates')
@@ -43,22 +50,164 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def startup():
     """
     The startup function is called when the application starts up.
-    It's used to initialize Redis, which allows us to use Redis for rate limiting.
+    It pings Redis through the shared pool of the worker, which opens the first connection,
+    so a misconfigured Redis is reported at once.
+    Redis is not required to start: while it is unreachable the Redis consumers fail fast (redis_breaker).
 
-    :return: A client object, which is then passed to the fastapi limiter
+    :return: None
     :doc-author: Trelent
     """
-    client = await redis.Redis(
-                               host=settings.redis_host,
-                               port=settings.redis_port,
-                               password=settings.redis_password,
-                               db=0, 
-                               encoding="utf-8",
-                               decode_responses=True
-                               )
-    
-    # is used to initialize a connection to Redis, enabling Redis to store rate-limiting information:
-    await FastAPILimiter.init(client)
+    try:
+        await redis_breaker.call(redis_client.ping)
+
+    except REDIS_ERRORS as error:
+        # the application starts without Redis, the rate limits fail open (or closed, settings.rate_limit_fail_open)
+        logging.error(f'Redis is unreachable at startup. error:\n{error}')
+
+
+@app.on_event("startup")
+async def start_rate_limit_flush():
+    """
+    The start_rate_limit_flush function charges the requests admitted by the local token buckets of this worker
+    to Redis, in one pipelined batch every settings.rate_limit_flush_interval seconds.
+
+    :return: None
+    """
+    app.state.rate_limit_flusher = asyncio.create_task(
+                                                       contacts.rate_limiter.watch(settings.rate_limit_flush_interval)
+                                                       )
+
+
+@app.on_event("shutdown")
+async def stop_rate_limit_flush():
+    """
+    The stop_rate_limit_flush function stops the batched charges and charges the last batch.
+
+    :return: None
+    """
+    flusher = getattr(app.state, 'rate_limit_flusher', None)
+    if flusher is not None:
+        flusher.cancel()
+
+    try:
+        await contacts.rate_limiter.flush()
+
+    except (RedisError, OSError) as error:
+        logging.error(f'Locally admitted requests are not charged. error:\n{error}')
+
+
+@app.on_event("startup")
+async def start_replica_health_checks():
+    """
+    The start_replica_health_checks function starts the background health checks of the read replicas
+    (if any are configured), so a failed replica leaves the rotation and a recovered one returns to it.
+
+    :return: None
+    """
+    if replica_router.replicas:
+        app.state.replica_watcher = asyncio.create_task(replica_router.watch(settings.replica_health_interval))
+
+
+@app.on_event("startup")
+async def calibrate_password_cost():
+    """
+    The calibrate_password_cost function picks the bcrypt cost which fits into settings.password_hash_budget_ms
+    on this machine, if settings.password_hash_rounds is 0 (otherwise the configured cost is used).
+    The measurement runs in the hashing pool, the workers with a faster machine may choose a higher cost:
+    pin PASSWORD_HASH_ROUNDS (python -m src.services.hash_cost) to keep one cost for all the workers.
+
+    :return: None
+    """
+    if settings.password_hash_rounds == 0:
+        rounds = await auth_service.hashing_pool.run(
+                                                     calibrate,
+                                                     settings.password_hash_budget_ms,
+                                                     settings.password_hash_min_rounds
+                                                     )
+        auth_service.set_password_cost(rounds)
+
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    """
+    The start_revocation_sync function keeps the local filter of the revoked tokens of this worker in sync
+    with Redis (every settings.revocation_sync_interval seconds).
+
+    :return: None
+    """
+    app.state.revocation_watcher = asyncio.create_task(
+                                                       auth_service.revocations.watch(settings.revocation_sync_interval)
+                                                       )
+
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    """
+    The stop_revocation_sync function stops the sync of the revoked tokens.
+
+    :return: None
+    """
+    watcher = getattr(app.state, 'revocation_watcher', None)
+    if watcher is not None:
+        watcher.cancel()
+
+
+@app.on_event("startup")
+async def start_user_cache_invalidations():
+    """
+    The start_user_cache_invalidations function subscribes the worker to the invalidations of the user cache,
+    so a user changed by any worker leaves the in-process cache of this worker at once.
+
+    :return: None
+    """
+    app.state.user_cache_watcher = asyncio.create_task(user_cache.watch())
+
+
+@app.on_event("shutdown")
+async def stop_user_cache_invalidations():
+    """
+    The stop_user_cache_invalidations function stops listening to the invalidations of the user cache.
+
+    :return: None
+    """
+    watcher = getattr(app.state, 'user_cache_watcher', None)
+    if watcher is not None:
+        watcher.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_hashing_pool():
+    """
+    The stop_hashing_pool function stops the threads of the password hashing pool.
+
+    :return: None
+    """
+    auth_service.hashing_pool.shutdown()
+
+
+@app.on_event("shutdown")
+async def stop_replica_health_checks():
+    """
+    The stop_replica_health_checks function stops the health checks and closes the connections to the replicas.
+
+    :return: None
+    """
+    watcher = getattr(app.state, 'replica_watcher', None)
+    if watcher is not None:
+        watcher.cancel()
+
+    await replica_router.dispose()
+
+
+# registered after all the other shutdown handlers: they may still use Redis (e.g. stop_rate_limit_flush)
+@app.on_event("shutdown")
+async def close_redis():
+    """
+    The close_redis function closes the connections of the shared Redis pool of the worker.
+
+    :return: None
+    """
+    await redis_client.close(close_connection_pool=True)
 
 
 @app.get('/', response_class=HTMLResponse, description='Main Page')
@@ -76,7 +225,7 @@ async def root(request: Request) -> _TemplateResponse:
 
 
 @app.get('/api/healthchecker')
-def healthchecker(db: Session = Depends(get_db)) -> dict:
+async def healthchecker(db: AsyncSession = Depends(get_db)) -> dict:
     """
     Check if the container (DB server) is up.
     The healthchecker function is a simple function that checks if the database connection is working.
@@ -85,12 +234,12 @@ def healthchecker(db: Session = Depends(get_db)) -> dict:
     message 'Error connecting to the database!'.
     Otherwise, we return a dictionary with key 'ALERT' and value 'Welcome to FastAPI! System ready!'.
 
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dict with the key 'alert' and value 'welcome to fastapi! system ready!' (? JSONResponse)
     :doc-author: Trelent
     """
     try:
-        result = db.execute(text('SELECT 1')).fetchone()
+        result = (await db.execute(text('SELECT 1'))).fetchone()
         if result is None:
             raise HTTPException(status_code=500, detail='Database is not configured correctly!')
         
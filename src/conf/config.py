@@ -1,9 +1,48 @@
-from pydantic import BaseSettings
+from typing import Optional
+
+from pydantic import BaseModel, BaseSettings, validator
+
+
+class EngineProfile(BaseModel):
+    """Engine, connection pool and logging options of one deployment profile."""
+    echo: bool = False  # log every SQL statement
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30  # seconds to wait for a free connection
+    pool_recycle: int = -1  # seconds after which a connection is replaced, -1 - never
+    pool_pre_ping: bool = False  # test the connection on every checkout
+    log_level: str = 'INFO'
+
+
+ENGINE_PROFILES = {
+                   'dev': EngineProfile(echo=True, pool_size=10, max_overflow=5, log_level='DEBUG'),
+                   'test': EngineProfile(pool_size=2, max_overflow=0, pool_timeout=5),
+                   'prod': EngineProfile(
+                                         pool_size=20,
+                                         max_overflow=10,
+                                         pool_timeout=10,
+                                         pool_recycle=1800,
+                                         pool_pre_ping=True,
+                                         log_level='WARNING'
+                                         ),
+                   }
 
 
 class Settings(BaseSettings):
     """Class for settings."""
     sqlalchemy_database_url: str
+    db_profile: str = 'dev'  # one of ENGINE_PROFILES, the db_* options below override the profile values
+    db_echo: Optional[bool] = None
+    db_pool_size: Optional[int] = None
+    db_max_overflow: Optional[int] = None
+    db_pool_timeout: Optional[float] = None
+    db_pool_recycle: Optional[int] = None
+    db_pool_pre_ping: Optional[bool] = None
+    log_level: Optional[str] = None
+    sqlalchemy_replica_urls: str = ''  # comma separated URLs of the read replicas, empty - reads go to the primary
+    replica_sticky_seconds: float = 5.0  # reads of a user go to the primary so long after their write
+    replica_retry_seconds: float = 10.0  # a failed replica is out of the rotation so long
+    replica_health_interval: float = 10.0  # seconds between the health checks of the replicas
     secret_key: str
     algorithm: str
     mail_username: str
@@ -15,8 +54,56 @@ class Settings(BaseSettings):
     redis_host: str = 'localhost'
     redis_password: str
     redis_port: int = 6379
-    limit_crit: int
-    limit_warn: int
+    redis_max_connections: int = 50  # connections of the shared Redis pool of a worker, the commands wait for them
+    redis_pool_timeout: float = 1.0  # seconds a command waits for a free connection of the pool
+    redis_socket_timeout: float = 0.5  # seconds to wait for a Redis reply
+    redis_connect_timeout: float = 1.0  # seconds to wait for a new Redis connection
+    redis_health_check_interval: int = 30  # seconds a connection may stay idle before it is checked (PING) on use
+    redis_breaker_failures: int = 5  # consecutive failed Redis calls which open the circuit (the calls fail fast)
+    redis_breaker_reset: float = 10.0  # seconds the circuit stays open before one call probes Redis again
+    user_cache_ttl: int = 900  # seconds a user resolved by get_current_user stays in the Redis cache
+    user_cache_local_size: int = 10000  # users kept in the in-process cache of a worker
+    user_cache_local_ttl: float = 5.0  # seconds a user stays in the in-process cache of a worker
+    user_cache_channel: str = 'user_cache:invalidate'  # Redis channel of the user cache invalidations
+    user_cache_refresh_ahead: float = 60.0  # scale (seconds) of the early refresh of the hot users, 0 - never
+    user_cache_lock_timeout: float = 2.0  # seconds a worker holds the lock of a user it loads from the database
+    user_cache_lock_wait: float = 0.5  # seconds a miss waits for the user loaded by another worker
+    token_cache_size: int = 10000  # verified tokens whose claims a worker memoizes
+    password_hash_workers: int = 2  # threads of a worker hashing and verifying the passwords
+    password_hash_queue: int = 64  # password checks waiting for a thread, the next ones get 503
+    # bcrypt cost of the new hashes, the weaker hashes are rehashed on login; 0 - calibrate at startup
+    # to password_hash_budget_ms (see python -m src.services.hash_cost)
+    password_hash_rounds: int = 12
+    password_hash_budget_ms: float = 250
+    password_hash_min_rounds: int = 10  # the calibration never goes below this cost
+    refresh_token_ttl: int = 604800  # seconds a refresh token (and its rotation family in Redis) lives, 7 days
+    revocation_sync_interval: float = 5.0  # seconds between the syncs of the revoked tokens into a worker
+    revocation_filter_capacity: int = 100000  # revoked token ids the Bloom filter of a worker is sized for
+    revocation_filter_error_rate: float = 0.001  # false positives of the filter (each costs one Redis round trip)
+    rate_limit_budget: int = 120  # units a user (or an address without a token) may spend per rate_limit_window
+    rate_limit_window: int = 60  # seconds of the sliding window of the rate limit
+    rate_limit_fail_open: bool = True  # admit the requests while Redis is unreachable, False - reject with 503
+    # share of the remaining units of a client a worker admits without Redis, 0 - every request is checked by Redis
+    rate_limit_local_share: float = 0.1
+    rate_limit_local_ttl: float = 5.0  # seconds a local grant of a client is used
+    rate_limit_flush_interval: float = 0.2  # seconds between the charges of the locally admitted requests to Redis
+    # units of the requests of the contacts routes, by the name of the route function (JSON in the environment),
+    # the routes not listed cost 1
+    rate_limit_costs: dict[str, int] = {
+                                        'get_contacts': 2,
+                                        'get_contact': 1,
+                                        'create_contact': 2,
+                                        'update_contact': 2,
+                                        'remove_contact': 2,
+                                        'change_name_contact': 2,
+                                        'search_by_birthday_celebration_within_days': 5,
+                                        'search_by_fields_and': 5,
+                                        'search_by_fields_or': 5,
+                                        'search_by_like_fields_or': 10,
+                                        'search_by_like_fields_and': 10,
+                                        'export_contacts': 20,
+                                        'import_contacts': 20,
+                                        }
     cors_origins: str
     cors_credentials: str
     cors_methods: str
@@ -24,6 +111,12 @@ class Settings(BaseSettings):
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    internal_hosts: str = '127.0.0.1,::1,localhost'  # clients allowed to use the /api/internal endpoints
+    internal_admin_token: str = ''  # X-Admin-Token of the internal write endpoints (revoke-sessions), empty - disabled
+    import_batch_size: int = 1000  # rows of an imported address book inserted by one statement
+    export_partition_size: int = 1000  # rows of an exported address book fetched from the cursor at once
+    batch_max_size: int = 500  # ids in one batch update / delete, must not exceed limit_batch_rows
+    limit_batch_rows: int = 1000  # contacts changed by the batch requests of a client per minute
 
     class Config:
         """Specifies the location of the .env environment file and its utf-8 encoding. This will allow you to read
@@ -32,5 +125,28 @@ class Settings(BaseSettings):
         env_file = ".env"
         env_file_encoding = "utf-8"
 
+    @validator('db_profile')
+    def known_db_profile(cls, value: str) -> str:
+        """Check that the engine profile exists."""
+        if value not in ENGINE_PROFILES:
+            raise ValueError(f'unknown db_profile {value!r}, expected one of: {", ".join(ENGINE_PROFILES)}')
+
+        return value
+
+    @property
+    def engine_profile(self) -> EngineProfile:
+        """The engine profile selected by db_profile with the db_* (and log_level) overrides applied."""
+        overrides = {
+                     'echo': self.db_echo,
+                     'pool_size': self.db_pool_size,
+                     'max_overflow': self.db_max_overflow,
+                     'pool_timeout': self.db_pool_timeout,
+                     'pool_recycle': self.db_pool_recycle,
+                     'pool_pre_ping': self.db_pool_pre_ping,
+                     'log_level': self.log_level,
+                     }
+
+        return ENGINE_PROFILES[self.db_profile].copy(update={k: v for k, v in overrides.items() if v is not None})
+
 
 settings = Settings()
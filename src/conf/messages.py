@@ -6,9 +6,12 @@ INCORRECT_CREDENTIALS = 'Could not validate credentials'  # BuildIn constant: 'C
 INCORRECT_MAIL = 'Invalid email'
 INCORRECT_PASSWORD = 'Invalid password'
 INCORRECT_REFRESH_TOKEN = 'Invalid refresh token'
+MSG_LOGGED_OUT = 'Logged out'
 MSG_PASSWORD_CHENGED = 'User`s password successfully changed.'
 MSG_PASSWORD_RESET = 'Complete password reset'
 MSG_SENT_PASSWORD = 'Password-change email has been sent'
+PASSWORD_HASHING_BUSY = 'Too many password checks at the moment, try again later'
+SERVICE_UNAVAILABLE = 'Service temporarily unavailable, try again later'
 TOKEN_TYPE = 'bearer'
 UNCOMFIRMED_EMAIL = 'Email not confirmed'
 WARNING_ATTENTION_EMAIL = 'Check if the email is entered correctly.'
@@ -1,22 +1,82 @@
 """Connection to DataBase."""
 import logging
-from typing import Optional
+from typing import AsyncGenerator, Optional
 
 from sqlalchemy import create_engine, Engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import Pool, QueuePool
 
 from src.conf.config import settings
+from src.database.pool_monitor import PoolMonitor
+from src.database.replicas import ReplicaRouter
 
 
-logging.basicConfig(level=logging.DEBUG, format='%(threadName)s %(message)s')
+logging.basicConfig(level=settings.engine_profile.log_level, format='%(threadName)s %(message)s')
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
+# async DBAPI driver for each backend: asyncpg for Postgres (production), aiosqlite for SQLite (tests)
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def to_async_url(url: str) -> str:
+    """
+    The to_async_url function converts a synchronous database URL to the same URL with an async driver,
+    e.g. postgresql+psycopg2://... -> postgresql+asyncpg://..., sqlite:///... -> sqlite+aiosqlite:///...
+    Unknown backends are returned unchanged.
+
+    :param url: str: The synchronous database URL (as used by Alembic)
+    :return: The database URL with an async driver
+    """
+    url_ = make_url(url)
+    driver = ASYNC_DRIVERS.get(url_.get_backend_name())
+    if driver is None:
+        return url
+
+    return url_.set(drivername=f'{url_.get_backend_name()}+{driver}').render_as_string(hide_password=False)
+
+
+SQLALCHEMY_ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# statistics of the application (async) connection pool, see /api/internal/db/pool
+pool_monitor = PoolMonitor()
+
+
+def engine_options(url: str, monitor: Optional[PoolMonitor] = None) -> dict:
+    """
+    The engine_options function builds the create_engine keyword arguments from the selected engine profile
+    (settings.db_profile with the db_* overrides).
+    The queue options (pool_size, max_overflow, pool_timeout) are passed only to the pools that accept them,
+    e.g. aiosqlite works without a connection pool (NullPool).
+
+    :param url: str: The database URL the engine is created for
+    :param monitor: Optional[PoolMonitor]: The monitor to report connection checkouts to
+    :return: A dict of keyword arguments for create_engine / create_async_engine
+    """
+    profile = settings.engine_profile
+    url_ = make_url(url)
+    pool_class: type[Pool] = url_.get_dialect().get_pool_class(url_)
+    options = {'echo': profile.echo, 'pool_recycle': profile.pool_recycle, 'pool_pre_ping': profile.pool_pre_ping}
+    if issubclass(pool_class, QueuePool):
+        options.update(
+                       pool_size=profile.pool_size,
+                       max_overflow=profile.max_overflow,
+                       pool_timeout=profile.pool_timeout
+                       )
+
+    if monitor is not None:
+        options['poolclass'] = monitor.instrument(pool_class)
+
+    return options
+
 
 def create_connection(*args, **kwargs) -> tuple[Optional[Engine], Optional[sessionmaker]]:
     """
-    The create_connection function creates a connection to the database.
+    The create_connection function creates a synchronous connection to the database.
+    It is kept only for Alembic migrations and maintenance scripts, the application uses create_async_connection.
         Args:
             `*args` (tuple): A tuple of arguments.
             `**kwargs` (dict): A dictionary of keyword arguments.
@@ -27,9 +87,9 @@ def create_connection(*args, **kwargs) -> tuple[Optional[Engine], Optional[sessi
     :doc-author: Trelent
     """
     try:
-        engine_ = create_engine(SQLALCHEMY_DATABASE_URL, echo=True, pool_size=10)
+        engine_ = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
         db_session = sessionmaker(autocommit=False, autoflush=False, bind=engine_)
-    
+
     except Exception as error:
         logging.error(f'Wrong connect. error:\n{error}')
 
@@ -38,24 +98,61 @@ def create_connection(*args, **kwargs) -> tuple[Optional[Engine], Optional[sessi
     return engine_, db_session
 
 
+def create_async_connection(*args, **kwargs) -> tuple[Optional[AsyncEngine], Optional[async_sessionmaker]]:
+    """
+    The create_async_connection function creates an asynchronous connection to the database,
+    so queries are awaited and do not block the event loop. The pool checkouts are reported to pool_monitor.
+    The sessions do not expire objects on commit: after the commit the attributes are available without
+    an implicit (blocking) reload.
+
+    :param `*args`: Send a non-keyworded variable length argument list to the function
+    :param `**kwargs`: Pass a variable number of keyword arguments to a function
+    :return: A tuple of two values: an async engine and an async session factory
+    """
+    try:
+        engine_ = create_async_engine(
+                                      SQLALCHEMY_ASYNC_DATABASE_URL,
+                                      **engine_options(SQLALCHEMY_ASYNC_DATABASE_URL, pool_monitor)
+                                      )
+        db_session = async_sessionmaker(bind=engine_, autoflush=False, expire_on_commit=False)
+
+    except Exception as error:
+        logging.error(f'Wrong async connect. error:\n{error}')
+
+        return None, None
+
+    return engine_, db_session
+
+
 engine, SessionLocal = create_connection()
+async_engine, AsyncSessionLocal = create_async_connection()
+
+# read-only routes take their sessions from replica_router.session(user_id)
+SQLALCHEMY_REPLICA_URLS = [
+                           to_async_url(url.strip())
+                           for url in settings.sqlalchemy_replica_urls.split(',') if url.strip()
+                           ]
+replica_router = ReplicaRouter(
+                               SQLALCHEMY_REPLICA_URLS,
+                               AsyncSessionLocal,
+                               sticky_seconds=settings.replica_sticky_seconds,
+                               retry_after=settings.replica_retry_seconds,
+                               **(engine_options(SQLALCHEMY_REPLICA_URLS[0]) if SQLALCHEMY_REPLICA_URLS else {})
+                               )
 
 
 Base = declarative_base()
 
 
 # Dependency
-def get_db():
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
-    The get_db function is a context manager that returns the database session.
+    The get_db function is an async generator that returns the database session.
     It also ensures that the connection to the database is closed after each request.
 
-    :return: A database session
+    :return: An async database session
     :doc-author: Trelent
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
 
-    finally:
-        db.close()
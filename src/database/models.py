@@ -1,9 +1,24 @@
-from sqlalchemy import Column, Date, func, Integer, String, Boolean
-from sqlalchemy.orm import relationship
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Column, Computed, Date, func, Index, Integer, String, Boolean, UniqueConstraint
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import DateTime
 
 from src.database.db_connect import Base
+from src.database.search_index import attach_search_index
+
+
+def birthday_ordinal(birthday: Optional[date]) -> Optional[int]:
+    """
+    The birthday_ordinal function returns the month-day of the date as a number MMDD (e.g. 1231 for December 31),
+    so the birthdays sort in the calendar order regardless of the year.
+
+    :param birthday: Optional[date]: The date of birth
+    :return: The month-day ordinal or None
+    """
+    return birthday.month * 100 + birthday.day if birthday else None
 
 
 class Contact(Base):
@@ -12,9 +27,13 @@ class Contact(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(30), index=True)
     last_name = Column(String(40), index=True)
-    email = Column(String(30), unique=True, index=True)
-    phone = Column(Integer, unique=True, index=True)
+    email = Column(String(30))  # unique per user, see __table_args__
+    phone = Column(Integer)  # unique per user, see __table_args__
+    # the phone as text for the substring search (trigram index), computed by the database
+    phone_text = Column(String(20), Computed('CAST(phone AS VARCHAR(20))', persisted=True))
     birthday = Column(Date, index=True, nullable=True)
+    # month-day of the birthday (MMDD), set together with birthday, the upcoming birthdays are its range scans
+    birthday_ordinal = Column(Integer, nullable=True)
     description = Column(String(3000))
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref='users')
@@ -22,6 +41,38 @@ class Contact(Base):
     # backref creates a back reference to the User class, allowing the associated Contact objects
     # to be accessed from the User object
 
+    __table_args__ = (
+                      # a user has no two contacts with the same email, phone or full name,
+                      # create_contact relies on them (INSERT ... ON CONFLICT DO NOTHING)
+                      UniqueConstraint('user_id', 'email', name='uq_contacts_user_id_email'),
+                      UniqueConstraint('user_id', 'phone', name='uq_contacts_user_id_phone'),
+                      UniqueConstraint('user_id', 'name', 'last_name', name='uq_contacts_user_id_name_last_name'),
+                      # serves the keyset pagination: WHERE user_id = ? AND (name, id) > (?, ?) ORDER BY name, id
+                      Index('ix_contacts_user_id_name_id', 'user_id', 'name', 'id'),
+                      # serves the upcoming birthdays: WHERE user_id = ? AND birthday_ordinal BETWEEN ? AND ?
+                      Index('ix_contacts_user_id_birthday_ordinal', 'user_id', 'birthday_ordinal'),
+                      )
+
+    @validates('birthday')
+    def validate_birthday(self, key: str, birthday: Optional[date | str]) -> Optional[date]:
+        """
+        The validate_birthday function keeps birthday_ordinal in sync with every assignment of the birthday.
+        An ISO string (e.g. from jsonable_encoder) is converted to the date.
+
+        :param key: str: The name of the attribute
+        :param birthday: Optional[date | str]: The new date of birth
+        :return: The date of birth
+        """
+        if isinstance(birthday, str):
+            birthday = date.fromisoformat(birthday)
+
+        self.birthday_ordinal = birthday_ordinal(birthday)
+
+        return birthday
+
+
+attach_search_index(Contact.__table__)
+
 
 class User(Base):
     """Base User class."""
@@ -32,5 +83,8 @@ class User(Base):
     password = Column(String(255), nullable=False)  # not 10, because store hash, not password
     created_at = Column('crated_at', DateTime, default=func.now())
     avatar = Column(String(255), nullable=True)
+    # only for the migration: the refresh tokens issued before the rotation families (RefreshTokenStore in Redis)
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)  # whether the user's email was confirmed
+    # kept by the writes of the contacts repository, the total of the unfiltered list without COUNT(*)
+    contacts_count = Column(Integer, nullable=False, default=0, server_default='0')
@@ -0,0 +1,106 @@
+"""Connection pool instrumentation: checkout wait time, latency histogram and live pool gauges."""
+from bisect import bisect_left
+import time
+from typing import Optional
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool, QueuePool
+
+
+class PoolMonitor:
+    """Collects statistics of the connection checkouts of one pool."""
+    # upper bounds (seconds) of the checkout latency histogram buckets, the last bucket is unbounded
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self) -> None:
+        self.pool: Optional[Pool] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        The reset function clears the collected counters (the live gauges of the pool are not affected).
+
+        :return: None
+        """
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        """
+        The observe function registers the time one checkout waited for a connection.
+
+        :param seconds: float: Time between the checkout request and the moment the connection was handed out
+        :return: None
+        """
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.histogram[bisect_left(self.BUCKETS, seconds)] += 1
+
+    def instrument(self, pool_class: type[Pool]) -> type[Pool]:
+        """
+        The instrument function returns a subclass of pool_class which reports every checkout to this monitor.
+        The subclass is passed to create_engine as poolclass, so it survives pool recreation after a dispose.
+
+        :param pool_class: type[Pool]: The pool class the dialect would use by default
+        :return: The instrumented pool class
+        """
+        monitor = self
+
+        class InstrumentedPool(pool_class):
+            """Pool which measures how long each checkout waits for a connection."""
+
+            def __init__(self, *args, **kwargs) -> None:
+                super().__init__(*args, **kwargs)
+                monitor.pool = self
+
+            def connect(self):
+                started = time.perf_counter()
+                try:
+                    return super().connect()
+
+                except PoolTimeoutError:
+                    monitor.timeouts += 1
+                    raise
+
+                finally:
+                    monitor.observe(time.perf_counter() - started)
+
+        InstrumentedPool.__name__ = f'Instrumented{pool_class.__name__}'
+
+        return InstrumentedPool
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function returns the current statistics: the live pool gauges (connections checked out,
+        overflow, idle connections) and the checkout wait time (total, average, max and histogram).
+
+        :return: A dict ready to be returned as JSON
+        """
+        pool = self.pool
+        stats = {
+                 'pool': type(pool).__name__ if pool else None,
+                 'status': pool.status() if pool else None,
+                 'checkouts': self.checkouts,
+                 'timeouts': self.timeouts,
+                 'wait_total_s': round(self.wait_total, 6),
+                 'wait_avg_s': round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+                 'wait_max_s': round(self.wait_max, 6),
+                 'wait_histogram': {
+                                    **{f'le_{bound}': count for bound, count in zip(self.BUCKETS, self.histogram)},
+                                    'le_inf': self.histogram[-1],
+                                    },
+                 }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                         size=pool.size(),
+                         checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(),
+                         overflow=pool.overflow(),
+                         )
+
+        return stats
+
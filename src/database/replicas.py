@@ -0,0 +1,207 @@
+"""Routing of read-only sessions to the read replicas of the database."""
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+
+class Replica:
+    """One read replica: its engine, session factory and health state."""
+
+    def __init__(self, url: str, **engine_options) -> None:
+        self.engine: AsyncEngine = create_async_engine(url, **engine_options)
+        self.session_maker = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.retry_at = 0.0  # monotonic time after which an unhealthy replica is tried again
+        self.failures = 0
+
+    def mark_down(self, retry_after: float) -> None:
+        """
+        The mark_down function takes the replica out of the rotation for retry_after seconds.
+
+        :param retry_after: float: Seconds before the replica is tried again
+        :return: None
+        """
+        self.healthy = False
+        self.failures += 1
+        self.retry_at = time.monotonic() + retry_after
+
+    def mark_up(self) -> None:
+        """
+        The mark_up function returns the replica to the rotation.
+
+        :return: None
+        """
+        self.healthy = True
+        self.retry_at = 0.0
+
+    def available(self) -> bool:
+        """
+        The available function tells whether the replica can serve a session: it is healthy or its retry time
+        has come (the next session checks it).
+
+        :return: True if the replica can be used
+        """
+        return self.healthy or time.monotonic() >= self.retry_at
+
+
+class ReplicaRouter:
+    """
+    Gives read-only sessions bound to the read replicas (round-robin over the healthy ones).
+    Within sticky_seconds after a write of a user the reads of this user go to the primary
+    (read-your-writes), as well as all reads when there is no available replica.
+    The read-your-writes window is kept per worker process.
+    """
+    # errors which mean that the replica (not the query) is broken
+    CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+    def __init__(
+                 self,
+                 urls: list[str],
+                 primary: async_sessionmaker,
+                 sticky_seconds: float = 5.0,
+                 retry_after: float = 10.0,
+                 **engine_options
+                 ) -> None:
+        self.replicas = [Replica(url, **engine_options) for url in urls]
+        self.primary = primary
+        self.sticky_seconds = sticky_seconds
+        self.retry_after = retry_after
+        self._next = 0
+        self._sticky: dict[int, float] = {}  # user id: monotonic time until which the user reads from the primary
+
+    def stick_to_primary(self, user_id: int) -> None:
+        """
+        The stick_to_primary function sends the reads of the user to the primary for the next sticky_seconds,
+        so the user sees their own write even if the replicas lag behind.
+
+        :param user_id: int: The id of the user who has written
+        :return: None
+        """
+        now = time.monotonic()
+        if len(self._sticky) > 10000:
+            self._sticky = {uid: until for uid, until in self._sticky.items() if until > now}
+
+        self._sticky[user_id] = now + self.sticky_seconds
+
+    def is_sticky(self, user_id: Optional[int]) -> bool:
+        """
+        The is_sticky function tells whether the reads of the user must go to the primary.
+
+        :param user_id: Optional[int]: The id of the user who reads
+        :return: True within the read-your-writes window of the user
+        """
+        until = self._sticky.get(user_id)
+        if until is None:
+            return False
+
+        if until <= time.monotonic():
+            self._sticky.pop(user_id, None)
+            return False
+
+        return True
+
+    def pick(self, user_id: Optional[int] = None) -> Optional[Replica]:
+        """
+        The pick function chooses the replica for the next read-only session (round-robin over the available
+        replicas).
+
+        :param user_id: Optional[int]: The id of the user who reads
+        :return: A replica, or None if the read must go to the primary
+        """
+        if not self.replicas or self.is_sticky(user_id):
+            return None
+
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next = (self._next + 1) % len(self.replicas)
+            if replica.available():
+                return replica
+
+        return None
+
+    @asynccontextmanager
+    async def session(self, user_id: Optional[int] = None) -> AsyncIterator[AsyncSession]:
+        """
+        The session function opens a read-only session: on a replica chosen by pick or on the primary.
+        A connection error takes the replica out of the rotation for retry_after seconds.
+
+        :param user_id: Optional[int]: The id of the user who reads
+        :return: An async database session
+        """
+        replica = self.pick(user_id)
+        if replica is None:
+            async with self.primary() as db:
+                yield db
+
+            return
+
+        async with replica.session_maker() as db:
+            try:
+                yield db
+
+            except self.CONNECTION_ERRORS as error:
+                logging.error(f'Replica {replica.engine.url!r} is down. error:\n{error}')
+                replica.mark_down(self.retry_after)
+                raise
+
+        replica.mark_up()
+
+    async def check_health(self, timeout: float = 2.0) -> None:
+        """
+        The check_health function pings every replica (SELECT 1) and updates its health state.
+
+        :param timeout: float: Seconds to wait for the answer of a replica
+        :return: None
+        """
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    await asyncio.wait_for(connection.execute(text('SELECT 1')), timeout)
+
+            except (DBAPIError, OSError, asyncio.TimeoutError) as error:
+                logging.error(f'Replica {replica.engine.url!r} failed the health check. error:\n{error}')
+                replica.mark_down(self.retry_after)
+
+            else:
+                replica.mark_up()
+
+    async def watch(self, interval: float) -> None:
+        """
+        The watch function runs check_health every interval seconds (as a background task of the application).
+
+        :param interval: float: Seconds between the health checks
+        :return: None
+        """
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def status(self) -> list[dict]:
+        """
+        The status function describes the replicas for the internal endpoint.
+
+        :return: A list of dicts with the url (without password), health and failures of every replica
+        """
+        return [
+                {
+                 'url': replica.engine.url.render_as_string(hide_password=True),
+                 'healthy': replica.healthy,
+                 'failures': replica.failures,
+                 }
+                for replica in self.replicas
+                ]
+
+    async def dispose(self) -> None:
+        """
+        The dispose function closes the connection pools of the replicas.
+
+        :return: None
+        """
+        for replica in self.replicas:
+            await replica.engine.dispose()
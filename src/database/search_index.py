@@ -0,0 +1,57 @@
+"""Indexes of the substring search over the contacts: pg_trgm GIN on Postgres, FTS5 (trigram tokenizer) on SQLite."""
+from sqlalchemy import DDL, event, Table
+
+# the indexed expressions must be the ones src.repository.search filters on, otherwise the planner ignores them
+SEARCH_INDEX_DDL = {
+    'postgresql': [
+                   'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+                   'CREATE INDEX IF NOT EXISTS ix_contacts_name_trgm ON contacts '
+                   'USING gin (lower(name) gin_trgm_ops)',
+                   'CREATE INDEX IF NOT EXISTS ix_contacts_last_name_trgm ON contacts '
+                   'USING gin (lower(last_name) gin_trgm_ops)',
+                   'CREATE INDEX IF NOT EXISTS ix_contacts_email_trgm ON contacts '
+                   'USING gin (lower(email) gin_trgm_ops)',
+                   'CREATE INDEX IF NOT EXISTS ix_contacts_phone_text_trgm ON contacts '
+                   'USING gin (phone_text gin_trgm_ops)',
+                   ],
+    # external content table: the text lives in contacts, the triggers keep the index in sync
+    'sqlite': [
+               "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+               "name, last_name, email, phone_text, "
+               "content='contacts', content_rowid='id', tokenize='trigram case_sensitive 0')",
+               'CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN '
+               'INSERT INTO contacts_fts(rowid, name, last_name, email, phone_text) '
+               'VALUES (new.id, new.name, new.last_name, new.email, new.phone_text); '
+               'END',
+               'CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN '
+               "INSERT INTO contacts_fts(contacts_fts, rowid, name, last_name, email, phone_text) "
+               "VALUES ('delete', old.id, old.name, old.last_name, old.email, old.phone_text); "
+               'END',
+               'CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN '
+               "INSERT INTO contacts_fts(contacts_fts, rowid, name, last_name, email, phone_text) "
+               "VALUES ('delete', old.id, old.name, old.last_name, old.email, old.phone_text); "
+               'INSERT INTO contacts_fts(rowid, name, last_name, email, phone_text) '
+               'VALUES (new.id, new.name, new.last_name, new.email, new.phone_text); '
+               'END',
+               ],
+}
+
+# the virtual table is not dropped together with contacts (the triggers are)
+SEARCH_INDEX_DROP_DDL = {'sqlite': ['DROP TABLE IF EXISTS contacts_fts']}
+
+
+def attach_search_index(table: Table) -> None:
+    """
+    The attach_search_index function makes metadata.create_all / drop_all create and drop the search index
+    of the dialect together with the contacts table (the existing databases get it from the migration).
+
+    :param table: Table: The contacts table
+    :return: None
+    """
+    for dialect, statements in SEARCH_INDEX_DDL.items():
+        for statement in statements:
+            event.listen(table, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+    for dialect, statements in SEARCH_INDEX_DROP_DDL.items():
+        for statement in statements:
+            event.listen(table, 'before_drop', DDL(statement).execute_if(dialect=dialect))
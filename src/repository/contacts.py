@@ -1,126 +1,364 @@
 from datetime import date, timedelta
-from typing import Optional
+from typing import AsyncIterator, Optional, Sequence
 
 from fastapi import HTTPException, status
-from fastapi.encoders import jsonable_encoder
-from fastapi_pagination import Page, Params
-from fastapi_pagination.ext.sqlalchemy import paginate
-from sqlalchemy import cast, func, or_, String
-from sqlalchemy.orm import Session
+from fastapi_pagination import Params
+from fastapi_pagination.ext.sqlalchemy import paginate_query
+from sqlalchemy import cast, delete, false, insert, or_, Row, select, Select, String, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import birthday_ordinal, Contact, User
+from src.repository.keyset import paginate_by_cursor
+from src.repository.search import substring_filter
+from src.repository.totals import add_to_counter, counted_total, estimated_total, exact_total
+from src.schemes import (
+                         BatchItemResult,
+                         BatchReport,
+                         BatchStatus,
+                         ContactCursorPage,
+                         ContactModel,
+                         ContactPage,
+                         ContactPartialModel,
+                         CatToNameModel,
+                         ImportReport,
+                         ImportRowResult,
+                         ImportStatus,
+                         TotalMode,
+                         )
+from src.services.contacts_export import EXPORT_FIELDS
+from src.services.contacts_import import ImportRecord
+
+# INSERT ... ON CONFLICT DO NOTHING of the dialects which have it, the others report a duplicate by IntegrityError
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+async def paginate_contacts(
+                            query: Select,
+                            db: AsyncSession,
+                            pagination_params: Params,
+                            cursor: Optional[str] = None,
+                            include_total: TotalMode = TotalMode.exact,
+                            total: Optional[int] = None
+                            ) -> ContactPage | ContactCursorPage:
+    """
+    The paginate_contacts function returns one page of the query: limit-offset by default,
+    or keyset (ordered by name, id) when the cursor is given.
+    The total of a limit-offset page is the given one (e.g. a counter), or computed according to include_total:
+    exact COUNT(*), planner estimate (exact where there are no planner statistics) or none at all.
+
+    :param query: Select: The query of the contacts (already filtered by user)
+    :param db: AsyncSession: Access the database
+    :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
+    :param cursor: Optional[str]: None - limit-offset mode, '' - first page in keyset mode, else next_cursor
+    :param include_total: TotalMode: How to compute the total of a limit-offset page
+    :param total: Optional[int]: The known total, nothing is computed then
+    :return: ContactPage | ContactCursorPage: A page object
+    """
+    if cursor is not None:
+        return await paginate_by_cursor(db, query, cursor, pagination_params.size)
+
+    is_estimate = False
+    if total is None and include_total == TotalMode.estimate:
+        total = await estimated_total(db, query)
+        is_estimate = total is not None
 
-from src.database.models import Contact, User
-from src.schemes import ContactModel, CatToNameModel
+    if total is None and include_total != TotalMode.false:
+        total = await exact_total(db, query)
+
+    items = (await db.execute(paginate_query(query, pagination_params))).scalars().all()
+
+    return ContactPage.create(items, pagination_params, total=total, total_is_estimate=is_estimate)
 
 
 async def get_contacts(
                        user: User, 
-                       db: Session,  # pagination_params: Page
-                       pagination_params: Params
-                       ) -> Page:
+                       db: AsyncSession,  # pagination_params: Page
+                       pagination_params: Params,
+                       cursor: Optional[str] = None,
+                       include_total: TotalMode = TotalMode.exact
+                       ) -> ContactPage | ContactCursorPage:
     """
     The get_contacts function returns a paginated list of contacts for the user.
+    The total of the unfiltered list is read from the counter of the user (users.contacts_count), not counted.
 
     :param user: User: Identify the user who is making the request
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
-    :return: Page: A page object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: TotalMode.false - the page without the total
+    :return: ContactPage | ContactCursorPage: A page object
+    """
+    total = None
+    if cursor is None and include_total != TotalMode.false:
+        total = await counted_total(db, user.id)
+
+    return await paginate_contacts(
+                                   select(Contact)
+                                   .filter(Contact.user_id == user.id)
+                                   .order_by(Contact.name),
+                                   db,
+                                   pagination_params,
+                                   cursor,
+                                   include_total,
+                                   total
+                                   )
+
+
+async def stream_contacts(
+                          user: User,
+                          db: AsyncSession,
+                          partition_size: int = 1000
+                          ) -> AsyncIterator[Sequence[Row]]:
+    """
+    The stream_contacts function reads all the contacts of the user (ordered by id) from a server-side cursor,
+    partition by partition, as plain rows of the columns of EXPORT_FIELDS (no ORM objects),
+    so the memory does not depend on the number of the contacts.
+
+    :param user: User: The user whose contacts are read
+    :param db: AsyncSession: Access the database
+    :param partition_size: int: The number of rows fetched from the cursor at once
+    :return: The partitions of the rows
     """
-    return paginate(
-                    query=db.query(Contact)
-                    .filter(Contact.user_id == user.id)
-                    .order_by(Contact.name),
-                    params=pagination_params
-                    )
+    result = await db.stream(
+                             select(*(getattr(Contact, field) for field in EXPORT_FIELDS))
+                             .filter(Contact.user_id == user.id)
+                             .order_by(Contact.id)
+                             .execution_options(yield_per=partition_size)
+                             )
+    async for rows in result.partitions():
+        yield rows
 
 
 async def get_contact(
                       contact_id: int, 
                       user: User,
-                      db: Session
+                      db: AsyncSession
                       ) -> Optional[Contact]:
     """
     The get_contact function returns a contact from the database.
 
     :param contact_id: int: Specify the id of the contact to be returned
     :param user: User: Get the user_id from the user object
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A single contact
     :doc-author: Trelent
     """
-    return (
-            db.query(Contact)
-            .filter(Contact.user_id == user.id)
-            .filter_by(id=contact_id)
-            .first()
-            )
+    return await db.scalar(
+                           select(Contact)
+                           .filter(Contact.user_id == user.id)
+                           .filter_by(id=contact_id)
+                           )
 
 
 async def create_contact(
                          body: ContactModel, 
                          user: User,
-                         db: Session
+                         db: AsyncSession
                          ) -> Contact:
     """
-    The create_contact function creates a new contact in the database.
+    The create_contact function creates a new contact in the database with one INSERT ... RETURNING statement,
+    the duplicates (same email, phone or full name of the user) are rejected by the unique constraints.
         Args:
             body (ContactModel): The contact to create.
             user (User): The current user, who is creating the contact.
 
     :param body: ContactModel: Validate the data sent by the user
     :param user: User: Get the user id from the token
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = (db.query(Contact).filter(Contact.user_id == user.id).filter_by(email=body.email).first() or
-               db.query(Contact).filter(Contact.user_id == user.id).filter_by(phone=body.phone).first() or
-               db.query(Contact).filter(Contact.user_id == user.id).filter_by(name=body.name, 
-                                                                              last_name=body.last_name).first())
-    if contact:
+    values = {**body.dict(), 'user_id': user.id, 'birthday_ordinal': birthday_ordinal(body.birthday)}
+    insert_ = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert_ is not None:
+        # a duplicate is skipped by the per-user unique constraints and returns no row
+        statement = insert_(Contact).values(**values).on_conflict_do_nothing()
+    else:
+        statement = insert(Contact).values(**values)
+
+    try:
+        contact = await db.scalar(statement.returning(Contact))
+
+    except IntegrityError:
+        await db.rollback()
+        contact = None
+
+    if contact is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Duplicate data')
-    
-    contact = Contact(**body.dict(), user_id=user.id)  # , user_id=user.id  or , user=user
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+
+    await add_to_counter(db, user.id, 1)
+    await db.commit()
 
     return contact
 
 
+def contact_keys(body: ContactModel) -> tuple[tuple, ...]:
+    """
+    The contact_keys function returns the values which must be unique among the contacts of one user
+    (the same as the per-user unique constraints): the email, the phone and the full name.
+
+    :param body: ContactModel: The contact
+    :return: A tuple of the keys
+    """
+    return ('email', body.email), ('phone', body.phone), ('name', body.name, body.last_name)
+
+
+async def insert_contacts(
+                          records: list[ImportRecord],
+                          user: User,
+                          db: AsyncSession,
+                          seen: set[tuple]
+                          ) -> list[ImportRowResult]:
+    """
+    The insert_contacts function inserts one batch of the imported contacts with one executemany
+    INSERT ... ON CONFLICT DO NOTHING RETURNING statement and commits it.
+    A row which repeats a key (see contact_keys) of an earlier row of the same import is a duplicate without
+    going to the database, so every inserted row is identified by its email in the RETURNING rows.
+
+    :param records: list[ImportRecord]: The parsed rows of the batch
+    :param user: User: The user who imports the contacts
+    :param db: AsyncSession: Access the database
+    :param seen: set[tuple]: The keys of the earlier rows of the import, the keys of this batch are added
+    :return: The outcome of every row of the batch
+    """
+    results: dict[int, ImportRowResult] = {}
+    pending: dict[str, int] = {}  # email: row number
+    values = []
+    for row, body, error in records:
+        if body is None:
+            results[row] = ImportRowResult(row=row, status=ImportStatus.invalid, error=error)
+            continue
+
+        keys = contact_keys(body)
+        if seen.intersection(keys):
+            results[row] = ImportRowResult(row=row, status=ImportStatus.duplicate)
+            continue
+
+        seen.update(keys)
+        pending[body.email] = row
+        values.append({**body.dict(), 'user_id': user.id, 'birthday_ordinal': birthday_ordinal(body.birthday)})
+
+    if values:
+        created = await insert_contact_rows(values, db)
+        for email, row in pending.items():
+            if email in created:
+                results[row] = ImportRowResult(row=row, status=ImportStatus.created, id=created[email])
+            else:
+                results[row] = ImportRowResult(row=row, status=ImportStatus.duplicate)
+
+        await add_to_counter(db, user.id, len(created))
+        await db.commit()
+
+    return [results[row] for row, _, _ in records]
+
+
+async def insert_contact_rows(values: list[dict], db: AsyncSession) -> dict[str, int]:
+    """
+    The insert_contact_rows function inserts the rows skipping the ones which violate the unique constraints.
+    The dialects without ON CONFLICT insert the rows one by one, each in its own savepoint.
+
+    :param values: list[dict]: The column values of the rows
+    :param db: AsyncSession: Access the database
+    :return: The ids of the inserted rows by their email
+    """
+    insert_ = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert_ is not None:
+        # a Core insert: the ORM bulk insert requires one RETURNING row per parameter set, ON CONFLICT skips rows
+        statement = insert_(Contact.__table__).on_conflict_do_nothing().returning(Contact.email, Contact.id)
+        return {email: id_ for email, id_ in (await db.execute(statement, values)).all()}
+
+    created = {}
+    for value in values:
+        try:
+            async with db.begin_nested():
+                created[value['email']] = await db.scalar(insert(Contact).values(**value).returning(Contact.id))
+
+        except IntegrityError:
+            continue
+
+    return created
+
+
+async def import_contacts(
+                          records: AsyncIterator[ImportRecord],
+                          user: User,
+                          db: AsyncSession,
+                          batch_size: int = 1000
+                          ) -> ImportReport:
+    """
+    The import_contacts function imports the parsed rows of an address book in batches of batch_size rows,
+    every batch is one INSERT statement and one commit (the committed batches stay if a later one fails).
+
+    :param records: AsyncIterator[ImportRecord]: The parsed rows, see src.services.contacts_import.parse_contacts
+    :param user: User: The user who imports the contacts
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: The number of rows inserted by one statement
+    :return: ImportReport: The counts and the outcome of every row
+    """
+    report = ImportReport()
+    seen: set[tuple] = set()
+    batch: list[ImportRecord] = []
+
+    async def flush() -> None:
+        report.rows.extend(await insert_contacts(batch, user, db, seen))
+        batch.clear()
+
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+
+    for result in report.rows:
+        if result.status == ImportStatus.created:
+            report.created += 1
+        elif result.status == ImportStatus.duplicate:
+            report.duplicates += 1
+        else:
+            report.invalid += 1
+
+    return report
+
+
 async def update_contact(
                          contact_id: int,
                          body: ContactModel,
                          user: User,
-                         db: Session
+                         db: AsyncSession
                          ) -> Optional[Contact]:
     """
-    Update a specific record by its ID. Takes the ContactModel object and updates the information from it
-    by the name of the record. If the record does not exist - None is returned.
+    Update a specific record by its ID with one UPDATE ... RETURNING statement (no SELECT before and no reload
+    after the commit). Every field of the ContactModel is replaced, the fields not sent by the client take their
+    defaults (PUT). If the record does not exist - None is returned.
 
     :param contact_id: int: Contact ID
     :param body: ContactModel: Validate the data sent by the user
     :param user: User: Get the user id from the token
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A contact object
     """
-    contact: Contact = db.query(Contact).filter(Contact.user_id == user.id).filter_by(id=contact_id).first()
-    # contact: Contact = db.query(Contact).filter(Contact.user_id == user.id).filter(Contact.id == contact_id).first()
-
-    db_obj_data = contact.__dict__ if contact else None
-    # db_obj_data = jsonable_encoder(contact) if contact else None
-    
-    body_data = jsonable_encoder(body) if body else None
-    
-    if not db_obj_data or not body_data:
+    if not body:
         return None
 
-    for field in db_obj_data:
-        if field in body_data:
-            setattr(contact, field, body_data[field])
-            
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    values = body.dict()
+    values['birthday_ordinal'] = birthday_ordinal(values['birthday'])
+
+    try:
+        contact = await db.scalar(
+                                  update(Contact)
+                                  .filter(Contact.user_id == user.id, Contact.id == contact_id)
+                                  .values(**values)
+                                  .returning(Contact)
+                                  )
+        await db.commit()
+
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Duplicate data')
 
     return contact
 
@@ -128,10 +366,10 @@ async def update_contact(
 async def remove_contact(
                          contact_id: int,
                          user: User,
-                         db: Session
+                         db: AsyncSession
                          ) -> Optional[Contact]:
     """
-    The remove_contact function removes a contact from the database.
+    The remove_contact function removes a contact from the database with one DELETE ... RETURNING statement.
         Args:
             contact_id (int): The id of the contact to be removed.
             user (User): The user who is removing the contact. This is used to ensure that only contacts belonging
@@ -139,40 +377,132 @@ async def remove_contact(
 
     :param contact_id: int: Identify the contact to be removed
     :param user: User: Get the user_id from the database
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact that was removed
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(Contact.user_id == user.id).filter_by(id=contact_id).first()
+    contact = await db.scalar(
+                              delete(Contact)
+                              .filter(Contact.user_id == user.id, Contact.id == contact_id)
+                              .returning(Contact)
+                              )
     if contact:
-        db.delete(contact)
-        db.commit()
+        await add_to_counter(db, user.id, -1)
+        await db.commit()
 
     return contact
 
 
+async def update_contacts(
+                          ids: list[int],
+                          changes: ContactPartialModel,
+                          user: User,
+                          db: AsyncSession
+                          ) -> BatchReport:
+    """
+    The update_contacts function applies the same changes to the contacts of the user with the given ids
+    by one UPDATE ... WHERE user_id = ? AND id IN (...) RETURNING id statement.
+    A change which breaks the uniqueness of the contacts (e.g. one email for two contacts) rolls back the whole batch.
+
+    :param ids: list[int]: The ids of the contacts
+    :param changes: ContactPartialModel: The fields to change, the None fields are left as they are
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: BatchReport: The number of the updated contacts and the outcome of every id
+    """
+    values = changes.dict(exclude_none=True)
+    if 'birthday' in values:
+        values['birthday_ordinal'] = birthday_ordinal(values['birthday'])
+
+    try:
+        updated = (await db.scalars(
+                                    update(Contact)
+                                    .filter(Contact.user_id == user.id, Contact.id.in_(ids))
+                                    .values(**values)
+                                    .returning(Contact.id)
+                                    .execution_options(synchronize_session=False)
+                                    )).all()
+        await db.commit()
+
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Duplicate data')
+
+    return batch_report(ids, set(updated), BatchStatus.updated)
+
+
+async def remove_contacts(ids: list[int], user: User, db: AsyncSession) -> BatchReport:
+    """
+    The remove_contacts function removes the contacts of the user with the given ids
+    by one DELETE ... WHERE user_id = ? AND id IN (...) RETURNING id statement.
+
+    :param ids: list[int]: The ids of the contacts
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: BatchReport: The number of the removed contacts and the outcome of every id
+    """
+    deleted = (await db.scalars(
+                                delete(Contact)
+                                .filter(Contact.user_id == user.id, Contact.id.in_(ids))
+                                .returning(Contact.id)
+                                .execution_options(synchronize_session=False)
+                                )).all()
+    if deleted:
+        await add_to_counter(db, user.id, -len(deleted))
+    await db.commit()
+
+    return batch_report(ids, set(deleted), BatchStatus.deleted)
+
+
+def batch_report(ids: list[int], affected: set[int], done: BatchStatus) -> BatchReport:
+    """
+    The batch_report function describes the outcome of every id of the batch (in the order of the request,
+    without the repeated ids).
+
+    :param ids: list[int]: The ids of the request
+    :param affected: set[int]: The ids returned by the statement
+    :param done: BatchStatus: The status of the affected ids
+    :return: BatchReport: The report of the batch
+    """
+    results = [
+               BatchItemResult(id=id_, status=done if id_ in affected else BatchStatus.not_found)
+               for id_ in dict.fromkeys(ids)
+               ]
+
+    return BatchReport(affected=len(affected), not_found=len(results) - len(affected), results=results)
+
+
 async def change_name_contact(
                               body: CatToNameModel,
                               contact_id: int,
                               user: User,
-                              db: Session
+                              db: AsyncSession
                               ) -> Optional[Contact]:
     """
     The change_name_contact function takes in a CatToNameModel, contact_id, user and db.
-    It then queries the database for the contact with that id and changes its name to what is passed in.
+    It then changes the name of the contact with that id to what is passed in (one UPDATE ... RETURNING statement).
 
 
     :param body: CatToNameModel: Get the name from the request body
     :param contact_id: int: Identify which contact to change the name of
     :param user: User: Get the user_id of the contact
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The contact object with the updated name
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(Contact.user_id == user.id).filter_by(id=contact_id).first()
-    if contact:
-        contact.name = body.name
-        db.commit()
+    try:
+        contact = await db.scalar(
+                                  update(Contact)
+                                  .filter(Contact.user_id == user.id, Contact.id == contact_id)
+                                  .values(name=body.name)
+                                  .returning(Contact)
+                                  )
+        if contact:
+            await db.commit()
+
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Duplicate data')
 
     return contact
 
@@ -184,7 +514,7 @@ async def search_by_fields_and(
                                email: str | None,
                                phone: int | None,
                                user: User,
-                               db: Session
+                               db: AsyncSession
                                ) -> Optional[Contact]:
     """
     The search_by_fields_and function searches for a contact by name, last_name, email and phone.
@@ -199,14 +529,14 @@ async def search_by_fields_and(
     :param email: str | None: Search for a contact by email
     :param phone: int | None: Check if the phone number is an integer or none
     :param user: User: Check if the user is logged in
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The first result of the query
     :doc-author: Trelent
     """
     if not name and not last_name and not email and not phone:
         return None
 
-    result = db.query(Contact).filter(Contact.user_id == user.id)
+    result = select(Contact).filter(Contact.user_id == user.id)
     if name:
         result = result.filter_by(name=name)
     if last_name:
@@ -216,39 +546,46 @@ async def search_by_fields_and(
     if phone:
         result = result.filter_by(phone=phone)
 
-    return result.first()
+    return await db.scalar(result)
 
 
 # -=- OR ----------------------------------------------------------------
 async def search_by_fields_or(
                               query_str: str,
                               user: User,
-                              db: Session,
-                              pagination_params: Params
-                              ) -> Page:
+                              db: AsyncSession,
+                              pagination_params: Params,
+                              cursor: Optional[str] = None,
+                              include_total: TotalMode = TotalMode.exact
+                              ) -> ContactPage | ContactCursorPage:
     """
     The search_by_fields_or function searches for contacts by name, last_name, email or phone.
         It returns a list of contacts that match the search criteria.
 
     :param query_str: str: Search for a contact by name, last_name, email or phone
     :param user: User: Filter the contacts by user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
-    :return: Page: A page object with the results of the query
-    """
-    return paginate(
-                    db.query(Contact)
-                    .filter(Contact.user_id == user.id)
-                    .filter(
-                            or_(
-                                Contact.name == query_str, 
-                                Contact.last_name == query_str,
-                                Contact.email == query_str,
-                                cast(Contact.phone, String) == query_str   # !?,
-                                )
-                            ),
-                    params=pagination_params
-                    )
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total: exact, estimate or false (no total)
+    :return: ContactPage | ContactCursorPage: A page object with the results of the query
+    """
+    return await paginate_contacts(
+                                   select(Contact)
+                                   .filter(Contact.user_id == user.id)
+                                   .filter(
+                                           or_(
+                                               Contact.name == query_str, 
+                                               Contact.last_name == query_str,
+                                               Contact.email == query_str,
+                                               cast(Contact.phone, String) == query_str   # !?,
+                                               )
+                                           ),
+                                   db,
+                                   pagination_params,
+                                   cursor,
+                                   include_total
+                                   )
 
 
 # https://stackoverflow.com/questions/7942547/using-or-in-sqlalchemy
@@ -256,32 +593,42 @@ async def search_by_fields_or(
 async def search_by_like_fields_or(
                                    query_str: str,
                                    user: User,
-                                   db: Session,
-                                   pagination_params: Params
-                                   ) -> Page:
+                                   db: AsyncSession,
+                                   pagination_params: Params,
+                                   cursor: Optional[str] = None,
+                                   include_total: TotalMode = TotalMode.exact
+                                   ) -> ContactPage | ContactCursorPage:
     """
     The search_by_like_fields_or function searches for contacts by name, last_name, email or phone.
     It returns a list of contacts that match the search criteria.
 
     :param query_str: str: Filter the results by a string
     :param user: User: Get the user id from the token
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
-    :return: Page: A page of contacts that match the search criteria
-    """
-    return paginate(
-                    db.query(Contact)
-                    .filter(Contact.user_id == user.id)
-                    .filter(
-                            or_(
-                                Contact.name.icontains(query_str), 
-                                Contact.last_name.icontains(query_str),
-                                Contact.email.icontains(query_str),
-                                cast(Contact.phone, String).icontains(str(query_str))
-                                )
-                            ),
-                    params=pagination_params
-                    )
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total: exact, estimate or false (no total)
+    :return: ContactPage | ContactCursorPage: A page of contacts that match the search criteria
+    """
+    return await paginate_contacts(
+                                   select(Contact)
+                                   .filter(Contact.user_id == user.id)
+                                   .filter(
+                                           substring_filter(
+                                                            db.get_bind().dialect.name,
+                                                            {
+                                                             'name': query_str,
+                                                             'last_name': query_str,
+                                                             'email': query_str,
+                                                             'phone': query_str,
+                                                             }
+                                                            )
+                                           ),
+                                   db,
+                                   pagination_params,
+                                   cursor,
+                                   include_total
+                                   )
 
 
 # -like- AND-------------------------------------------------------
@@ -291,9 +638,11 @@ async def search_by_like_fields_and(
                                     part_email: str | None,
                                     part_phone: int | None,
                                     user: User,
-                                    db: Session,
-                                    pagination_params: Params
-                                    ) -> Page:
+                                    db: AsyncSession,
+                                    pagination_params: Params,
+                                    cursor: Optional[str] = None,
+                                    include_total: TotalMode = TotalMode.exact
+                                    ) -> ContactPage | ContactCursorPage:
     """
     The search_by_like_fields_and function searches for contacts by the given fields.
         The search is case insensitive and will return all contacts that match any of the given fields.
@@ -304,53 +653,83 @@ async def search_by_like_fields_and(
     :param part_email: str | None: Search for a part of the email
     :param part_phone: int | None: Search by phone number
     :param user: User: Check if the user is logged in
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
-    :return: Page: A page object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total: exact, estimate or false (no total)
+    :return: ContactPage | ContactCursorPage: A page object
     """
     if not part_name and not part_last_name and not part_email and not part_phone:
         return None
 
-    result = db.query(Contact).filter(Contact.user_id == user.id)
+    values = {}
     if part_name:
-        result = result.filter(Contact.name.icontains(part_name))
+        values['name'] = part_name
     if part_last_name:
-        result = result.filter(Contact.last_name.icontains(part_last_name))
+        values['last_name'] = part_last_name
     if part_email:
-        result = result.filter(Contact.email.icontains(part_email))
+        values['email'] = part_email
     if part_phone:
-        result = result.filter(cast(Contact.phone, String).icontains(str(part_phone)))
-    
-    return paginate(result, params=pagination_params)
+        values['phone'] = str(part_phone)
+
+    result = (
+              select(Contact)
+              .filter(Contact.user_id == user.id)
+              .filter(substring_filter(db.get_bind().dialect.name, values, match_all=True))
+              )
+
+    return await paginate_contacts(result, db, pagination_params, cursor, include_total)
 
 
 # ------- search_by_birthday... --------------------------------------------
+def birthday_ranges(today: date, meantime: int) -> list[tuple[int, int]]:
+    """
+    The birthday_ranges function returns the ranges of the month-day ordinals (see birthday_ordinal) of the birthdays
+    celebrated from today to today + meantime days inclusive: one range, or two when the window crosses the year end.
+
+    :param today: date: The first day of the window
+    :param meantime: int: The number of days in the window after today
+    :return: A list of (low, high) inclusive ranges, empty if meantime is negative
+    """
+    if meantime < 0:
+        return []
+
+    if meantime >= 365:
+        return [(101, 1231)]
+
+    low, high = birthday_ordinal(today), birthday_ordinal(today + timedelta(meantime))
+    if low <= high:
+        return [(low, high)]
+
+    return [(low, 1231), (101, high)]
+
+
 async def search_by_birthday_celebration_within_days(
                                                      meantime: int,   
                                                      user: User,
-                                                     db: Session,
-                                                     pagination_params: Params
-                                                     ) -> Page:
+                                                     db: AsyncSession,
+                                                     pagination_params: Params,
+                                                     cursor: Optional[str] = None,
+                                                     include_total: TotalMode = TotalMode.exact
+                                                     ) -> ContactPage | ContactCursorPage:
     """
     The search_by_birthday_celebration_within_days function searches for contacts whose birthday is within a given
-    number of days.
+    number of days: one or (across the year end) two range scans of the (user_id, birthday_ordinal) index.
 
     :param meantime: int: Get the number of days in which we want to search for birthdays
     :param user: User: Get the user_id from the user object
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
-    :return: Page: A paginated list of contacts with birthdays within the given number of days
-    """
-    today = date.today()
-    days_limit = date.today() + timedelta(meantime)
-    slide = 1 if days_limit.year - today.year else 0
-
-    return paginate(
-                    db.query(Contact)
-                    .filter(Contact.user_id == user.id)
-                    .filter(
-                            func.to_char(Contact.birthday, f'{slide}MM-DD') >= today.strftime(f'0%m-%d'),
-                            func.to_char(Contact.birthday, '0MM-DD') <= days_limit.strftime(f'{slide}%m-%d')
-                            ),
-                    params=pagination_params
-                    )
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total: exact, estimate or false (no total)
+    :return: ContactPage | ContactCursorPage: A paginated list of contacts with birthdays within the given days
+    """
+    ranges = birthday_ranges(date.today(), meantime)
+
+    result = (
+              select(Contact)
+              .filter(Contact.user_id == user.id)
+              .filter(or_(false(), *(Contact.birthday_ordinal.between(low, high) for low, high in ranges)))
+              )
+
+    return await paginate_contacts(result, db, pagination_params, cursor, include_total)
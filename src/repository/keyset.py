@@ -0,0 +1,63 @@
+"""Keyset (cursor) pagination of the contact lists."""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Contact
+from src.schemes import ContactCursorPage
+
+
+def encode_cursor(name: str, contact_id: int) -> str:
+    """
+    The encode_cursor function packs the sort key (name, id) of the last contact of a page into an opaque cursor.
+
+    :param name: str: The name of the last contact of the page
+    :param contact_id: int: The id of the last contact of the page
+    :return: The cursor (URL-safe base64 without padding)
+    """
+    return urlsafe_b64encode(json.dumps([name, contact_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """
+    The decode_cursor function unpacks the cursor made by encode_cursor.
+
+    :param cursor: str: The cursor from the request
+    :return: The sort key (name, id) after which the next page starts
+    """
+    try:
+        name, contact_id = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(name, str) or not isinstance(contact_id, int):
+            raise ValueError(cursor)
+
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+    return name, contact_id
+
+
+async def paginate_by_cursor(db: AsyncSession, query: Select, cursor: str, size: int) -> ContactCursorPage:
+    """
+    The paginate_by_cursor function returns the page of contacts that follows the cursor, ordered by (name, id).
+    Unlike the limit-offset pagination it runs neither COUNT nor OFFSET: the page starts with a range condition
+    served by the (user_id, name, id) index, so page N costs the same as page 1.
+
+    :param db: AsyncSession: Access the database
+    :param query: Select: The query of the contacts (already filtered by user)
+    :param cursor: str: The next_cursor of the previous page, an empty string - the first page
+    :param size: int: Number of contacts on the page
+    :return: ContactCursorPage: The contacts of the page and the cursor of the next page
+    """
+    query = query.order_by(None).order_by(Contact.name, Contact.id)
+    if cursor:
+        query = query.filter(tuple_(Contact.name, Contact.id) > tuple_(*decode_cursor(cursor)))
+
+    # one extra row tells whether there is a next page
+    contacts = (await db.scalars(query.limit(size + 1))).all()
+    next_cursor = encode_cursor(contacts[size - 1].name, contacts[size - 1].id) if len(contacts) > size else None
+
+    return ContactCursorPage(items=contacts[:size], size=size, next_cursor=next_cursor)
@@ -0,0 +1,73 @@
+"""Index-backed substring search over the contacts (see src.database.search_index)."""
+from typing import Callable
+
+from sqlalchemy import and_, column, func, literal_column, or_, select, table
+from sqlalchemy.sql.elements import ColumnElement
+
+from src.database.models import Contact
+
+# the expressions the pg_trgm GIN indexes are built on
+TRIGRAM_EXPRESSIONS = {
+                       'name': func.lower(Contact.name),
+                       'last_name': func.lower(Contact.last_name),
+                       'email': func.lower(Contact.email),
+                       'phone': Contact.phone_text,
+                       }
+# the columns of the FTS5 index of SQLite
+FTS_COLUMNS = {'name': 'name', 'last_name': 'last_name', 'email': 'email', 'phone': 'phone_text'}
+# the trigram tokenizer matches only the strings of at least 3 characters
+FTS_MIN_LENGTH = 3
+
+contacts_fts = table('contacts_fts', column('rowid'))
+
+
+def like_pattern(value: str) -> str:
+    """
+    The like_pattern function builds the LIKE pattern "contains value" (lower case, with the wildcards escaped).
+
+    :param value: str: The substring to search for
+    :return: The pattern for LIKE ... ESCAPE '\\'
+    """
+    escaped = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    return f'%{escaped}%'
+
+
+def fts_phrase(value: str) -> str:
+    """
+    The fts_phrase function quotes the value as an FTS5 string, so its characters are not read as the query syntax.
+
+    :param value: str: The substring to search for
+    :return: The FTS5 string
+    """
+    return '"' + value.replace('"', '""') + '"'
+
+
+def substring_filter(dialect_name: str, values: dict[str, str], match_all: bool = False) -> ColumnElement:
+    """
+    The substring_filter function builds the condition "the field contains the value" for every given field,
+    joined with OR (or with AND if match_all), in the form the index of the dialect serves:
+    on SQLite one MATCH of the FTS5 table (while all the values are long enough for the trigrams),
+    elsewhere lower(field) LIKE '%value%' which the pg_trgm GIN indexes of Postgres serve.
+
+    :param dialect_name: str: The name of the database dialect of the session
+    :param values: dict[str, str]: The substrings by the field (name, last_name, email, phone)
+    :param match_all: bool: True - all the fields must match, False - any of them
+    :return: The condition for the WHERE clause of a contacts query
+    """
+    if dialect_name == 'sqlite' and all(len(value) >= FTS_MIN_LENGTH for value in values.values()):
+        expression = (' AND ' if match_all else ' OR ').join(
+                                                              f'{FTS_COLUMNS[field]} : {fts_phrase(value)}'
+                                                              for field, value in values.items()
+                                                              )
+        return Contact.id.in_(
+                              select(contacts_fts.c.rowid)
+                              .where(literal_column('contacts_fts').op('MATCH')(expression))
+                              )
+
+    conjunction: Callable[..., ColumnElement] = and_ if match_all else or_
+
+    return conjunction(
+                       *(TRIGRAM_EXPRESSIONS[field].like(like_pattern(value), escape='\\')
+                         for field, value in values.items())
+                       )
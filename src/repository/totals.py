@@ -0,0 +1,72 @@
+"""Totals of the paginated contact lists: exact COUNT(*), planner estimate and the per-user counter."""
+import json
+from typing import Optional
+
+from sqlalchemy import func, select, Select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+
+
+async def exact_total(db: AsyncSession, query: Select) -> int:
+    """
+    The exact_total function counts the rows of the query with SELECT count(*).
+
+    :param db: AsyncSession: Access the database
+    :param query: Select: The query of the contacts
+    :return: The number of rows
+    """
+    return (await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))).scalar_one()
+
+
+async def estimated_total(db: AsyncSession, query: Select) -> Optional[int]:
+    """
+    The estimated_total function returns the number of rows of the query as estimated by the Postgres planner
+    (EXPLAIN, the query itself is not run), so it costs about as much as planning the query.
+    Other databases have no such statistics: None is returned there.
+
+    :param db: AsyncSession: Access the database
+    :param query: Select: The query of the contacts
+    :return: The estimated number of rows or None
+    """
+    dialect = db.get_bind().dialect
+    if dialect.name != 'postgresql':
+        return None
+
+    # EXPLAIN takes no bind parameters, the values are rendered (escaped) by the dialect
+    sql = query.order_by(None).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+    plan = (await db.execute(text(f'EXPLAIN (FORMAT JSON) {sql}'))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+async def counted_total(db: AsyncSession, user_id: int) -> int:
+    """
+    The counted_total function returns the number of contacts of the user from the users.contacts_count counter
+    (one primary key lookup instead of COUNT(*) over the contacts).
+
+    :param db: AsyncSession: Access the database
+    :param user_id: int: The id of the user
+    :return: The number of contacts of the user
+    """
+    return await db.scalar(select(User.contacts_count).filter(User.id == user_id)) or 0
+
+
+async def add_to_counter(db: AsyncSession, user_id: int, delta: int) -> None:
+    """
+    The add_to_counter function changes the users.contacts_count counter in the current transaction,
+    it must be called by every write which creates or removes contacts.
+
+    :param db: AsyncSession: Access the database
+    :param user_id: int: The id of the user
+    :param delta: int: Number of created (positive) or removed (negative) contacts
+    :return: None
+    """
+    await db.execute(
+                     update(User)
+                     .filter(User.id == user_id)
+                     .values(contacts_count=User.contacts_count + delta)
+                     .execution_options(synchronize_session=False)
+                     )
@@ -1,30 +1,51 @@
+import logging
+
 from libgravatar import Gravatar  # poetry add libgravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemes import UserModel
+from src.services.circuit_breaker import REDIS_ERRORS
+from src.services.user_cache import user_cache
+
+
+async def invalidate_user(email: str) -> None:
+    """
+    The invalidate_user function drops the cached user after a committed change of the user.
+    The change is already in the database, so a Redis failure (or the open circuit) does not fail the request:
+    it is logged, the local entry is dropped anyway and the Redis entry expires after user_cache_ttl seconds.
+
+    :param email: str: The email of the changed user
+    :return: None
+    """
+    try:
+        await user_cache.invalidate(email)  # through the breaker of the cache
 
+    except REDIS_ERRORS as error:
+        logging.warning(f'Cached user is not invalidated. error:\n{error}')
 
-async def get_user_by_email(email: str, db: Session) -> User:
+
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists,
     it will return None.
 
     :param email: str: Get the email of the user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     :doc-author: Trelent
     """
-    return db.query(User).filter(User.email == email).first()
+    return await db.scalar(select(User).filter(User.email == email))
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     The create_user function creates a new user in the database.
 
     :param body: UserModel: Pass in the user data from the request body
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A user object
     :doc-author: Trelent
     """
@@ -36,73 +57,77 @@ async def create_user(body: UserModel, db: Session) -> User:
         print(e)
     new_user = User(**body.dict(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 
-async def change_password_for_user(user: User, password: str, db: Session) -> User:
+async def change_password_for_user(user: User, password: str, db: AsyncSession) -> User:
     """
-    The change_password_for_user function takes a user and password, then updates the user's password in the database.
+    The change_password_for_user function takes a user and password, then updates the user's password in the database
+    (one UPDATE ... RETURNING statement, the user is not reloaded after the commit). The cached user is invalidated.
 
     :param user: User: Specify the user object that will be updated
     :param password: str: Pass in the new password for the user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The user object with the updated password
     :doc-author: Trelent
     """
-    user.password = password
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    user = await db.scalar(update(User).filter(User.id == user.id).values(password=password).returning(User))
+    await db.commit()
+    if user is not None:
+        await invalidate_user(user.email)
 
     return user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
-    The update_token function updates the refresh token for a user.
+    The update_token function updates the refresh token for a user and invalidates the cached user.
+    It is used only for the migration of the refresh tokens issued before the rotation families.
 
     :param user: User: Identify the user that is being updated
     :param token: str | None: Update the refresh token in the database
-    :param db: Session: Commit the changes to the database
+    :param db: AsyncSession: Commit the changes to the database
     :return: None, because it's an async function
     :doc-author: Trelent
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
+    await invalidate_user(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
-    and sets the confirmed field of the user with that email to True.
+    and sets the confirmed field of the user with that email to True (one UPDATE statement).
+    The cached user is invalidated.
 
 
     :param email: str: Identify the user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: None
     :doc-author: Trelent
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
+    await db.execute(update(User).filter(User.email == email).values(confirmed=True))
+    await db.commit()
+    await invalidate_user(email)
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
-    The update_avatar function updates the avatar of a user.
+    The update_avatar function updates the avatar of a user with one UPDATE ... RETURNING statement
+    and invalidates the cached user.
 
     :param email: Find the user in the database
     :param url: str: Specify the type of the parameter
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The updated user object
     :doc-author: Trelent
     """
-    user = await get_user_by_email(email, db)
-    user.avatar = url
-    db.commit()
-    db.refresh(user)
-    
+    user = await db.scalar(update(User).filter(User.email == email).values(avatar=url).returning(User))
+    await db.commit()
+    await invalidate_user(email)
+
     return user
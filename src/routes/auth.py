@@ -3,7 +3,7 @@ from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.templating import Jinja2Templates
 from starlette.templating import _TemplateResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf import messages as m
 from src.database.db_connect import get_db
@@ -30,7 +30,7 @@ async def signup(
                  body: UserModel,
                  background_tasks: BackgroundTasks, 
                  request: Request, 
-                 db: Session = Depends(get_db)
+                 db: AsyncSession = Depends(get_db)
                  ) -> dict:
     """
     The signup function creates a new user in the database.
@@ -38,7 +38,7 @@ async def signup(
     :param body: UserModel: Get the user data from the request body
     :param background_tasks: BackgroundTasks: Add a background task to the list of tasks
     :param request: Request: Access the request object
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dictionary with two keys: user and detail
     :doc-author: Trelent
     """
@@ -46,7 +46,7 @@ async def signup(
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=m.ACCOUNT_EXIST)
     
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     new_user = await repository_users.create_user(body, db)
     # We create a background task of sending a letter:
     background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
@@ -57,13 +57,13 @@ async def signup(
 @router.post('/login', response_model=TokenModel)
 async def login(
                 body: OAuth2PasswordRequestForm = Depends(),  # OAuth2PasswordRequestForm automatically goes to Depends
-                db: Session = Depends(get_db)
+                db: AsyncSession = Depends(get_db)
                 ) -> dict:
     """
     The login function is used to authenticate a user.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A dict with the access_token, refresh_token and token_type
     :doc-author: Trelent
     """
@@ -74,13 +74,17 @@ async def login(
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.UNCOMFIRMED_EMAIL)
     
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update_password_async(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_PASSWORD)
+
+    if new_hash is not None:
+        # the hash uses an outdated cost: store the hash with the current one
+        await repository_users.change_password_for_user(user, new_hash, db)
     
-    # Generate JWT
-    access_token = await auth_service.create_access_token(data={'sub': user.email})
-    refresh_token = await auth_service.create_refresh_token(data={'sub': user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    # Generate JWT with the claims of the user, the refresh token starts a rotation family in Redis
+    claims, refresh_token = await auth_service.issue_refresh_token(auth_service.principal_claims(user))
+    access_token = await auth_service.create_access_token(data=claims)
 
     return {'access_token': access_token, 'refresh_token': refresh_token, 'token_type': 'bearer'}
 
@@ -88,36 +92,59 @@ async def login(
 @router.get('/refresh_token', response_model=TokenModel)
 async def refresh_token(
                         credentials: HTTPAuthorizationCredentials = Security(security), 
-                        db: Session = Depends(get_db)
+                        db: AsyncSession = Depends(get_db)
                         ) -> dict:
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access token,
         a new refresh token, and the type of authentication being used.
+        The refresh token is rotated in Redis, the database is used only for the tokens issued before
+        the rotation families (users.refresh_token, checked once and then moved to a family).
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the header of the request
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: The access_token and refresh_token,
     :doc-author: Trelent
     """
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
+    if 'fam' in auth_service.decode_token(token):
+        claims, refresh_token = await auth_service.rotate_refresh_token(token)
+
+    else:
+        # migration: a token issued before the rotation families is valid only if it is users.refresh_token
+        user = await repository_users.get_user_by_email(email, db)
+        if user is None or user.refresh_token != token:
+            if user is not None:
+                await repository_users.update_token(user, None, db)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_REFRESH_TOKEN)
+
         await repository_users.update_token(user, None, db)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_REFRESH_TOKEN)
+        claims, refresh_token = await auth_service.issue_refresh_token(auth_service.principal_claims(user))
 
-    access_token = await auth_service.create_access_token(data={'sub': email})
-    refresh_token = await auth_service.create_refresh_token(data={'sub': email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token = await auth_service.create_access_token(data=claims)
 
     return {'access_token': access_token, 'refresh_token': refresh_token, 'token_type': 'bearer'}
 
 
+@router.post('/logout')
+async def logout(credentials: HTTPAuthorizationCredentials = Security(security)) -> dict:
+    """
+    The logout function revokes the access token of the request (until it expires) and the refresh tokens
+    issued together with it.
+
+    :param credentials: HTTPAuthorizationCredentials: Get the access token from the header of the request
+    :return: A dict with a message
+    """
+    await auth_service.revoke_access_token(credentials.credentials)
+
+    return {'message': m.MSG_LOGGED_OUT}
+
+
 @router.get('/confirmed_email/{token}')
 async def confirmed_email(
                           token: str, 
-                          db: Session = Depends(get_db)
+                          db: AsyncSession = Depends(get_db)
                           ) -> dict:
     """
     The confirmed_email function is used to confirm the user's email.
@@ -126,7 +153,7 @@ async def confirmed_email(
 
 
     :param token: str: Get the token from the url
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dict with a message
     :doc-author: Trelent
     """
@@ -148,7 +175,7 @@ async def request_email(
                         body: RequestEmail, 
                         background_tasks: BackgroundTasks, 
                         request: Request,
-                        db: Session = Depends(get_db)
+                        db: AsyncSession = Depends(get_db)
                         ) -> dict:
     """
     The request_email function is used to send a confirmation email to the user.
@@ -156,7 +183,7 @@ async def request_email(
     :param body: RequestEmail: Get the email from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background queue
     :param request: Request: Get the base url of our application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with a message
     :doc-author: Trelent
     """
@@ -176,7 +203,7 @@ async def reset_password(
                          body: RequestEmail, 
                          background_tasks: BackgroundTasks, 
                          request: Request,
-                         db: Session = Depends(get_db)
+                         db: AsyncSession = Depends(get_db)
                          ) -> dict:
     """
     The reset_password function is used to reset a user's password.
@@ -186,7 +213,7 @@ async def reset_password(
     :param body: RequestEmail: Get the email from the request body
     :param background_tasks: BackgroundTasks: Add the task to the background tasks queue
     :param request: Request: Get the base url of the application
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A message to the user
     :doc-author: Trelent
     """
@@ -225,7 +252,7 @@ async def reset_password_confirm(
                                  background_tasks: BackgroundTasks, 
                                  request: Request,
                                  token: str,
-                                 db: Session = Depends(get_db)
+                                 db: AsyncSession = Depends(get_db)
                                  ) -> dict:
     """
     The reset_password_confirm function is used to reset a user's password.
@@ -243,7 +270,7 @@ async def reset_password_confirm(
     :param background_tasks: BackgroundTasks: Create a background task
     :param request: Request: Get the base url of the application
     :param token: str: Get the token from the url
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The following json response:
     :doc-author: Trelent
     """
@@ -253,7 +280,7 @@ async def reset_password_confirm(
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                             detail=m.WARNING_INVALID_TOKEN)
     
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     
     updated_user = await repository_users.change_password_for_user(exist_user, body.password, db)
     if updated_user is None:
@@ -1,63 +1,278 @@
-from typing import Optional
+from typing import AsyncGenerator, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path
-from fastapi_limiter.depends import RateLimiter
-from fastapi_pagination import add_pagination, Page, Params
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi_pagination import add_pagination, Params
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db_connect import get_db
+from src.database.db_connect import get_db, replica_router
 from src.database.models import Contact, User
 from src.repository import contacts as repository_contacts
-from src.schemes import ContactModel, ContactResponse, CatToNameModel
+from src.schemes import (
+                         BatchReport,
+                         ContactBatchDeleteModel,
+                         ContactBatchUpdateModel,
+                         ContactCursorPage,
+                         ContactModel,
+                         ContactPage,
+                         ContactResponse,
+                         CatToNameModel,
+                         ContactsFormat,
+                         ImportReport,
+                         TotalMode,
+                         )
 from src.services.auth import auth_service
+from src.services.contacts_export import export_chunks, MEDIA_TYPES
+from src.services.contacts_import import format_by_content_type, iter_lines, parse_contacts
+from src.services.rate_limit import LocalTokenBuckets, SlidingWindowRateLimiter
+from src.services.redis_client import redis_client
 
 from src.conf.config import settings
 
 router = APIRouter(prefix='/contacts')  # tags=['contacts']
 
+# opt-in keyset pagination of the lists: ?cursor= (empty) for the first page, then ?cursor=<next_cursor>
+CURSOR_QUERY = Query(
+                     None,
+                     description='Keyset pagination: empty for the first page, then next_cursor of the previous page; '
+                                 'without it the page/size (limit-offset) pagination is used'
+                     )
+# total of a limit-offset page: exact (default), estimate (planner statistics) or false (no total, the cheapest)
+TOTAL_QUERY = Query(TotalMode.exact, description='How to compute the total: exact, estimate or false (no total)')
+
+
+async def get_read_db(
+                      current_user: User = Depends(auth_service.get_current_principal)
+                      ) -> AsyncGenerator[AsyncSession, None]:
+    """
+    The get_read_db function is a dependency for the read-only routes: it returns a session bound to a read replica,
+    or to the primary within the read-your-writes window after the user's own write.
+
+    :param current_user: User: Get the id of the user who reads
+    :return: An async database session
+    """
+    async with replica_router.session(current_user.id) as db:
+        yield db
+
+
+# one budget per user (or per address without a token) for all the contacts routes, every route costs its own units
+# the clients clearly under their limit are admitted by the worker and charged to Redis in batches (main.py)
+rate_limiter = SlidingWindowRateLimiter(
+                                        redis_client,
+                                        settings.rate_limit_budget,
+                                        settings.rate_limit_window,
+                                        settings.rate_limit_costs,
+                                        local=LocalTokenBuckets(
+                                                                settings.rate_limit_local_share,
+                                                                settings.rate_limit_local_ttl
+                                                                ) if settings.rate_limit_local_share > 0 else None,
+                                        fail_open=settings.rate_limit_fail_open
+                                        )
+
 
-# https://pypi.org/project/python-redis-rate-limit/
 @router.get(
             '/', 
-            description=f'No more than {settings.limit_crit} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_crit, seconds=60))],
-            response_model=Page, tags=['all_contacts']
+            description=rate_limiter.describe('get_contacts'),
+            dependencies=[Depends(rate_limiter)],
+            response_model=Union[ContactPage, ContactCursorPage], tags=['all_contacts']
             )
 async def get_contacts(
-                       db: Session = Depends(get_db), 
-                       current_user: User = Depends(auth_service.get_current_user),
-                       pagination_params: Params = Depends()
-                       ) -> Page:
+                       db: AsyncSession = Depends(get_read_db), 
+                       current_user: User = Depends(auth_service.get_current_principal),
+                       pagination_params: Params = Depends(),
+                       cursor: Optional[str] = CURSOR_QUERY,
+                       include_total: TotalMode = TOTAL_QUERY
+                       ) -> ContactPage | ContactCursorPage:
     """
     The get_contacts function returns a list of contacts for the current user.
 
-    :param db: Session: Pass the database session to the function
-    :param current_user: User: Get the user id from the database
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Get the user id from the access token
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total of a limit-offset page
     :return: A list of contacts
     """
-    contacts = await repository_contacts.get_contacts(current_user, db, pagination_params)
+    contacts = await repository_contacts.get_contacts(current_user, db, pagination_params, cursor, include_total)
 
     return contacts
 
 
+# the batch requests are limited by the number of the contacts they change, not by the number of the calls
+# (the same sliding window per user, its own budget)
+batch_rate_limiter = SlidingWindowRateLimiter(
+                                              redis_client,
+                                              settings.limit_batch_rows,
+                                              60,
+                                              prefix='ratelimit:batch',
+                                              fail_open=settings.rate_limit_fail_open
+                                              )
+
+
+@router.patch(
+              '/batch',
+              response_model=BatchReport,
+              description=f'No more than {settings.limit_batch_rows} contacts per minute, '
+                          f'no more than {settings.batch_max_size} ids per request',
+              tags=['contacts_batch']
+              )
+async def update_contacts(
+                          body: ContactBatchUpdateModel,
+                          request: Request,
+                          response: Response,
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_principal)
+                          ) -> BatchReport:
+    """
+    The update_contacts function applies the same partial changes to many contacts of the current user
+    with one statement.
+
+    :param body: ContactBatchUpdateModel: The ids of the contacts and the fields to change
+    :param request: Request: Identify the client for the rate limit
+    :param response: Response: Get the RateLimit-* headers
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the owner of the contacts
+    :return: BatchReport: The outcome of every id
+    """
+    await batch_rate_limiter.charge(request, response, len(body.ids))
+    report = await repository_contacts.update_contacts(body.ids, body.changes, current_user, db)
+    replica_router.stick_to_primary(current_user.id)
+
+    return report
+
+
+@router.delete(
+               '/batch',
+               response_model=BatchReport,
+               description=f'No more than {settings.limit_batch_rows} contacts per minute, '
+                           f'no more than {settings.batch_max_size} ids per request',
+               tags=['contacts_batch']
+               )
+async def remove_contacts(
+                          body: ContactBatchDeleteModel,
+                          request: Request,
+                          response: Response,
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_principal)
+                          ) -> BatchReport:
+    """
+    The remove_contacts function removes many contacts of the current user with one statement.
+
+    :param body: ContactBatchDeleteModel: The ids of the contacts
+    :param request: Request: Identify the client for the rate limit
+    :param response: Response: Get the RateLimit-* headers
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the owner of the contacts
+    :return: BatchReport: The outcome of every id
+    """
+    await batch_rate_limiter.charge(request, response, len(body.ids))
+    report = await repository_contacts.remove_contacts(body.ids, current_user, db)
+    replica_router.stick_to_primary(current_user.id)
+
+    return report
+
+
+@router.get(
+            '/export',
+            description=rate_limiter.describe('export_contacts'),
+            dependencies=[Depends(rate_limiter)],
+            response_class=StreamingResponse,
+            tags=['contacts_transfer']
+            )
+async def export_contacts(
+                          export_format: ContactsFormat = Query(ContactsFormat.ndjson, alias='format'),
+                          db: AsyncSession = Depends(get_read_db),
+                          current_user: User = Depends(auth_service.get_current_principal)
+                          ) -> StreamingResponse:
+    """
+    The export_contacts function streams all the contacts of the current user as NDJSON or CSV
+    (the same CSV as the import accepts). The rows come from a server-side cursor while the response is sent,
+    so the memory stays constant whatever the number of the contacts.
+
+    :param export_format: ContactsFormat: The format of the export (ndjson or csv)
+    :param db: AsyncSession: Get the database session (open until the response is sent)
+    :param current_user: User: Get the user whose contacts are exported
+    :return: StreamingResponse: The address book
+    """
+    return StreamingResponse(
+                             export_chunks(
+                                           repository_contacts.stream_contacts(
+                                                                               current_user,
+                                                                               db,
+                                                                               settings.export_partition_size
+                                                                               ),
+                                           export_format
+                                           ),
+                             media_type=MEDIA_TYPES[export_format],
+                             headers={
+                                      'Content-Disposition': f'attachment; filename="contacts.{export_format.value}"'
+                                      }
+                             )
+
+
+@router.post(
+             '/import',
+             response_model=ImportReport,
+             description=f'{rate_limiter.describe("import_contacts")}. '
+                         f'The body is streamed CSV (header line with the contact field names) or NDJSON',
+             dependencies=[Depends(rate_limiter)],
+             tags=['contacts_transfer']
+             )
+async def import_contacts(
+                          request: Request,
+                          import_format: Optional[ContactsFormat] = Query(
+                                                                        None,
+                                                                        alias='format',
+                                                                        description='By default by the Content-Type'
+                                                                        ),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_principal)
+                          ) -> ImportReport:
+    """
+    The import_contacts function imports an address book: the body is parsed as it is streamed,
+    the rows are validated against ContactModel and inserted in batches of settings.import_batch_size.
+
+    :param request: Request: Read the streamed body and its Content-Type
+    :param import_format: Optional[ContactsFormat]: The format of the body (csv or ndjson)
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the user who imports the contacts
+    :return: ImportReport: The numbers of the created, duplicate and invalid rows and the outcome of every row
+    """
+    import_format = import_format or format_by_content_type(request.headers.get('content-type'))
+    if import_format is None:
+        raise HTTPException(
+                            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail='Expected text/csv or application/x-ndjson (or ?format=csv|ndjson)'
+                            )
+
+    report = await repository_contacts.import_contacts(
+                                                       parse_contacts(iter_lines(request.stream()), import_format),
+                                                       current_user,
+                                                       db,
+                                                       settings.import_batch_size
+                                                       )
+    replica_router.stick_to_primary(current_user.id)
+
+    return report
+
+
 @router.get(
             '/{contact_id}', 
-            description=f'No more than {settings.limit_warn} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_warn, seconds=60))],
+            description=rate_limiter.describe('get_contact'),
+            dependencies=[Depends(rate_limiter)],
             response_model=ContactResponse, tags=['contact']
             )
 async def get_contact(
                       contact_id: int = Path(ge=1),
-                      db: Session = Depends(get_db),
-                      current_user: User = Depends(auth_service.get_current_user)
+                      db: AsyncSession = Depends(get_read_db),
+                      current_user: User = Depends(auth_service.get_current_principal)
                       ) -> Optional[Contact]:
     """
     The get_contact function returns a contact by its id.
 
     :param contact_id: int: Specify the contact id that is passed in from the url
-    :param db: Session: Get a database session
-    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Get a database session
+    :param current_user: User: Get the current user from the access token
     :return: A contact by id
     :doc-author: Trelent
     """
@@ -71,38 +286,41 @@ async def get_contact(
 @router.post(
              '/', 
              response_model=ContactResponse,  
-             description=f'No more than {settings.limit_crit} requests per minute',
-             dependencies=[Depends(RateLimiter(times=settings.limit_crit, seconds=60))], 
+             description=rate_limiter.describe('create_contact'),
+             dependencies=[Depends(rate_limiter)],
              status_code=status.HTTP_201_CREATED, tags=['contact']
              )
 async def create_contact(
                          body: ContactModel,
-                         db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_principal)
                          ) -> Contact:
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactModel: Get the data from the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user_id of the logged in user
     :return: A contact object
     :doc-author: Trelent
     """
-    return await repository_contacts.create_contact(body, current_user, db)
+    contact = await repository_contacts.create_contact(body, current_user, db)
+    replica_router.stick_to_primary(current_user.id)
+
+    return contact
 
 
 @router.put(
             '/{contact_id}', 
-            description=f'No more than {settings.limit_crit} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_crit, seconds=60))],
+            description=rate_limiter.describe('update_contact'),
+            dependencies=[Depends(rate_limiter)],
             response_model=ContactResponse, tags=['contact']
             )
 async def update_contact(
                          body: ContactModel,
                          contact_id: int = Path(ge=1), 
-                         db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_principal)
                          ) -> Contact:  
     """
     The update_contact function updates a contact in the database.
@@ -111,7 +329,7 @@ async def update_contact(
 
     :param body: ContactModel: Receive the data from the request body
     :param contact_id: int: Specify the contact that will be deleted
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user's id
     :return: The updated contact
     :doc-author: Trelent
@@ -120,25 +338,27 @@ async def update_contact(
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact Not Found')
 
+    replica_router.stick_to_primary(current_user.id)
+
     return contact
 
 
 @router.delete(
                '/{contact_id}', 
-               description=f'No more than {settings.limit_crit} requests per minute',
-               dependencies=[Depends(RateLimiter(times=settings.limit_crit, seconds=60))],
+               description=rate_limiter.describe('remove_contact'),
+               dependencies=[Depends(rate_limiter)],
                response_model=ContactResponse, tags=['contact']
                )
 async def remove_contact(
                          contact_id: int = Path(ge=1),
-                         db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_principal)
                          ) -> Optional[Contact]:
     """
     The remove_contact function removes a contact from the database.
 
     :param contact_id: int: Specify the contact_id of the contact to be deleted
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user who is making the request
     :return: An optional contact
     :doc-author: Trelent
@@ -147,20 +367,22 @@ async def remove_contact(
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact Not Found')
     
+    replica_router.stick_to_primary(current_user.id)
+
     return contact
 
 
 @router.patch(
               '/{contact_id}/to_name', 
-              description=f'No more than {settings.limit_crit} requests per minute',
-              dependencies=[Depends(RateLimiter(times=settings.limit_crit, seconds=60))],
+              description=rate_limiter.describe('change_name_contact'),
+              dependencies=[Depends(rate_limiter)],
               response_model=ContactResponse, tags=['contact']
               )
 async def change_name_contact(
                               body: CatToNameModel,
                               contact_id: int = Path(ge=1),
-                              db: Session = Depends(get_db),
-                              current_user: User = Depends(auth_service.get_current_user)
+                              db: AsyncSession = Depends(get_db),
+                              current_user: User = Depends(auth_service.get_current_principal)
                               ) -> Optional[Contact]:
     """
     The change_name_contact function changes the name of a contact.
@@ -170,7 +392,7 @@ async def change_name_contact(
 
     :param body: CatToNameModel: Pass the new name of the contact
     :param contact_id: int: Specify the id of the contact that will be updated
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user id of the current logged in user
     :return: A contact object
     :doc-author: Trelent
@@ -179,37 +401,45 @@ async def change_name_contact(
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not Found')
 
+    replica_router.stick_to_primary(current_user.id)
+
     return contact
 
 
 # ---SEARCH---------------------------------------------------
 @router.get(
             '/search_by_birthday_celebration_within_days/{days}', 
-            description=f'No more than {settings.limit_warn} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_warn, seconds=60))],
-            response_model=Page, tags=['search']
+            description=rate_limiter.describe('search_by_birthday_celebration_within_days'),
+            dependencies=[Depends(rate_limiter)],
+            response_model=Union[ContactPage, ContactCursorPage], tags=['search']
             )
 async def search_by_birthday_celebration_within_days(
                                                      days: int,
-                                                     db: Session = Depends(get_db),
-                                                     current_user: User = Depends(auth_service.get_current_user),
-                                                     pagination_params: Params = Depends()
-                                                     ) -> Page:
+                                                     db: AsyncSession = Depends(get_read_db),
+                                                     current_user: User = Depends(auth_service.get_current_principal),
+                                                     pagination_params: Params = Depends(),
+                                                     cursor: Optional[str] = CURSOR_QUERY,
+                                                     include_total: TotalMode = TOTAL_QUERY
+                                                     ) -> ContactPage | ContactCursorPage:
     """
     The search_by_birthday_celebration_within_days function searches for contacts that have a birthday celebration
     within the specified number of days.
 
     :param days: int: Determine the number of days within which a contact's birthday is to be celebrated
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the auth_service
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total of a limit-offset page
     :return: A list of contacts that have birthdays within the next
     """
     contact = await repository_contacts.search_by_birthday_celebration_within_days(
                                                                                    days, 
                                                                                    current_user, 
                                                                                    db, 
-                                                                                   pagination_params
+                                                                                   pagination_params,
+                                                                                   cursor,
+                                                                                   include_total
                                                                                    )
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact Not Found')
@@ -220,8 +450,8 @@ async def search_by_birthday_celebration_within_days(
 # https://fastapi.tiangolo.com/tutorial/query-params/#__tabbed_2_1
 @router.get(
             '/search_by_fields_and/', 
-            description=f'No more than {settings.limit_warn} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_warn, seconds=60))],
+            description=rate_limiter.describe('search_by_fields_and'),
+            dependencies=[Depends(rate_limiter)],
             response_model=ContactResponse, tags=['search']
             )
 async def search_by_fields_and(
@@ -230,8 +460,8 @@ async def search_by_fields_and(
                                last_name: str | None = None,
                                email: str | None = None,
                                phone: int | None = None,
-                               db: Session = Depends(get_db),
-                               current_user: User = Depends(auth_service.get_current_user)
+                               db: AsyncSession = Depends(get_read_db),
+                               current_user: User = Depends(auth_service.get_current_principal)
                                ) -> Optional[Contact]:
     """
     The search_by_fields_and function searches for a contact by name, last_name, email and phone.
@@ -242,7 +472,7 @@ async def search_by_fields_and(
     :param last_name: str | None: Search by last name
     :param email: str | None: Search by email
     :param phone: int | None: Search by phone number
-    :param db: Session: Get the database session, which is used to query the database
+    :param db: AsyncSession: Get the database session, which is used to query the database
     :param current_user: User: Get the user who is making the request
     :return: A list of contacts
     :doc-author: Trelent
@@ -257,28 +487,39 @@ async def search_by_fields_and(
 
 @router.get(
             '/search_by_fields_or/{query_str}', 
-            description=f'No more than {settings.limit_warn} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_warn, seconds=60))],
-            response_model=Page, tags=['search']
+            description=rate_limiter.describe('search_by_fields_or'),
+            dependencies=[Depends(rate_limiter)],
+            response_model=Union[ContactPage, ContactCursorPage], tags=['search']
             )
 async def search_by_fields_or(
                               query_str: str,
-                              db: Session = Depends(get_db),
-                              current_user: User = Depends(auth_service.get_current_user),
-                              pagination_params: Params = Depends()
-                              ) -> Page:
+                              db: AsyncSession = Depends(get_read_db),
+                              current_user: User = Depends(auth_service.get_current_principal),
+                              pagination_params: Params = Depends(),
+                              cursor: Optional[str] = CURSOR_QUERY,
+                              include_total: TotalMode = TOTAL_QUERY
+                              ) -> ContactPage | ContactCursorPage:
     """
     The search_by_fields_or function searches for contacts by a query string.
     The search is performed on the first_name, last_name, and email fields of the contact table.
     If no matches are found, an HTTP 404 Not Found error is raised.
 
     :param query_str: str: Search for a contact by name, email or phone number
-    :param db: Session: Create a connection to the database
+    :param db: AsyncSession: Create a connection to the database
     :param current_user: User: Get the current user
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total of a limit-offset page
     :return: A list of contacts
     """
-    contact = await repository_contacts.search_by_fields_or(query_str, current_user, db, pagination_params)
+    contact = await repository_contacts.search_by_fields_or(
+                                                       query_str,
+                                                       current_user,
+                                                       db,
+                                                       pagination_params,
+                                                       cursor,
+                                                       include_total
+                                                       )
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact Not Found')
     
@@ -287,28 +528,39 @@ async def search_by_fields_or(
 
 @router.get(
             '/search_by_like_fields_or/{query_str}', 
-            description=f'No more than {settings.limit_warn} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_warn, seconds=60))],
-            response_model=Page, tags=['search']
+            description=rate_limiter.describe('search_by_like_fields_or'),
+            dependencies=[Depends(rate_limiter)],
+            response_model=Union[ContactPage, ContactCursorPage], tags=['search']
             )
 async def search_by_like_fields_or(
                                    query_str: str,
-                                   db: Session = Depends(get_db),
-                                   current_user: User = Depends(auth_service.get_current_user),
-                                   pagination_params: Params = Depends()
-                                   ) -> Page:
+                                   db: AsyncSession = Depends(get_read_db),
+                                   current_user: User = Depends(auth_service.get_current_principal),
+                                   pagination_params: Params = Depends(),
+                                   cursor: Optional[str] = CURSOR_QUERY,
+                                   include_total: TotalMode = TOTAL_QUERY
+                                   ) -> ContactPage | ContactCursorPage:
     """
     The search_by_like_fields_or function searches for contacts by a query string.
     The search is performed on the first_name, last_name, and email fields of the contact table.
     The search is case insensitive and will return all contacts that match any of the three fields.
 
     :param query_str: str: Search for a contact by first name, last name, or email
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the user's id
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total of a limit-offset page
     :return: A page object
     """
-    contact = await repository_contacts.search_by_like_fields_or(query_str, current_user, db, pagination_params)
+    contact = await repository_contacts.search_by_like_fields_or(
+                                                            query_str,
+                                                            current_user,
+                                                            db,
+                                                            pagination_params,
+                                                            cursor,
+                                                            include_total
+                                                            )
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact Not Found')
     
@@ -317,19 +569,21 @@ async def search_by_like_fields_or(
 
 @router.get(
             '/search_by_like_fields_and/', 
-            description=f'No more than {settings.limit_warn} requests per minute',
-            dependencies=[Depends(RateLimiter(times=settings.limit_warn, seconds=60))],
-            response_model=Page, tags=['search']
+            description=rate_limiter.describe('search_by_like_fields_and'),
+            dependencies=[Depends(rate_limiter)],
+            response_model=Union[ContactPage, ContactCursorPage], tags=['search']
             )
 async def search_by_like_fields_and(
                                     name: str | None = None,
                                     last_name: str | None = None,
                                     email: str | None = None,
                                     phone: int | None = None,
-                                    db: Session = Depends(get_db),
-                                    current_user: User = Depends(auth_service.get_current_user),
-                                    pagination_params: Params = Depends()
-                                    ) -> Page:
+                                    db: AsyncSession = Depends(get_read_db),
+                                    current_user: User = Depends(auth_service.get_current_principal),
+                                    pagination_params: Params = Depends(),
+                                    cursor: Optional[str] = CURSOR_QUERY,
+                                    include_total: TotalMode = TOTAL_QUERY
+                                    ) -> ContactPage | ContactCursorPage:
     """
     The search_by_like_fields_and function searches for a contact by name, last_name, email or phone.
         The search is case insensitive and will return all contacts that match the query.
@@ -338,9 +592,11 @@ async def search_by_like_fields_and(
     :param last_name: str | None: Search by last_name,
     :param email: str | None: Search by email
     :param phone: int | None: Filter the contacts by phone
-    :param db: Session: Get the database session from the dependency injection
-    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Get the database session from the dependency injection
+    :param current_user: User: Get the current user from the access token
     :param pagination_params: Params: Parameters for pagination, page(int), size(int) in Params object
+    :param cursor: Optional[str]: Cursor of the keyset pagination mode (None - limit-offset mode)
+    :param include_total: TotalMode: How to compute the total of a limit-offset page
     :return: A list of contacts
     """
     contact = await repository_contacts.search_by_like_fields_and(
@@ -350,7 +606,9 @@ async def search_by_like_fields_and(
                                                                   phone, 
                                                                   current_user, 
                                                                   db, 
-                                                                  pagination_params
+                                                                  pagination_params,
+                                                                  cursor,
+                                                                  include_total
                                                                   )
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact Not Found')
@@ -0,0 +1,165 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+
+from src.conf.config import settings
+from src.database.db_connect import pool_monitor, replica_router
+from src.routes.contacts import rate_limiter
+from src.services.auth import auth_service
+from src.services.circuit_breaker import redis_breaker
+from src.services.redis_client import redis_pool
+
+
+async def internal_only(request: Request) -> None:
+    """
+    The internal_only function is a dependency that lets only the clients from settings.internal_hosts
+    (by default the local host) use the internal (operations) endpoints.
+
+    :param request: Request: Get the client host of the request
+    :return: None
+    """
+    allowed_hosts = [host.strip() for host in settings.internal_hosts.split(',')]
+    if request.client is None or request.client.host not in allowed_hosts:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Forbidden')
+
+
+async def internal_admin(x_admin_token: str = Header(default='')) -> None:
+    """
+    The internal_admin function is a dependency that, on top of internal_only, requires the X-Admin-Token header
+    to match settings.internal_admin_token for the internal endpoints which change the state of the users.
+    While the setting is empty these endpoints are disabled.
+
+    :param x_admin_token: str: The X-Admin-Token header of the request
+    :return: None
+    """
+    expected = settings.internal_admin_token
+    if not expected or not secrets.compare_digest(x_admin_token.encode('utf-8'), expected.encode('utf-8')):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Forbidden')
+
+
+router = APIRouter(
+                   prefix='/internal',
+                   tags=['internal'],
+                   include_in_schema=False,
+                   dependencies=[Depends(internal_only)]
+                   )
+
+
+@router.get('/db/pool')
+async def db_pool_stats() -> dict:
+    """
+    The db_pool_stats function returns the live statistics of the database connection pool:
+    connections checked out, overflow, checkout wait time and the checkout latency histogram.
+    It helps to tell the pool exhaustion from slow queries.
+
+    :return: A dict with the pool statistics
+    """
+    return pool_monitor.snapshot()
+
+
+@router.post('/db/pool/reset', status_code=status.HTTP_204_NO_CONTENT)
+async def db_pool_stats_reset() -> None:
+    """
+    The db_pool_stats_reset function clears the collected checkout counters and the histogram.
+
+    :return: None
+    """
+    pool_monitor.reset()
+
+
+@router.get('/db/replicas')
+async def db_replicas() -> list[dict]:
+    """
+    The db_replicas function returns the health state of the read replicas.
+
+    :return: A list of dicts, one per replica
+    """
+    return replica_router.status()
+
+
+@router.post('/users/{user_id}/revoke-sessions', dependencies=[Depends(internal_admin)])
+async def revoke_user_sessions(user_id: int) -> dict:
+    """
+    The revoke_user_sessions function revokes all the access and refresh tokens of the user issued up to now
+    (the user has to log in again).
+
+    :param user_id: int: The id of the user
+    :return: A dict with the not-before time of the user
+    """
+    return {'user_id': user_id, 'not_before': await auth_service.revoke_user_sessions(user_id)}
+
+
+@router.get('/auth/revocations')
+async def revocation_stats() -> dict:
+    """
+    The revocation_stats function describes the local state of the token revocations of this worker:
+    the revoked ids in the filter, the users with a not-before time, the checks and their Redis confirmations.
+
+    :return: A dict with the revocation statistics
+    """
+    return auth_service.revocations.stats()
+
+
+@router.get('/redis/pool')
+async def redis_pool_stats() -> dict:
+    """
+    The redis_pool_stats function returns the live statistics of the shared Redis pool of this worker:
+    connections opened, in use and idle, and how long the commands waited for a connection.
+
+    :return: A dict with the pool statistics
+    """
+    return redis_pool.snapshot()
+
+
+@router.post('/redis/pool/reset', status_code=status.HTTP_204_NO_CONTENT)
+async def redis_pool_stats_reset() -> None:
+    """
+    The redis_pool_stats_reset function clears the collected wait counters of the Redis pool.
+
+    :return: None
+    """
+    redis_pool.reset_stats()
+
+
+@router.get('/redis/breaker')
+async def redis_breaker_state() -> dict:
+    """
+    The redis_breaker_state function describes the circuit breaker of the Redis calls of this worker
+    (closed, open - the calls fail fast, half_open - one call probes Redis).
+
+    :return: A dict with the state of the breaker
+    """
+    return redis_breaker.snapshot()
+
+
+@router.get('/rate-limit')
+async def rate_limit_stats() -> dict:
+    """
+    The rate_limit_stats function shows how many requests of the contacts routes this worker admitted locally
+    (the local token buckets) and how many it checked in Redis.
+
+    :return: A dict with the rate limit statistics
+    """
+    return rate_limiter.stats()
+
+
+@router.get('/auth/hashing')
+async def hashing_pool_stats() -> dict:
+    """
+    The hashing_pool_stats function returns the queue depth of the password hashing pool of this worker
+    and the wait and run times of the password checks.
+
+    :return: A dict with the pool statistics
+    """
+    return auth_service.hashing_pool.snapshot()
+
+
+@router.get('/auth/token-cache')
+async def token_cache_stats() -> dict:
+    """
+    The token_cache_stats function returns the size and the hit/miss counters of the memo of the verified tokens
+    of this worker.
+
+    :return: A dict with the cache statistics
+    """
+    return auth_service.token_cache.stats()
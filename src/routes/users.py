@@ -1,7 +1,7 @@
 # import cloudinary
 # import cloudinary.uploader
 from fastapi import APIRouter, Depends, UploadFile, File  # status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # from src.conf.config import settings
 from src.database.db_connect import get_db
@@ -32,14 +32,14 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 async def update_avatar_user(
                              file: UploadFile = File(), 
                              current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)
+                             db: AsyncSession = Depends(get_db)
                              ) -> User:
     """
     The update_avatar_user function is used to update the avatar of a user.
 
     :param file: UploadFile: Upload the image file
     :param current_user: User: Get the current user from the database
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A user object with the updated avatar_url field
     :doc-author: Trelent
     """
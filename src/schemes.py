@@ -1,6 +1,14 @@
 # Схеми для валідації вхідних та вихідних даних
 from datetime import date, datetime
-from pydantic import BaseModel, Field, EmailStr  # poetry add pydantic[email] 
+from enum import Enum
+from typing import Generic, Optional, TypeVar
+
+from fastapi_pagination import Page
+from pydantic import BaseModel, Field, EmailStr, validator  # poetry add pydantic[email] 
+
+from src.conf.config import settings
+
+T = TypeVar('T')
 
 
 class ContactModel(BaseModel):
@@ -22,6 +30,103 @@ class ContactResponse(ContactModel):
         orm_mode = True
 
 
+class TotalMode(str, Enum):
+    """How the total of a paginated search is computed."""
+    false = 'false'  # no total (the cheapest)
+    exact = 'exact'  # SELECT count(*)
+    estimate = 'estimate'  # planner statistics (exact where the database has none)
+
+
+class ContactPage(Page[T], Generic[T]):
+    """Page of the limit-offset pagination, the total may be skipped or estimated."""
+    total: Optional[int] = None
+    total_is_estimate: bool = False
+
+
+class ContactsFormat(str, Enum):
+    """Format of the imported or exported address book."""
+    csv = 'csv'  # header line with the ContactModel field names, then one contact per line
+    ndjson = 'ndjson'  # one JSON object per line
+
+
+class ImportStatus(str, Enum):
+    """Outcome of one row of the import."""
+    created = 'created'
+    duplicate = 'duplicate'
+    invalid = 'invalid'
+
+
+class ImportRowResult(BaseModel):
+    """Outcome of one row (numbered from 1, without the CSV header) of the import."""
+    row: int
+    status: ImportStatus
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class ImportReport(BaseModel):
+    """Report of the import: the counts and the outcome of every row."""
+    created: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    rows: list[ImportRowResult] = []
+
+
+class ContactCursorPage(BaseModel):
+    """Page of contacts in the keyset (cursor) pagination mode."""
+    items: list[ContactResponse]
+    size: int
+    next_cursor: Optional[str] = None  # None - it is the last page
+
+
+class ContactPartialModel(BaseModel):
+    """The fields of ContactModel to change, all optional (the batch update)."""
+    name: Optional[str] = Field(default=None, min_length=2, max_length=30)
+    last_name: Optional[str] = Field(default=None, min_length=2, max_length=40)
+    email: Optional[EmailStr] = None
+    phone: Optional[int] = Field(default=None, gt=0, le=9999999999)
+    birthday: Optional[date] = None
+    description: Optional[str] = Field(default=None, max_length=3000)
+
+
+class ContactBatchDeleteModel(BaseModel):
+    """Ids of the contacts of one batch."""
+    ids: list[int] = Field(min_items=1, max_items=settings.batch_max_size)
+
+
+class ContactBatchUpdateModel(ContactBatchDeleteModel):
+    """Ids of the contacts of one batch and the changes applied to all of them."""
+    changes: ContactPartialModel
+
+    @validator('changes')
+    def some_changes(cls, value: ContactPartialModel) -> ContactPartialModel:
+        """Check that at least one field is changed."""
+        if not value.dict(exclude_none=True):
+            raise ValueError('no fields to change')
+
+        return value
+
+
+class BatchStatus(str, Enum):
+    """Outcome of one id of the batch."""
+    updated = 'updated'
+    deleted = 'deleted'
+    not_found = 'not_found'
+
+
+class BatchItemResult(BaseModel):
+    """Outcome of one id of the batch."""
+    id: int
+    status: BatchStatus
+
+
+class BatchReport(BaseModel):
+    """Report of the batch: the number of the changed contacts and the outcome of every id."""
+    affected: int = 0
+    not_found: int = 0
+    results: list[BatchItemResult] = []
+
+
 class CatToNameModel(BaseModel):
     """Class Category to Name model."""
     name: str = Field(default='Unknown-next', min_length=2, max_length=30)
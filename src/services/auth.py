@@ -1,32 +1,106 @@
 from datetime import datetime, timedelta
-import pickle
+import logging
+import secrets
 from typing import Optional
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-import redis
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf import messages as m
 from src.database.db_connect import get_db
+from src.database.models import User
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.circuit_breaker import REDIS_ERRORS, redis_breaker
+from src.services.hashing_pool import HashingPool
+from src.services.redis_client import redis_client
+from src.services.refresh_tokens import RefreshTokenStore
+from src.services.revocation import RevocationList
+from src.services.token_cache import VerifiedTokenCache
+from src.services.user_cache import user_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def password_context(rounds: int) -> CryptContext:
+    """
+    The password_context function builds the password hashing context: bcrypt with the given cost,
+    the hashes with a lower cost need an update (they are rehashed on login).
+
+    :param rounds: int: The bcrypt cost of the new hashes
+    :return: The hashing context
+    """
+    return CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
 
 
 class Auth:
     """The main class for authentication functions."""
-    pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+    # 0 - the cost is calibrated at startup (main.calibrate_password_cost), the bcrypt default until then
+    pwd_context = password_context(settings.password_hash_rounds or 12)
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
     # https://dev.to/ramko9999/host-and-use-redis-for-free-51if
-    client = redis.Redis(
-                         host=settings.redis_host,
-                         port=settings.redis_port,
-                         password=settings.redis_password
-                         )
+    client = redis_client  # async, on the shared connection pool of the worker
+    redis_breaker = redis_breaker  # the Redis calls fail fast while Redis is unreachable
+    user_cache = user_cache  # in-process LRU + Redis, invalidated by the writes of the users repository
+    token_cache = VerifiedTokenCache(settings.token_cache_size)  # claims of the verified tokens of this worker
+    refresh_tokens = RefreshTokenStore(client)  # rotation families of the refresh tokens
+    # revoked tokens (logout) and users (all sessions), checked locally, synced by main.start_revocation_sync
+    revocations = RevocationList(
+                                 client,
+                                 capacity=settings.revocation_filter_capacity,
+                                 error_rate=settings.revocation_filter_error_rate,
+                                 max_lifetime=settings.refresh_token_ttl,
+                                 breaker=redis_breaker
+                                 )
+    # bcrypt runs in these threads, not on the event loop
+    hashing_pool = HashingPool(settings.password_hash_workers, settings.password_hash_queue)
+
+    async def redis_call(self, func, *args, **kwargs):
+        """
+        The redis_call function runs a Redis call which the request can not do without (e.g. the rotation
+        of a refresh token) through the circuit breaker.
+
+        :param self: Represent the instance of the class
+        :param func: The Redis call
+        :param args: The arguments of the call
+        :param kwargs: The keyword arguments of the call
+        :return: The result of the call
+        :raises HTTPException: 503 with Retry-After if Redis is unreachable
+        """
+        try:
+            return await self.redis_breaker.call(func, *args, **kwargs)
+
+        except REDIS_ERRORS as error:
+            logger.warning(f'Redis is unreachable, the request is rejected. error:\n{error}')
+            raise HTTPException(
+                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=m.SERVICE_UNAVAILABLE,
+                                headers={'Retry-After': str(self.redis_breaker.retry_after())}
+                                )
+
+    def decode_token(self, token: str) -> dict:
+        """
+        The decode_token function returns the claims of the token, the signature and the expiration are verified
+        once per token: the claims are memoized until the token expires.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded token
+        :return: The claims of the token (must not be changed)
+        :raises JWTError: The token is invalid or expired
+        """
+        claims = self.token_cache.get(token)
+        if claims is None:
+            claims = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            self.token_cache.set(token, claims)
+
+        return claims
 
     def verify_password(self, plain_password, hashed_password) -> bool:
         """
@@ -54,6 +128,65 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    def set_password_cost(self, rounds: int) -> None:
+        """
+        The set_password_cost function switches the new hashes to the given bcrypt cost.
+
+        :param self: Represent the instance of the class
+        :param rounds: int: The bcrypt cost
+        :return: None
+        """
+        self.pwd_context = password_context(rounds)
+
+    def verify_and_update_password(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """
+        The verify_and_update_password function checks the password and, if the hash uses an outdated cost,
+        hashes the password again with the current one.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass in the password that is being checked
+        :param hashed_password: str: The hashed password from the database
+        :return: Whether the password matches and the new hash (None if the hash is up to date)
+        """
+        return self.pwd_context.verify_and_update(plain_password, hashed_password)
+
+    async def verify_and_update_password_async(
+                                               self,
+                                               plain_password: str,
+                                               hashed_password: str
+                                               ) -> tuple[bool, Optional[str]]:
+        """
+        The verify_and_update_password_async function runs verify_and_update_password in the hashing pool.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass in the password that is being checked
+        :param hashed_password: str: The hashed password from the database
+        :return: Whether the password matches and the new hash (None if the hash is up to date)
+        """
+        return await self.hashing_pool.run(self.verify_and_update_password, plain_password, hashed_password)
+
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        The verify_password_async function runs verify_password in the hashing pool, so the event loop
+        serves the other requests while bcrypt works.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass in the password that is being checked
+        :param hashed_password: str: The hashed password from the database
+        :return: A boolean value
+        """
+        return await self.hashing_pool.run(self.verify_password, plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+        The get_password_hash_async function runs get_password_hash in the hashing pool.
+
+        :param self: Represent the instance of the class
+        :param password: str: Pass the password to be hashed
+        :return: A password hash
+        """
+        return await self.hashing_pool.run(self.get_password_hash, password)
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -75,6 +208,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'access_token'})
+        to_encode.setdefault('jti', secrets.token_urlsafe(12))  # the id a logout revokes
         encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
 
         return encoded_access_token
@@ -86,7 +220,7 @@ class Auth:
             Args:
                 data (dict): A dictionary containing the user's id and username.
                 expires_delta (Optional[float]): The time in seconds until the refresh token expires. Defaults to None,
-                which is 7 days from creation date.
+                which is settings.refresh_token_ttl (7 days) from creation date.
 
         :param self: Make the function a method of the class
         :param data: dict: Pass the data to be encoded
@@ -99,7 +233,7 @@ class Auth:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
 
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
         to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'refresh_token'})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
 
@@ -115,7 +249,7 @@ class Auth:
         :doc-author: Trelent
         """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(refresh_token)
             if payload['scope'] == 'refresh_token':
                 email = payload['sub']
 
@@ -126,8 +260,137 @@ class Auth:
         except JWTError as e:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
+    @staticmethod
+    def principal_claims(user: User) -> dict:
+        """
+        The principal_claims function returns the claims of the user carried by the access and refresh tokens,
+        so get_current_principal needs no lookup of the user.
+
+        :param user: User: The user the tokens are issued to
+        :return: A dict of the claims: sub (email), uid, username and confirmed
+        """
+        return {'sub': user.email, 'uid': user.id, 'username': user.username, 'confirmed': bool(user.confirmed)}
+
+    async def issue_refresh_token(self, claims: dict) -> tuple[dict, str]:
+        """
+        The issue_refresh_token function starts a new rotation family (on login) and returns its first refresh token.
+        The family lives in Redis, the users table is not written.
+
+        :param self: Represent the instance of the class
+        :param claims: dict: The claims of the user (principal_claims)
+        :return: The claims for the access token (with the family, so a logout revokes it) and the refresh token
+        """
+        family, jti = secrets.token_urlsafe(12), secrets.token_urlsafe(12)
+        await self.redis_call(self.refresh_tokens.start, family, jti, settings.refresh_token_ttl)
+        claims = {**claims, 'fam': family}
+
+        return claims, await self.create_refresh_token(data={**claims, 'jti': jti})
+
+    async def rotate_refresh_token(self, refresh_token: str) -> tuple[dict, str]:
+        """
+        The rotate_refresh_token function exchanges a valid refresh token for the next token of its rotation family
+        (one Redis script, no database access). A token which was already rotated revokes the whole family.
+
+        :param self: Represent the instance of the class
+        :param refresh_token: str: The refresh token presented by the client
+        :return: The claims of the user (for the new access token) and the new refresh token
+        :raises HTTPException: 401 if the token is invalid, reused or its family is revoked or expired
+        """
+        await self.decode_refresh_token(refresh_token)
+        claims = self.decode_token(refresh_token)
+        family, jti, new_jti = claims.get('fam'), claims.get('jti'), secrets.token_urlsafe(12)
+        if family is None or jti is None or await self.revocations.is_revoked(claims):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_REFRESH_TOKEN)
+
+        result = await self.redis_call(self.refresh_tokens.rotate, family, jti, new_jti, settings.refresh_token_ttl)
+        if result != RefreshTokenStore.ROTATED:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_REFRESH_TOKEN)
+
+        user_claims = {key: claims[key] for key in ('sub', 'uid', 'username', 'confirmed', 'fam') if key in claims}
+
+        return user_claims, await self.create_refresh_token(data={**user_claims, 'jti': new_jti})
+
+    async def revoke_access_token(self, token: str) -> None:
+        """
+        The revoke_access_token function logs the token out: the access token is revoked until it expires
+        and the rotation family of its refresh token is revoked.
+
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: None
+        :raises HTTPException: 401 if the token is not a valid access token
+        """
+        try:
+            payload = self.decode_token(token)
+
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_CREDENTIALS)
+
+        if payload.get('scope') != 'access_token':
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=m.INCORRECT_CREDENTIALS)
+
+        if payload.get('jti') is not None:
+            await self.redis_call(self.revocations.revoke_token, payload['jti'], payload['exp'])
+
+        if payload.get('fam') is not None:
+            await self.redis_call(self.refresh_tokens.revoke, payload['fam'])
+
+    async def revoke_user_sessions(self, user_id: int) -> int:
+        """
+        The revoke_user_sessions function revokes all the access and refresh tokens of the user issued up to now.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The id of the user
+        :return: The not-before time (timestamp) of the user
+        """
+        return await self.redis_call(self.revocations.revoke_user, user_id)
+
+    async def get_current_principal(
+                                    self,
+                                    token: str = Depends(oauth2_scheme),
+                                    db: AsyncSession = Depends(get_db)
+                                    ) -> User:
+        """
+        The get_current_principal function is a lightweight get_current_user for the routes which need only
+        the id (and the name) of the user: the user is built from the signed claims of the access token,
+        without Redis or the database. The token signature is checked once per token (decode_token).
+        A token issued before the claims were added (no uid) is resolved by get_current_user.
+
+        :param self: Represent the instance of the class
+        :param token: str: Get the token from the authorization header
+        :param db: AsyncSession: The database session, used only for the tokens without the claims
+        :return: A transient User with id, email, username and confirmed
+        """
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate credentials',
+            headers={'WWW-Authenticate': 'Bearer'},
+            )
+
+        try:
+            payload = self.decode_token(token)
+
+        except JWTError:
+            raise credentials_exception
+
+        if payload.get('scope') != 'access_token' or payload.get('sub') is None:
+            raise credentials_exception
+
+        if await self.revocations.is_revoked(payload):
+            raise credentials_exception
+
+        if 'uid' not in payload:
+            return await self.get_current_user(token, db)
+
+        return User(
+                    id=payload['uid'],
+                    email=payload['sub'],
+                    username=payload.get('username'),
+                    confirmed=payload.get('confirmed', False)
+                    )
+
     # @cache
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It uses the OAuth2 Dependency to retrieve a user's JWT from
@@ -137,7 +400,7 @@ class Auth:
 
         :param self: Represent the instance of the class
         :param token: str: Get the token from the authorization header
-        :param db: Session: Get the current database session
+        :param db: AsyncSession: Get the current database session
         :return: A user object
         :doc-author: Trelent
         """
@@ -149,7 +412,7 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             if payload['scope'] == 'access_token':
                 email = payload['sub']
                 if email is None:
@@ -158,23 +421,21 @@ class Auth:
             else:
                 raise credentials_exception
             
-        except JWTError as e:
-            print(e)
+        except JWTError:
+            raise credentials_exception
+
+        if await self.revocations.is_revoked(payload):
             raise credentials_exception
 
         # https://developer.redis.com/develop/python/fastapi/
-        user = self.client.get(f'user:{email}')
+        # one database load per user at a time, the hot users are reloaded before they expire
+        # (the Redis calls of the cache go through the breaker, the database errors are raised)
+        loader = lambda: repository_users.get_user_by_email(email, db)  # noqa: E731
+        user = await self.user_cache.get_or_load(email, loader)
+
         if user is None:
-            user = await repository_users.get_user_by_email(email, db)
-            if user is None:
-                raise credentials_exception
-            
-            self.client.set(f"user:{email}", pickle.dumps(user))
-            self.client.expire(f"user:{email}", 900)
+            raise credentials_exception
 
-        else:
-            user = pickle.loads(user)
-        
         return user
     
     def create_email_token(self, data: dict):
@@ -197,13 +458,12 @@ class Auth:
 
     async def get_email_from_token(self, token: str):
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             email = payload['sub']
 
             return email
         
-        except JWTError as e:
-            print(e)
+        except JWTError:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail='Invalid token for email verification')
 
@@ -246,13 +506,12 @@ class Auth:
         :doc-author: Trelent
         """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             email = payload['sub']
 
             return email
         
-        except JWTError as e:
-            print(e)
+        except JWTError:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail='Invalid token for password reset')
 
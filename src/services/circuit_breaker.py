@@ -0,0 +1,156 @@
+"""Circuit breaker around the Redis calls, so a Redis outage costs no timeouts once it is detected."""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from src.conf.config import settings
+
+
+# the outages of Redis: the connection errors and the timeouts of redis-py, the socket errors and the timeouts;
+# the other errors of redis-py (ResponseError, NoScriptError, DataError, ...) are the faults of a command,
+# they are raised to the caller and do not open the circuit
+REDIS_ERRORS = (RedisConnectionError, RedisTimeoutError, OSError, asyncio.TimeoutError)
+
+
+class CircuitOpenError(RedisConnectionError):
+    """The call was not made: the circuit is open (a ConnectionError, so the callers handle it as an outage)."""
+
+
+class CircuitBreaker:
+    """
+    Counts the consecutive failed calls (errors, by default the Redis outages): failure_threshold of them open
+    the circuit, and while it is open the calls fail at once with CircuitOpenError instead of waiting for the socket
+    timeouts. After reset_timeout seconds one call is let through (half-open): its success closes the circuit,
+    its failure opens it again. The other exceptions of a call are raised without being counted.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+                 self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 10.0,
+                 errors: tuple = REDIS_ERRORS
+                 ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.errors = errors
+        self.failures = 0  # consecutive
+        self.opened_at: Optional[float] = None
+        self.probing = False  # the half-open call is running
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """
+        The state property returns closed, open or half_open (open for reset_timeout seconds, then half_open).
+
+        :return: The state of the circuit
+        """
+        if self.opened_at is None:
+            return self.CLOSED
+
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+
+        return self.HALF_OPEN
+
+    def retry_after(self) -> int:
+        """
+        The retry_after function returns the seconds until the next call is let through (for Retry-After).
+
+        :return: Seconds, at least 1
+        """
+        if self.opened_at is None:
+            return 1
+
+        return max(1, round(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        The call function awaits func(*args, **kwargs) unless the circuit is open.
+
+        :param func: Callable[..., Awaitable[Any]]: The Redis call
+        :param args: The arguments of the call
+        :param kwargs: The keyword arguments of the call
+        :return: The result of the call
+        :raises CircuitOpenError: if the circuit is open (or its half-open call is running)
+        """
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self.probing):
+            self.rejected += 1
+            raise CircuitOpenError(f'circuit {self.name} is open')
+
+        self.probing = state == self.HALF_OPEN
+        try:
+            result = await func(*args, **kwargs)
+
+        except self.errors:
+            self.record_failure()
+            raise
+
+        finally:
+            self.probing = False
+
+        self.record_success()
+
+        return result
+
+    def record_failure(self) -> None:
+        """
+        The record_failure function counts a failed call and opens the circuit after failure_threshold of them
+        (or after the failed half-open call).
+
+        :return: None
+        """
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.opened += 1
+
+    def record_success(self) -> None:
+        """
+        The record_success function closes the circuit.
+
+        :return: None
+        """
+        self.failures = 0
+        self.opened_at = None
+
+    def reset(self) -> None:
+        """
+        The reset function closes the circuit and clears the counters (e.g. between the tests).
+
+        :return: None
+        """
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function describes the state of the circuit.
+
+        :return: A dict ready to be returned as JSON
+        """
+        return {
+                'name': self.name,
+                'state': self.state,
+                'failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'opened': self.opened,
+                'rejected': self.rejected,
+                }
+
+
+# shared by all the Redis consumers of the worker: they fail fast together while Redis is unreachable
+redis_breaker = CircuitBreaker('redis', settings.redis_breaker_failures, settings.redis_breaker_reset)
@@ -0,0 +1,60 @@
+"""Serialization of the exported address books (CSV or NDJSON) as a stream of chunks."""
+import csv
+import io
+import json
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy import Row
+
+from src.schemes import ContactsFormat
+
+# the columns of the export, the CSV header is the same as the one the import expects
+EXPORT_FIELDS = ('id', 'name', 'last_name', 'email', 'phone', 'birthday', 'description')
+
+MEDIA_TYPES = {ContactsFormat.csv: 'text/csv', ContactsFormat.ndjson: 'application/x-ndjson'}
+
+
+def csv_chunk(rows: Sequence[Sequence]) -> bytes:
+    """
+    The csv_chunk function writes the rows as CSV lines.
+
+    :param rows: Sequence[Sequence]: The rows in the order of EXPORT_FIELDS
+    :return: The encoded lines
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+
+    return buffer.getvalue().encode()
+
+
+def ndjson_chunk(rows: Sequence[Sequence]) -> bytes:
+    """
+    The ndjson_chunk function writes every row as one JSON object per line.
+
+    :param rows: Sequence[Sequence]: The rows in the order of EXPORT_FIELDS
+    :return: The encoded lines
+    """
+    return ''.join(
+                   json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str, ensure_ascii=False) + '\n'
+                   for row in rows
+                   ).encode()
+
+
+async def export_chunks(
+                        partitions: AsyncIterator[Sequence[Row]],
+                        export_format: ContactsFormat
+                        ) -> AsyncIterator[bytes]:
+    """
+    The export_chunks function turns the partitions of the rows into the chunks of the response body,
+    one chunk per partition (CSV starts with the header line), so only one partition is held in memory.
+
+    :param partitions: AsyncIterator[Sequence[Row]]: The rows of the contacts, see stream_contacts
+    :param export_format: ContactsFormat: The format of the export
+    :return: The chunks of the body
+    """
+    if export_format == ContactsFormat.csv:
+        yield csv_chunk([EXPORT_FIELDS])
+
+    write = csv_chunk if export_format == ContactsFormat.csv else ndjson_chunk
+    async for rows in partitions:
+        yield write(rows)
@@ -0,0 +1,124 @@
+"""Streaming parse of the imported address books (CSV or NDJSON) into validated contacts."""
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+
+from src.schemes import ContactModel, ContactsFormat
+
+# (row number, the valid contact or None, the error or None)
+ImportRecord = tuple[int, Optional[ContactModel], Optional[str]]
+
+CONTENT_TYPES = {
+                 'text/csv': ContactsFormat.csv,
+                 'application/csv': ContactsFormat.csv,
+                 'application/x-ndjson': ContactsFormat.ndjson,
+                 'application/ndjson': ContactsFormat.ndjson,
+                 'application/jsonl': ContactsFormat.ndjson,
+                 }
+
+
+def format_by_content_type(content_type: Optional[str]) -> Optional[ContactsFormat]:
+    """
+    The format_by_content_type function recognizes the format of the import by the Content-Type header.
+
+    :param content_type: Optional[str]: The Content-Type header of the request
+    :return: The format, or None if the content type is unknown
+    """
+    if not content_type:
+        return None
+
+    return CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    The iter_lines function splits the streamed body into text lines as the chunks arrive,
+    so the whole file is never held in memory.
+
+    :param chunks: AsyncIterator[bytes]: The body of the request, e.g. request.stream()
+    :return: The lines without the line breaks
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    tail = ''
+    async for chunk in chunks:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail.rstrip('\r')
+
+
+def validation_error(error: ValidationError) -> str:
+    """
+    The validation_error function makes one line of the errors of the contact validation.
+
+    :param error: ValidationError: The error raised by ContactModel
+    :return: The errors as 'field: message; ...'
+    """
+    return '; '.join(f'{".".join(map(str, item["loc"]))}: {item["msg"]}' for item in error.errors())
+
+
+def validate_row(row: int, data: object) -> ImportRecord:
+    """
+    The validate_row function validates one parsed row against ContactModel.
+    The empty values are left out, so the defaults of ContactModel apply to them.
+
+    :param row: int: The number of the row
+    :param data: object: The parsed row, a dict is expected
+    :return: The import record of the row
+    """
+    if not isinstance(data, dict):
+        return row, None, 'a JSON object is expected'
+
+    try:
+        return row, ContactModel(**{key: value for key, value in data.items() if value not in ('', None)}), None
+
+    except ValidationError as error:
+        return row, None, validation_error(error)
+
+
+async def parse_contacts(lines: AsyncIterator[str], import_format: ContactsFormat) -> AsyncIterator[ImportRecord]:
+    """
+    The parse_contacts function parses and validates the imported rows one by one.
+    CSV: the first line is the header with the field names of ContactModel, a quoted value can not span lines.
+    NDJSON: every line is one JSON object. Blank lines are skipped.
+
+    :param lines: AsyncIterator[str]: The lines of the body, see iter_lines
+    :param import_format: ContactsFormat: The format of the body
+    :return: The import records, numbered from 1 (the CSV header is not counted)
+    """
+    header: Optional[list[str]] = None
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+
+        if import_format == ContactsFormat.csv:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+
+            row += 1
+            if len(values) != len(header):
+                yield row, None, f'{len(header)} values expected, {len(values)} found'
+                continue
+
+            yield validate_row(row, dict(zip(header, values)))
+
+        else:
+            row += 1
+            try:
+                data = json.loads(line)
+
+            except json.JSONDecodeError as error:
+                yield row, None, f'invalid JSON: {error.msg}'
+                continue
+
+            yield validate_row(row, data)
@@ -0,0 +1,84 @@
+"""Calibration of the bcrypt cost (rounds) to the latency budget of a password check on the current machine."""
+import argparse
+import time
+
+from passlib.hash import bcrypt
+
+
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+SAMPLE_PASSWORD = 'Calibration@1'
+
+
+def measure(rounds: int, samples: int = 3) -> float:
+    """
+    The measure function returns the time of one bcrypt hash with the given cost (the best of samples runs,
+    a password check costs the same as hashing).
+
+    :param rounds: int: The bcrypt cost (log2 of the iterations)
+    :param samples: int: How many hashes are timed
+    :return: Seconds per hash
+    """
+    handler = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash(SAMPLE_PASSWORD)
+        timings.append(time.perf_counter() - started)
+
+    return min(timings)
+
+
+def cost_table(min_rounds: int = BCRYPT_MIN_ROUNDS, max_rounds: int = 16, limit_ms: float = 2000) -> list[dict]:
+    """
+    The cost_table function measures the costs from min_rounds up, until max_rounds or until a hash takes
+    longer than limit_ms (every next round doubles the time).
+
+    :param min_rounds: int: The first cost measured
+    :param max_rounds: int: The last cost measured
+    :param limit_ms: float: Stop after the first cost slower than this
+    :return: A list of dicts: rounds, ms per hash and hashes per second of one thread
+    """
+    table = []
+    for rounds in range(max(min_rounds, BCRYPT_MIN_ROUNDS), min(max_rounds, BCRYPT_MAX_ROUNDS) + 1):
+        seconds = measure(rounds)
+        table.append({'rounds': rounds, 'ms': round(seconds * 1000, 1), 'per_second': round(1 / seconds, 1)})
+        if seconds * 1000 > limit_ms:
+            break
+
+    return table
+
+
+def calibrate(budget_ms: float, min_rounds: int = 10, max_rounds: int = 16) -> int:
+    """
+    The calibrate function returns the highest cost whose hash fits into budget_ms on this machine,
+    but not less than min_rounds (the security floor) and not more than max_rounds.
+
+    :param budget_ms: float: The latency budget of one password check
+    :param min_rounds: int: The lowest acceptable cost
+    :param max_rounds: int: The highest acceptable cost
+    :return: The bcrypt cost
+    """
+    chosen = min_rounds
+    for row in cost_table(min_rounds, max_rounds, limit_ms=budget_ms):
+        if row['ms'] > budget_ms:
+            break
+
+        chosen = row['rounds']
+
+    return chosen
+
+
+if __name__ == '__main__':
+    # python -m src.services.hash_cost --budget-ms 250
+    parser = argparse.ArgumentParser(description='Measure the bcrypt costs on this machine.')
+    parser.add_argument('--budget-ms', type=float, default=250, help='latency budget of one password check')
+    parser.add_argument('--min-rounds', type=int, default=10, help='lowest acceptable cost')
+    parser.add_argument('--max-rounds', type=int, default=16, help='highest cost measured')
+    options = parser.parse_args()
+
+    print(f'{"rounds":>6} {"ms":>10} {"per second":>11}')
+    for row in cost_table(BCRYPT_MIN_ROUNDS, options.max_rounds):
+        print(f'{row["rounds"]:>6} {row["ms"]:>10} {row["per_second"]:>11}')
+
+    print(f'PASSWORD_HASH_ROUNDS={calibrate(options.budget_ms, options.min_rounds, options.max_rounds)}')
@@ -0,0 +1,120 @@
+"""Bounded worker pool for the password hashing, so bcrypt does not block the event loop."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from src.conf import messages as m
+
+
+def timed(queued_at: float, func: Callable, *args) -> tuple[Any, float, float]:
+    """
+    The timed function runs func in a worker thread and measures how long the call waited for the thread
+    and how long it ran.
+
+    :param queued_at: float: The perf_counter time the call was submitted
+    :param func: Callable: The (CPU bound) function
+    :param args: The arguments of the function
+    :return: The result of func, the wait time and the run time (seconds)
+    """
+    started = time.perf_counter()
+    result = func(*args)
+
+    return result, started - queued_at, time.perf_counter() - started
+
+
+class HashingPool:
+    """
+    Runs the password hashing and verification in max_workers threads (bcrypt releases the GIL while hashing).
+    At most max_queue calls wait for a free thread, the calls beyond that are rejected with 503 at once,
+    so a login storm makes the logins slower (or rejected) while the other requests of the worker are not affected.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = self.new_executor()
+        self.in_flight = 0  # calls running or waiting for a thread
+        self.reset()
+
+    def new_executor(self) -> ThreadPoolExecutor:
+        """
+        The new_executor function returns the thread pool of the calls (the threads are started on demand).
+
+        :return: A ThreadPoolExecutor with max_workers threads
+        """
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+
+    def reset(self) -> None:
+        """
+        The reset function clears the collected counters (the live gauges are not affected).
+
+        :return: None
+        """
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        The run function runs func(*args) in the pool and returns its result.
+
+        :param func: Callable: The (CPU bound) function
+        :param args: The arguments of the function
+        :return: The result of func
+        :raises HTTPException: 503 if the queue of the pool is full
+        """
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=m.PASSWORD_HASHING_BUSY,
+                                headers={'Retry-After': '1'}
+                                )
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, wait, run = await loop.run_in_executor(self.executor, timed, time.perf_counter(), func, *args)
+
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += run
+
+        return result
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function returns the queue depth of the pool and the wait and run times of the calls.
+
+        :return: A dict ready to be returned as JSON
+        """
+        return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.max_workers),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_avg_s': round(self.wait_total / self.completed, 6) if self.completed else 0.0,
+                'wait_max_s': round(self.wait_max, 6),
+                'run_avg_s': round(self.run_total / self.completed, 6) if self.completed else 0.0,
+                }
+
+    def shutdown(self) -> None:
+        """
+        The shutdown function stops the threads of the pool (the running calls are finished).
+        The pool stays usable: the next call starts new threads (e.g. the application is started again).
+
+        :return: None
+        """
+        executor, self.executor = self.executor, self.new_executor()
+        executor.shutdown(wait=False, cancel_futures=True)
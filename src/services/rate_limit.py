@@ -0,0 +1,377 @@
+"""Rate limits: a per-user sliding window charged by endpoint costs or by the weight of a batch request."""
+import asyncio
+from collections import OrderedDict
+import logging
+from math import ceil, floor
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Request, Response, status
+from jose import JWTError
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf import messages as m
+from src.services.auth import auth_service
+from src.services.circuit_breaker import CircuitBreaker, REDIS_ERRORS, redis_breaker
+
+
+def unavailable(breaker: CircuitBreaker) -> HTTPException:
+    """
+    The unavailable function returns the 503 error of a limit which can not be checked (Redis is unreachable
+    and the limiter fails closed).
+
+    :param breaker: CircuitBreaker: The breaker of the Redis calls, tells when to retry
+    :return: The HTTPException to raise
+    """
+    return HTTPException(
+                         status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail=m.SERVICE_UNAVAILABLE,
+                         headers={'Retry-After': str(breaker.retry_after())}
+                         )
+
+
+async def user_or_ip(request: Request) -> str:
+    """
+    The user_or_ip function identifies the client of the rate limit: the user of a valid access token
+    (the claims are memoized by auth_service.decode_token, so the check is not repeated by the route),
+    else the client address, so the users behind one NAT have their own budgets.
+
+    :param request: Request: The request
+    :return: The identifier of the client
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        try:
+            claims = auth_service.decode_token(token)
+
+        except JWTError:
+            claims = {}
+
+        user = claims.get('uid', claims.get('sub'))
+        if user is not None and claims.get('scope') == 'access_token':
+            return f'user:{user}'
+
+    forwarded = request.headers.get('X-Forwarded-For')
+    address = forwarded.split(',')[0].strip() if forwarded else (request.client.host if request.client else 'unknown')
+
+    return f'ip:{address}'
+
+
+class Bucket:
+    """The local grant of a client: the units the worker may still admit and the last answer of Redis."""
+    __slots__ = ('tokens', 'remaining', 'reset_at', 'granted_at')
+
+    def __init__(self, tokens: int, remaining: int, reset_at: float, granted_at: float) -> None:
+        self.tokens = tokens
+        self.remaining = remaining
+        self.reset_at = reset_at
+        self.granted_at = granted_at
+
+
+class LocalTokenBuckets:
+    """
+    Per-worker token buckets of the clients which are clearly under their limit: every answer of Redis
+    (remaining units of the client) fills the bucket of the client with `share` of the remaining units,
+    the worker spends them without a round trip until they run out or the grant is older than ttl seconds.
+    Several workers spend their shares of the same remaining units, so share bounds the overshoot of the limit
+    between two reconciliations. A bounded LRU, the idle clients are evicted.
+    """
+
+    def __init__(self, share: float = 0.1, ttl: float = 5.0, maxsize: int = 10000) -> None:
+        self.share = share
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, Bucket] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, cost: int) -> Optional[Bucket]:
+        """
+        The take function spends cost units of the local grant of the client.
+
+        :param key: str: The client
+        :param cost: int: The cost of the request
+        :return: The bucket if the request is admitted locally, None if Redis has to decide
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+
+        if time.monotonic() - bucket.granted_at > self.ttl:
+            del self._buckets[key]
+            return None
+
+        if bucket.tokens < cost:
+            return None
+
+        bucket.tokens -= cost
+        bucket.remaining = max(0, bucket.remaining - cost)
+        self._buckets.move_to_end(key)
+
+        return bucket
+
+    def grant(self, key: str, remaining: int, reset_ms: int) -> None:
+        """
+        The grant function refills the bucket of the client from the answer of Redis.
+
+        :param key: str: The client
+        :param remaining: int: The units the client has left (all the workers)
+        :param reset_ms: int: Milliseconds until the window of the client moves on
+        :return: None
+        """
+        now = time.monotonic()
+        self._buckets[key] = Bucket(floor(remaining * self.share), remaining, now + reset_ms / 1000, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        """
+        The discard function drops the grant of the client (its next request is checked by Redis).
+
+        :param key: str: The client
+        :return: None
+        """
+        self._buckets.pop(key, None)
+
+
+class SlidingWindowRateLimiter:
+    """
+    Allows no more than `budget` units within any `seconds` long window per client (user_or_ip), every endpoint
+    costs its own number of units (costs, by the name of the route function, default_cost for the others),
+    or the weight the route passes to charge (e.g. the number of the contacts of a batch request).
+    The window slides: the count of the previous fixed window is weighted by the part of it still inside the window
+    (sliding window counter), which needs two counters per client instead of a log of the requests.
+    One Lua script (EVALSHA) checks and charges the budget atomically, with the clock of Redis,
+    so all the workers share the budget. Used as a dependency of the routes, it sets the RateLimit-* headers.
+    With local buckets the requests of a client clearly under its limit are admitted by the worker
+    and charged to Redis later, in one pipelined batch per flush (watch); only the clients near their limit
+    (or not seen for a while) pay the round trip. While Redis is unreachable (the breaker is open)
+    the requests are admitted (fail_open) or rejected with 503.
+    """
+    # KEYS[1] - the client, ARGV: budget, window (ms), cost, force (1 - charge even over the budget);
+    # returns {allowed, remaining, reset (ms)}
+    lua_script = """local budget = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local force = ARGV[4] == '1'
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local index = math.floor(now_ms / window)
+local elapsed = now_ms - index * window
+local current_key = KEYS[1] .. ':' .. index
+local current = tonumber(redis.call('GET', current_key) or '0')
+local previous = tonumber(redis.call('GET', KEYS[1] .. ':' .. (index - 1)) or '0')
+local used = previous * (window - elapsed) / window + current
+if used + cost > budget and not force then
+    local retry
+    if cost > budget then
+        retry = window
+    elseif current + cost <= budget then
+        retry = math.ceil(window - (budget - current - cost) * window / previous) - elapsed
+    else
+        retry = window - elapsed + math.max(0, math.ceil(window - (budget - cost) * window / current))
+    end
+    return {0, math.max(0, math.floor(budget - used)), retry}
+end
+redis.call('INCRBY', current_key, cost)
+redis.call('PEXPIRE', current_key, window * 2)
+local allowed = 1
+if used + cost > budget then
+    allowed = 0
+end
+return {allowed, math.max(0, math.floor(budget - used - cost)), window - elapsed}"""
+
+    def __init__(
+                 self,
+                 client: redis.Redis,
+                 budget: int,
+                 seconds: int = 60,
+                 costs: Optional[dict[str, int]] = None,
+                 default_cost: int = 1,
+                 identifier: Callable[[Request], Awaitable[str]] = user_or_ip,
+                 prefix: str = 'ratelimit',
+                 local: Optional[LocalTokenBuckets] = None,
+                 breaker: CircuitBreaker = redis_breaker,
+                 fail_open: bool = True
+                 ) -> None:
+        self.client = client
+        self.budget = budget
+        self.seconds = seconds
+        self.costs = costs or {}
+        self.default_cost = default_cost
+        self.identifier = identifier
+        self.prefix = prefix
+        self.local = local
+        self.breaker = breaker
+        self.fail_open = fail_open
+        self.script = client.register_script(self.lua_script)
+        self.pending: dict[str, int] = {}  # units admitted locally, not charged to Redis yet
+        self.local_hits = 0
+        self.redis_checks = 0
+        self.failed_open = 0
+        self.flushes = 0
+
+    def cost(self, name: str) -> int:
+        """
+        The cost function returns the units a request of the route costs.
+
+        :param name: str: The name of the route function
+        :return: The cost
+        """
+        return self.costs.get(name, self.default_cost)
+
+    def describe(self, name: str) -> str:
+        """
+        The describe function returns the description of the limit of the route (for the OpenAPI docs).
+
+        :param name: str: The name of the route function
+        :return: The description
+        """
+        return f'Costs {self.cost(name)} of {self.budget} units per {self.seconds} seconds'
+
+    def headers(self, remaining: int, reset: int) -> dict:
+        """
+        The headers function returns the RateLimit-* headers.
+
+        :param remaining: int: The units the client has left
+        :param reset: int: Seconds until the window moves on
+        :return: A dict of the headers
+        """
+        return {
+                'RateLimit-Limit': str(self.budget),
+                'RateLimit-Remaining': str(remaining),
+                'RateLimit-Reset': str(reset),
+                'RateLimit-Policy': f'{self.budget};w={self.seconds}',
+                }
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        """
+        The __call__ function charges the cost of the route to the budget of the client (see charge).
+
+        :param request: Request: Identify the client and the route
+        :param response: Response: Get the RateLimit-* headers
+        :return: None
+        """
+        endpoint = request.scope.get('endpoint')
+        await self.charge(request, response, self.cost(getattr(endpoint, '__name__', '')))
+
+    async def charge(self, request: Request, response: Response, cost: int) -> None:
+        """
+        The charge function spends cost units of the budget of the client and sets the RateLimit-* headers
+        of the response, or raises 429 Too Many Requests (with Retry-After) if the budget is not enough.
+        A route whose cost depends on the body calls it after the body is parsed.
+
+        :param request: Request: Identify the client
+        :param response: Response: Get the RateLimit-* headers
+        :param cost: int: The units the request costs
+        :return: None
+        """
+        key = f'{self.prefix}:{{{await self.identifier(request)}}}'
+        bucket = self.local.take(key, cost) if self.local is not None else None
+        if bucket is not None:
+            self.local_hits += 1
+            self.pending[key] = self.pending.get(key, 0) + cost
+            response.headers.update(self.headers(bucket.remaining, max(0, ceil(bucket.reset_at - time.monotonic()))))
+            return
+
+        self.redis_checks += 1
+        try:
+            allowed, remaining, reset = await self.breaker.call(
+                                                                self.script,
+                                                                keys=[key],
+                                                                args=[self.budget, 1000 * self.seconds, cost]
+                                                                )
+
+        except REDIS_ERRORS as error:
+            if self.fail_open:
+                self.failed_open += 1
+                logging.warning(f'Rate limit is not checked. error:\n{error}')
+                return
+
+            raise unavailable(self.breaker)
+
+        if self.local is not None:
+            if allowed:
+                self.local.grant(key, remaining, reset)
+            else:
+                self.local.discard(key)
+
+        headers = self.headers(remaining, ceil(int(reset) / 1000))
+        if not allowed:
+            raise HTTPException(
+                                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail='Too Many Requests',
+                                headers={**headers, 'Retry-After': headers['RateLimit-Reset']}
+                                )
+
+        response.headers.update(headers)
+
+    async def flush(self) -> None:
+        """
+        The flush function charges the units admitted locally to Redis (one pipelined round trip for all the clients)
+        and refills the local buckets from the answers. The units are charged even over the budget (the requests
+        were admitted already, so the overshoot is counted against the next requests of the client),
+        the clients over their limit lose the local grant. The units of a failed flush are put back to pending.
+
+        :return: None
+        """
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, {}
+
+        async def charge() -> list:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, units in pending.items():
+                    await self.script(keys=[key], args=[self.budget, 1000 * self.seconds, units, 1], client=pipe)
+
+                return await pipe.execute()
+
+        try:
+            results = await self.breaker.call(charge)
+
+        except REDIS_ERRORS:
+            for key, units in pending.items():
+                self.pending[key] = self.pending.get(key, 0) + units
+            raise
+
+        self.flushes += 1
+        for key, (allowed, remaining, reset) in zip(pending, results):
+            if allowed:
+                self.local.grant(key, remaining, reset)
+            else:
+                self.local.discard(key)
+
+    async def watch(self, interval: float = 0.2) -> None:
+        """
+        The watch function runs flush every interval seconds (as a background task of the application).
+
+        :param interval: float: Seconds between the flushes
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+
+            except (RedisError, OSError) as error:
+                logging.error(f'Locally admitted requests are not charged. error:\n{error}')
+
+    def stats(self) -> dict:
+        """
+        The stats function describes how many requests were admitted locally and how many were checked by Redis.
+
+        :return: A dict ready to be returned as JSON
+        """
+        return {
+                'local_hits': self.local_hits,
+                'redis_checks': self.redis_checks,
+                'failed_open': self.failed_open,
+                'flushes': self.flushes,
+                'pending_clients': len(self.pending),
+                'local_clients': len(self.local) if self.local is not None else 0,
+                'breaker': self.breaker.snapshot(),
+                }
@@ -0,0 +1,98 @@
+"""The shared async Redis connection pool of the worker."""
+import time
+
+import redis.asyncio as redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.conf.config import settings
+
+
+class MonitoredConnectionPool(redis.BlockingConnectionPool):
+    """
+    Bounded pool: no more than max_connections connections, a command waits up to timeout seconds
+    for a free connection instead of opening a new one. Counts how long the commands wait for a connection
+    and keeps its own gauges of the connections (the internals of the redis-py pools differ between the releases).
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.reset_stats()
+
+    def reset(self) -> None:
+        # called by the constructor of the pool and after a fork: the pool starts without connections
+        super().reset()
+        self.created = 0
+        self.checked_out: set[int] = set()  # ids of the connections handed out and not released yet
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.created += 1
+        return connection
+
+    def reset_stats(self) -> None:
+        """
+        The reset_stats function clears the collected counters (the live gauges of the pool are not affected).
+
+        :return: None
+        """
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+            self.checked_out.add(id(connection))
+            return connection
+
+        except RedisConnectionError:
+            self.timeouts += 1
+            raise
+
+        finally:
+            wait = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    async def release(self, connection) -> None:
+        self.checked_out.discard(id(connection))
+        await super().release(connection)
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function returns the live pool gauges (connections opened, in use and idle)
+        and the time the commands waited for a connection.
+
+        :return: A dict ready to be returned as JSON
+        """
+        in_use = len(self.checked_out)
+
+        return {
+                'max_connections': self.max_connections,
+                'created': self.created,
+                'in_use': in_use,
+                'idle': max(0, self.created - in_use),
+                'health_check_interval': self.connection_kwargs.get('health_check_interval', 0),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg_s': round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+                'wait_max_s': round(self.wait_max, 6),
+                }
+
+
+# one pool per worker for all the Redis consumers (rate limits, user cache, tokens);
+# the connections are opened by main.startup (PING) and lazily by the first commands, closed by main.close_redis
+redis_pool = MonitoredConnectionPool(
+                                     host=settings.redis_host,
+                                     port=settings.redis_port,
+                                     password=settings.redis_password,
+                                     max_connections=settings.redis_max_connections,
+                                     timeout=settings.redis_pool_timeout,
+                                     socket_timeout=settings.redis_socket_timeout,
+                                     socket_connect_timeout=settings.redis_connect_timeout,
+                                     health_check_interval=settings.redis_health_check_interval
+                                     )
+redis_client = redis.Redis(connection_pool=redis_pool)
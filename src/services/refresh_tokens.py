@@ -0,0 +1,74 @@
+"""Refresh tokens tracked in Redis by rotation families instead of the users table."""
+import redis.asyncio as redis
+
+
+class RefreshTokenStore:
+    """
+    A login starts a rotation family: refresh:{family} holds the id (jti) of the only valid refresh token
+    of the family. Every refresh atomically checks the presented jti and replaces it with the jti of the new token.
+    A jti presented after it was rotated means the token was stolen or replayed: the whole family is revoked,
+    so neither the thief nor the owner can refresh with it any more (the owner logs in again).
+    """
+    ROTATED = 1
+    UNKNOWN = 0  # the family expired or never existed
+    REUSED = -1  # the family is revoked now (or was revoked before)
+    REVOKED = 'revoked'
+
+    # KEYS[1] - the family, ARGV: the presented jti, the new jti, the lifetime of the new token (ms)
+    rotate_script = """local current = redis.call('GET', KEYS[1])
+if not current then
+    return 0
+end
+if current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+    return 1
+end
+if current ~= 'revoked' then
+    redis.call('SET', KEYS[1], 'revoked', 'KEEPTTL')
+end
+return -1"""
+
+    def __init__(self, client: redis.Redis, prefix: str = 'refresh') -> None:
+        self.client = client
+        self.prefix = prefix
+
+    def key(self, family: str) -> str:
+        """
+        The key function returns the Redis key of the rotation family.
+
+        :param family: str: The id of the family
+        :return: The Redis key
+        """
+        return f'{self.prefix}:{family}'
+
+    async def start(self, family: str, jti: str, ttl: float) -> None:
+        """
+        The start function opens a rotation family with its first refresh token.
+
+        :param family: str: The id of the family
+        :param jti: str: The id of the first refresh token
+        :param ttl: float: The lifetime of the token (seconds)
+        :return: None
+        """
+        await self.client.set(self.key(family), jti, px=int(ttl * 1000))
+
+    async def rotate(self, family: str, jti: str, new_jti: str, ttl: float) -> int:
+        """
+        The rotate function replaces the presented refresh token of the family with the new one (one atomic script).
+
+        :param family: str: The id of the family
+        :param jti: str: The id of the presented refresh token
+        :param new_jti: str: The id of the new refresh token
+        :param ttl: float: The lifetime of the new token (seconds)
+        :return: ROTATED, UNKNOWN or REUSED
+        """
+        return int(await self.client.eval(self.rotate_script, 1, self.key(family), jti, new_jti, str(int(ttl * 1000))))
+
+    async def revoke(self, family: str) -> None:
+        """
+        The revoke function revokes the family (e.g. on logout), its tokens are treated as reused afterwards.
+
+        :param family: str: The id of the family
+        :return: None
+        """
+        await self.client.set(self.key(family), self.REVOKED, keepttl=True, xx=True)
@@ -0,0 +1,576 @@
+"""Two-tier cache of the users resolved by the access tokens (Auth.get_current_user): in-process LRU + Redis."""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+import math
+import pickle
+import random
+import secrets
+import struct
+import time
+import timeit
+from typing import Any, Awaitable, Callable, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.circuit_breaker import CircuitBreaker, REDIS_ERRORS, redis_breaker
+from src.services.redis_client import redis_client
+
+
+# the first byte of every cached payload, bump it when the layout below changes:
+# the entries of the other version are ignored (a cache miss) and overwritten by the next lookup
+SCHEMA_VERSION = 1
+# version, flags, id, created_at (microseconds since the epoch), then username, email, avatar as length + UTF-8
+HEADER = struct.Struct('>BBIq')
+LENGTH = struct.Struct('>H')
+NONE_LENGTH = 0xFFFF  # the length of a string which is None
+CONFIRMED = 1
+HAS_CREATED_AT = 2
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_user(user: User) -> bytes:
+    """
+    The encode_user function packs the fields of the user needed by the routes (id, username, email, avatar,
+    confirmed, created_at) into a compact payload tagged with SCHEMA_VERSION.
+    The password hash, the refresh token and the ORM state are not stored.
+
+    :param user: User: The user to encode
+    :return: The payload
+    """
+    flags = (CONFIRMED if user.confirmed else 0) | (HAS_CREATED_AT if user.created_at is not None else 0)
+    created_at = (user.created_at - EPOCH) // MICROSECOND if user.created_at is not None else 0
+    parts = [HEADER.pack(SCHEMA_VERSION, flags, user.id, created_at)]
+    for value in (user.username, user.email, user.avatar):
+        if value is None:
+            parts.append(LENGTH.pack(NONE_LENGTH))
+            continue
+
+        data = value.encode('utf-8')
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+
+    return b''.join(parts)
+
+
+def decode_user(payload: bytes) -> Optional[User]:
+    """
+    The decode_user function unpacks a payload of encode_user into a (transient) User.
+    A payload of another schema version (e.g. written by the previous release during a rolling deploy,
+    or a pickled object of the old cache) or a damaged one gives None.
+
+    :param payload: bytes: The cached payload
+    :return: The user or None
+    """
+    if not payload or payload[0] != SCHEMA_VERSION:
+        return None
+
+    try:
+        _, flags, id_, created_at = HEADER.unpack_from(payload)
+        offset = HEADER.size
+        strings = []
+        for _ in range(3):
+            (length,) = LENGTH.unpack_from(payload, offset)
+            offset += LENGTH.size
+            if length == NONE_LENGTH:
+                strings.append(None)
+                continue
+
+            strings.append(payload[offset:offset + length].decode('utf-8'))
+            offset += length
+
+    except (struct.error, UnicodeDecodeError):
+        return None
+
+    username, email, avatar = strings
+
+    return User(
+                id=id_,
+                username=username,
+                email=email,
+                avatar=avatar,
+                confirmed=bool(flags & CONFIRMED),
+                created_at=EPOCH + created_at * MICROSECOND if flags & HAS_CREATED_AT else None
+                )
+
+
+class LocalLRU:
+    """Bounded in-process LRU of one worker, an entry is dropped ttl seconds after it was stored."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 5.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()  # key: (monotonic expiry time, value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        The get function returns the live value of the key (and marks it as recently used) or None.
+
+        :param key: str: The key
+        :return: The value or None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        The set function stores the value, the least recently used entries beyond maxsize are evicted.
+
+        :param key: str: The key
+        :param value: Any: The value
+        :return: None
+        """
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        """
+        The discard function drops the key if it is cached.
+
+        :param key: str: The key
+        :return: None
+        """
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        The clear function drops all the entries.
+
+        :return: None
+        """
+        self._entries.clear()
+
+
+class Flight:
+    """One load of a user in progress in the worker, the concurrent lookups of the same user wait for it."""
+
+    def __init__(self) -> None:
+        self.done = asyncio.Event()
+        self.loaded = False  # False after done - the load failed
+        self.user: Optional[User] = None
+
+
+class UserCache:
+    """
+    Keeps the users under user:{email} in Redis for ttl seconds, one round trip per lookup and per store.
+    A bounded LRU of the worker (local) answers the repeated lookups of the same users for a few seconds without
+    the round trip. The writes of the users repository call invalidate, which drops the Redis entry and publishes
+    the email on the channel: every worker listening to it (watch) drops its local entry.
+    invalidate also bumps the generation of the user (user:{email}:gen), a load stores its user only if the generation
+    is still the one read before the loader ran, so a load which overlaps a change does not cache the stale user.
+    get_or_load runs one loader per user at a time: per worker (Flight) and across the workers (a short Redis lock),
+    and reloads a hot entry shortly before it expires (probabilistic early refresh, scaled by refresh_ahead).
+    The Redis calls (not the loader) go through the breaker: while Redis is unreachable get_or_load loads the user
+    without caching it.
+    """
+    # deletes the lock only if it is still held by the caller (its token)
+    unlock_script = """if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0"""
+    # KEYS: the entry, the generation; ARGV: the generation read before the load, the payload, ttl (s)
+    set_script = """if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1"""
+
+    def __init__(
+                 self,
+                 client: redis.Redis,
+                 ttl: int = 900,
+                 local: Optional[LocalLRU] = None,
+                 channel: str = 'user_cache:invalidate',
+                 refresh_ahead: float = 60.0,
+                 lock_timeout: float = 2.0,
+                 lock_wait: float = 0.5,
+                 breaker: Optional[CircuitBreaker] = None
+                 ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.local = local if local is not None else LocalLRU()
+        self.channel = channel
+        self.refresh_ahead = refresh_ahead
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.breaker = breaker
+        self._flights: dict[str, Flight] = {}
+        self.loads = 0  # loader calls of this worker
+        self.refreshes = 0  # of them the early refreshes of the entries which have not expired yet
+
+    @staticmethod
+    def key(email: str) -> str:
+        """
+        The key function returns the Redis key of the cached user.
+
+        :param email: str: The email of the user
+        :return: The Redis key
+        """
+        return f'user:{email}'
+
+    async def redis(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        The redis function awaits a Redis call of the cache, through the breaker if the cache has one.
+
+        :param func: Callable[..., Awaitable[Any]]: The Redis call
+        :param args: The arguments of the call
+        :param kwargs: The keyword arguments of the call
+        :return: The result of the call
+        """
+        if self.breaker is not None:
+            return await self.breaker.call(func, *args, **kwargs)
+
+        return await func(*args, **kwargs)
+
+    async def read(self, key: str) -> list:
+        """
+        The read function returns the payload of the entry, its remaining time to live and the generation of the user
+        (one pipelined GET + PTTL + GET).
+
+        :param key: str: The Redis key of the cached user
+        :return: [payload or None, milliseconds to live, generation or None]
+        """
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            pipe.get(f'{key}:gen')
+            return await pipe.execute()
+
+    async def get(self, email: str) -> Optional[User]:
+        """
+        The get function returns the cached user (from the local LRU, else from Redis) or None if the user
+        is not in the cache (or its entry has another schema version).
+
+        :param email: str: The email of the user
+        :return: The user or None
+        """
+        user = self.local.get(email)
+        if user is not None:
+            return user
+
+        payload = await self.redis(self.client.get, self.key(email))
+        user = decode_user(payload) if payload is not None else None
+        if user is not None:
+            self.local.set(email, user)
+
+        return user
+
+    async def set(self, email: str, user: User, generation: Optional[str] = None) -> Optional[User]:
+        """
+        The set function stores the user together with its expiration time (one SET ... EX command),
+        or, given the generation read before the user was loaded, only if the user was not invalidated since then
+        (one script).
+
+        :param email: str: The email of the user
+        :param user: User: The user to cache
+        :param generation: Optional[str]: The generation of the user read before the load ('' - none yet)
+        :return: The cached projection of the user (the same as the other workers read from Redis),
+                 None if the user was invalidated during the load (nothing is stored)
+        """
+        key, payload = self.key(email), encode_user(user)
+        if generation is None:
+            await self.redis(self.client.set, key, payload, ex=self.ttl)
+
+        else:
+            stored = await self.redis(
+                                      self.client.eval,
+                                      self.set_script,
+                                      2,
+                                      key,
+                                      f'{key}:gen',
+                                      generation,
+                                      payload,
+                                      self.ttl
+                                      )
+            if not stored:
+                return None
+
+        cached = decode_user(payload)
+        self.local.set(email, cached)
+
+        return cached
+
+    def should_refresh(self, remaining: float) -> bool:
+        """
+        The should_refresh function decides whether a lookup reloads an entry which expires in remaining seconds:
+        the probability is exp(-remaining / refresh_ahead), so a hot entry is reloaded by one of its lookups
+        before it expires, and a cold one simply expires.
+
+        :param remaining: float: Seconds before the entry expires
+        :return: True if the lookup has to reload the entry
+        """
+        if remaining <= 0 or self.refresh_ahead <= 0:
+            return False
+
+        return remaining < -self.refresh_ahead * math.log(1.0 - random.random())
+
+    async def get_or_load(self, email: str, loader: Callable[[], Awaitable[Optional[User]]]) -> Optional[User]:
+        """
+        The get_or_load function returns the cached user, or loads it with the loader (e.g. from the database)
+        and caches it. One GET + PTTL (+ generation) round trip per lookup which misses the local LRU.
+        The Redis failures are not raised: the user is loaded (once) and not cached, the errors of the loader are.
+
+        :param email: str: The email of the user
+        :param loader: Callable[[], Awaitable[Optional[User]]]: Loads the user, returns None for an unknown user
+        :return: The user or None
+        """
+        user = self.local.get(email)
+        if user is not None:
+            return user
+
+        try:
+            payload, pttl, generation = await self.redis(self.read, self.key(email))
+
+        except REDIS_ERRORS as error:
+            logging.warning(f'User cache is not read, the user is loaded. error:\n{error}')
+            return await loader()
+
+        user = decode_user(payload) if payload is not None else None
+        if user is not None:
+            if email in self._flights or not self.should_refresh(pttl / 1000):
+                self.local.set(email, user)
+                return user
+
+            self.refreshes += 1
+
+        generation = generation.decode('utf-8') if isinstance(generation, bytes) else (generation or '')
+
+        return await self.single_flight(email, loader, user, generation)
+
+    async def single_flight(
+                            self,
+                            email: str,
+                            loader: Callable[[], Awaitable[Optional[User]]],
+                            current: Optional[User] = None,
+                            generation: Optional[str] = None
+                            ) -> Optional[User]:
+        """
+        The single_flight function runs the loader once per user in the worker: the concurrent calls for the same
+        user wait for the running load and take its result (or load on their own if it failed).
+
+        :param email: str: The email of the user
+        :param loader: Callable[[], Awaitable[Optional[User]]]: Loads the user
+        :param current: Optional[User]: The cached user being refreshed early, None on a miss
+        :param generation: Optional[str]: The generation of the user read before the load
+        :return: The user or None
+        """
+        flight = self._flights.get(email)
+        if flight is not None:
+            await flight.done.wait()
+            if flight.loaded:
+                return flight.user
+
+            return await self.single_flight(email, loader, current, generation)
+
+        flight = self._flights[email] = Flight()
+        try:
+            flight.user = await self.load(email, loader, current, generation)
+            flight.loaded = True
+
+        finally:
+            del self._flights[email]
+            flight.done.set()
+
+        return flight.user
+
+    async def load(
+                   self,
+                   email: str,
+                   loader: Callable[[], Awaitable[Optional[User]]],
+                   current: Optional[User] = None,
+                   generation: Optional[str] = None
+                   ) -> Optional[User]:
+        """
+        The load function runs the loader under a short Redis lock, so one worker at a time loads the user.
+        If another worker holds the lock, an early refresh keeps the current user, and a miss waits up to lock_wait
+        seconds for the entry of the other worker (and loads the user itself if the entry does not appear).
+        The loaded user is stored only if the generation has not changed (see set).
+
+        :param email: str: The email of the user
+        :param loader: Callable[[], Awaitable[Optional[User]]]: Loads the user
+        :param current: Optional[User]: The cached user being refreshed early, None on a miss
+        :param generation: Optional[str]: The generation of the user read before the load
+        :return: The user or None
+        """
+        key = self.key(email)
+        lock, token = f'{key}:lock', secrets.token_hex(8)
+        locked, reachable = False, True
+        try:
+            locked = bool(await self.redis(self.client.set, lock, token, nx=True, px=int(self.lock_timeout * 1000)))
+
+        except REDIS_ERRORS as error:
+            logging.warning(f'User cache is not locked, the user is loaded. error:\n{error}')
+            reachable = False  # no entry of another worker to wait for
+
+        if not locked and reachable:
+            if current is not None:
+                self.local.set(email, current)
+                return current
+
+            deadline = time.monotonic() + self.lock_wait
+            try:
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(min(0.05, self.lock_wait))
+                    user = await self.get(email)
+                    if user is not None:
+                        return user
+
+            except REDIS_ERRORS as error:
+                logging.warning(f'User cache is not read, the user is loaded. error:\n{error}')
+
+        try:
+            self.loads += 1
+            user = await loader()
+            if user is None:
+                return None
+
+            try:
+                cached = await self.set(email, user, generation)
+
+            except REDIS_ERRORS as error:
+                logging.warning(f'User is not cached. error:\n{error}')
+                return user
+
+            return cached if cached is not None else user
+
+        finally:
+            if locked:
+                try:
+                    await self.redis(self.client.eval, self.unlock_script, 1, lock, token)
+
+                except REDIS_ERRORS as error:
+                    logging.warning(f'User cache lock is left to expire. error:\n{error}')
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops the cached user after a change of the user: the generation of the user
+        is bumped (the loads running now do not store their users), the Redis entry is deleted
+        and the email is published to the other workers (one pipelined round trip through the breaker).
+        The local entry is dropped even if the Redis call fails (the error is raised).
+
+        :param email: str: The email of the changed user
+        :return: None
+        """
+        self.local.discard(email)
+        await self.redis(self.publish_invalidation, email)
+
+    async def publish_invalidation(self, email: str) -> None:
+        """
+        The publish_invalidation function bumps the generation of the user, deletes the Redis entry
+        and publishes the email on the channel.
+
+        :param email: str: The email of the changed user
+        :return: None
+        """
+        key = self.key(email)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.incr(f'{key}:gen')
+            pipe.expire(f'{key}:gen', self.ttl)  # outlives the loads which read the previous generation
+            pipe.delete(key)
+            pipe.publish(self.channel, email)
+            await pipe.execute()
+
+    async def listen(self) -> None:
+        """
+        The listen function subscribes to the invalidation channel and drops the local entries of the published
+        emails until the subscription fails.
+
+        :return: None
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            # the missed invalidations are unknown: start from an empty local cache
+            self.local.clear()
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    data = message['data']
+                    self.local.discard(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+        finally:
+            await pubsub.reset()
+
+    async def watch(self, retry_after: float = 1.0) -> None:
+        """
+        The watch function keeps listen running (as a background task of the application), a lost subscription
+        is restored after retry_after seconds.
+
+        :param retry_after: float: Seconds before the next subscription attempt
+        :return: None
+        """
+        while True:
+            try:
+                await self.listen()
+
+            except (RedisError, OSError) as error:
+                logging.error(f'User cache invalidations are not received. error:\n{error}')
+                self.local.clear()
+
+            await asyncio.sleep(retry_after)
+
+
+user_cache = UserCache(
+                       redis_client,
+                       ttl=settings.user_cache_ttl,
+                       local=LocalLRU(settings.user_cache_local_size, settings.user_cache_local_ttl),
+                       channel=settings.user_cache_channel,
+                       refresh_ahead=settings.user_cache_refresh_ahead,
+                       lock_timeout=settings.user_cache_lock_timeout,
+                       lock_wait=settings.user_cache_lock_wait,
+                       breaker=redis_breaker
+                       )
+
+
+def benchmark(rounds: int = 100_000) -> dict:
+    """
+    The benchmark function compares the payload size and the decode time of encode_user with the pickled
+    User of the previous cache format.
+
+    :param rounds: int: How many times each payload is decoded
+    :return: A dict with the sizes (bytes) and the decode times (microseconds per payload)
+    """
+    user = User(
+                id=123456,
+                username='Example_Name',
+                email='test_email@ukr.com',
+                password='$2b$12$' + 'x' * 53,
+                created_at=datetime(2023, 4, 18, 20, 23, 20),
+                avatar='https://www.gravatar.com/avatar/00000000000000000000000000000000',
+                refresh_token='x' * 180,
+                confirmed=True
+                )
+    pickled = pickle.dumps(user)
+    compact = encode_user(user)
+
+    return {
+            'pickle_bytes': len(pickled),
+            'compact_bytes': len(compact),
+            'pickle_decode_us': round(timeit.timeit(lambda: pickle.loads(pickled), number=rounds) / rounds * 1e6, 3),
+            'compact_decode_us': round(timeit.timeit(lambda: decode_user(compact), number=rounds) / rounds * 1e6, 3),
+            }
+
+
+if __name__ == '__main__':
+    # python -m src.services.user_cache
+    print(benchmark())
@@ -1,13 +1,19 @@
 
 from datetime import date
+import fakeredis
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.database.models import Base, User
-from src.database.db_connect import get_db
+from src.database.db_connect import get_db, to_async_url
+from src.routes.contacts import get_read_db
+from src.services.circuit_breaker import redis_breaker
+from src.services.redis_client import redis_pool
 
 
 # memory is not usedmemory is not used!!! Unfortunately. # 'sqlite:///:memory:' :
@@ -18,6 +24,25 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# the application works through the async driver (aiosqlite) with the same test.db,
+# NullPool - TestClient can run each request in its own event loop
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+# all the Redis consumers share redis_pool: its connections go to an in-process fake Redis (Lua by lupa),
+# so the tests neither need nor touch a real one
+redis_pool.connection_class = fakeredis.aioredis.FakeConnection
+redis_pool.connection_kwargs.update(server=fakeredis.FakeServer(), password=None)
+
+
+@pytest.fixture(autouse=True)
+def reset_redis_breaker():
+    # the breaker is shared by the worker: a test which opens it must not fail the next ones
+    redis_breaker.reset()
+    yield
+    redis_breaker.reset()
+
 
 @pytest.fixture(scope='module')
 def session():
@@ -37,15 +62,20 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
+    async def override_get_db():
         try:
-            yield session
+            async with TestingAsyncSessionLocal() as db:
+                yield db
         finally:
             session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
-    yield TestClient(app)
+    # the context runs the startup/shutdown handlers and all the requests in one event loop,
+    # the shared Redis pool keeps its connections in that loop
+    with TestClient(app) as test_client:
+        yield test_client
 
 
 @pytest.fixture(scope='module')
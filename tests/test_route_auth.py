@@ -65,14 +65,28 @@ def test_login_fail(client, session, user):  # split into several?
 
 def test_refresh_token_ok(client, session, user):
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    session.commit()
+
+    response = client.post('api/auth/login', data={'username': user.get('email'), 'password': user.get('password')})
+    login_refresh_token = response.json()['refresh_token']
 
-    headers = {'Authorization': f'Bearer {current_user.refresh_token}'}
+    headers = {'Authorization': f'Bearer {login_refresh_token}'}
     response = client.get('api/auth/refresh_token', headers=headers)
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json()['token_type'] == 'bearer'  # m.TOKEN_TYPE
     assert response.json()['access_token'] is not None
     assert response.json()['refresh_token'] is not None
+
+    # the rotated token is reused: the whole family is revoked
+    next_refresh_token = response.json()['refresh_token']
+    response = client.get('api/auth/refresh_token', headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json()['detail'] == m.INCORRECT_REFRESH_TOKEN
+
+    response = client.get('api/auth/refresh_token', headers={'Authorization': f'Bearer {next_refresh_token}'})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
   
 
 def test_refresh_token_fail(client, user):
@@ -93,6 +107,26 @@ def test_refresh_token_fail(client, user):
     assert response.json()['detail'] == m.INCORRECT_REFRESH_TOKEN
 
 
+def test_logout_ok(client, session, user):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    session.commit()
+
+    response = client.post('api/auth/login', data={'username': user.get('email'), 'password': user.get('password')})
+    access_token, refresh_token = response.json()['access_token'], response.json()['refresh_token']
+
+    response = client.post('api/auth/logout', headers={'Authorization': f'Bearer {access_token}'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['message'] == m.MSG_LOGGED_OUT
+
+    # the access token and the refresh tokens of its family are revoked
+    response = client.get('api/contacts/', headers={'Authorization': f'Bearer {access_token}'})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.get('api/auth/refresh_token', headers={'Authorization': f'Bearer {refresh_token}'})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
 def test_confirmed_email_ok(client, session, user):
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = False
@@ -0,0 +1,104 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import fakeredis
+from fastapi import status
+
+from src.conf.config import settings
+from src.database.pool_monitor import PoolMonitor
+from src.services.auth import auth_service
+from src.services.redis_client import MonitoredConnectionPool
+
+
+def test_db_pool_stats_forbidden(client):
+    response = client.get('api/internal/db/pool')
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_db_pool_stats(client, monkeypatch):
+    monkeypatch.setattr(settings, 'internal_hosts', 'testclient')
+
+    response = client.get('api/internal/db/pool')
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert 'pool' in data
+    assert 'checkouts' in data
+    assert 'wait_max_s' in data
+    assert 'le_inf' in data['wait_histogram']
+
+    response = client.post('api/internal/db/pool/reset')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get('api/internal/db/pool').json()['checkouts'] == 0
+
+
+def test_pool_monitor_histogram():
+    monitor = PoolMonitor()
+    [monitor.observe(seconds) for seconds in (0.0005, 0.003, 0.003, 20)]
+    stats = monitor.snapshot()
+    assert stats['checkouts'] == 4
+    assert stats['wait_max_s'] == 20
+    assert stats['wait_histogram']['le_0.001'] == 1
+    assert stats['wait_histogram']['le_0.005'] == 2
+    assert stats['wait_histogram']['le_inf'] == 1
+
+
+def test_token_cache_stats(client, monkeypatch):
+    monkeypatch.setattr(settings, 'internal_hosts', 'testclient')
+
+    response = client.get('api/internal/auth/token-cache')
+    assert response.status_code == status.HTTP_200_OK
+    assert {'size', 'hits', 'misses', 'hit_ratio'} <= response.json().keys()
+
+
+def test_redis_pool_stats(client, monkeypatch):
+    monkeypatch.setattr(settings, 'internal_hosts', 'testclient')
+
+    response = client.get('api/internal/redis/pool')
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data['max_connections'] == settings.redis_max_connections
+    assert data['in_use'] + data['idle'] == data['created']
+
+    response = client.post('api/internal/redis/pool/reset')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get('api/internal/redis/pool').json()['timeouts'] == 0
+
+
+def test_redis_pool_gauges():
+    async def checkouts():
+        pool = MonitoredConnectionPool(
+                                       connection_class=fakeredis.aioredis.FakeConnection,
+                                       server=fakeredis.FakeServer(),
+                                       max_connections=4
+                                       )
+        first = await pool.get_connection('PING')
+        second = await pool.get_connection('PING')
+        in_use = pool.snapshot()
+        await pool.release(first)
+        return in_use, pool.snapshot()
+
+    in_use, released = asyncio.run(checkouts())
+    assert (in_use['created'], in_use['in_use'], in_use['idle']) == (2, 2, 0)
+    assert (released['created'], released['in_use'], released['idle']) == (2, 1, 1)
+    assert released['checkouts'] == 2
+
+
+def test_revoke_sessions_requires_admin_token(client, monkeypatch):
+    monkeypatch.setattr(settings, 'internal_hosts', 'testclient')
+    monkeypatch.setattr(auth_service, 'revoke_user_sessions', AsyncMock(return_value=1700000000))
+
+    # the allowed host alone is not enough, and the endpoint is disabled while no token is configured
+    response = client.post('api/internal/users/999/revoke-sessions', headers={'X-Admin-Token': ''})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    monkeypatch.setattr(settings, 'internal_admin_token', 'admin-secret')
+    response = client.post('api/internal/users/999/revoke-sessions')
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response = client.post('api/internal/users/999/revoke-sessions', headers={'X-Admin-Token': 'wrong'})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    auth_service.revoke_user_sessions.assert_not_awaited()
+
+    response = client.post('api/internal/users/999/revoke-sessions', headers={'X-Admin-Token': 'admin-secret'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'user_id': 999, 'not_before': 1700000000}
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import AsyncMock
+
+from redis.exceptions import DataError, NoScriptError, ResponseError, TimeoutError as RedisTimeoutError
+
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class TestCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+        self.call = AsyncMock(side_effect=ConnectionRefusedError('refused'))
+
+    async def test_opens_after_failures(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                await self.breaker.call(self.call)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            await self.breaker.call(self.call)
+        self.assertEqual(self.call.await_count, 2)
+        self.assertEqual(self.breaker.snapshot()['rejected'], 1)
+
+    async def test_half_open(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                await self.breaker.call(self.call)
+
+        self.breaker.reset_timeout = 0
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.call.side_effect = None
+        self.call.return_value = 'PONG'
+        self.assertEqual(await self.breaker.call(self.call), 'PONG')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_other_errors_do_not_count(self):
+        self.call.side_effect = ValueError('bad argument')
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                await self.breaker.call(self.call)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_command_errors_do_not_count(self):
+        for error in (ResponseError('WRONGTYPE'), NoScriptError('NOSCRIPT'), DataError('invalid input')):
+            self.call.side_effect = error
+            for _ in range(3):
+                with self.assertRaises(type(error)):
+                    await self.breaker.call(self.call)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.call.side_effect = RedisTimeoutError('timeout')  # an outage
+        for _ in range(2):
+            with self.assertRaises(RedisTimeoutError):
+                await self.breaker.call(self.call)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
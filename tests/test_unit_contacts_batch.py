@@ -0,0 +1,96 @@
+from datetime import date
+import os
+import tempfile
+import unittest
+from unittest.mock import ANY, MagicMock
+
+import fakeredis
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import remove_contacts, update_contacts
+from src.schemes import BatchStatus, ContactBatchUpdateModel, ContactPartialModel
+from src.services.auth import auth_service
+from src.services.circuit_breaker import CircuitBreaker
+from src.services.rate_limit import SlidingWindowRateLimiter
+
+
+class TestContactsBatch(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(
+                                          f'sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, "batch.db")}',
+                                          poolclass=NullPool
+                                          )
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        self.session_maker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        async with self.session_maker() as db:
+            self.user = User(id=1, username='user', email='user@mail.com', password='hash', contacts_count=3)
+            db.add_all([self.user, User(id=2, username='other', email='other@mail.com', password='hash')])
+            for i in range(3):
+                db.add(Contact(id=i+1, name=f'Name{i}', last_name='Last', email=f'contact{i}@mail.com', phone=i+1,
+                               birthday=date(1990, 1, 1), user_id=1))
+            db.add(Contact(id=4, name='Foreign', last_name='Foreign', email='foreign@mail.com', phone=9, user_id=2))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    async def test_update_contacts(self):
+        async with self.session_maker() as db:
+            changes = ContactPartialModel(description='bulk', birthday=date(1990, 12, 31))
+            report = await update_contacts([1, 2, 2, 4, 5], changes, self.user, db)
+            self.assertEqual((report.affected, report.not_found), (2, 2))
+            self.assertEqual(
+                             [(result.id, result.status) for result in report.results],
+                             [(1, BatchStatus.updated), (2, BatchStatus.updated),
+                              (4, BatchStatus.not_found), (5, BatchStatus.not_found)]  # 4 belongs to another user
+                             )
+            contacts = (await db.scalars(select(Contact).order_by(Contact.id))).all()
+            self.assertEqual([contact.description for contact in contacts][:3], ['bulk', 'bulk', None])
+            self.assertEqual(contacts[0].birthday_ordinal, 1231)
+            self.assertIsNone(contacts[3].description)
+
+    async def test_update_contacts_duplicate(self):
+        async with self.session_maker() as db:
+            with self.assertRaises(HTTPException) as context:
+                await update_contacts([1, 2], ContactPartialModel(email='same@mail.com'), self.user, db)
+            self.assertEqual(context.exception.status_code, 409)
+            self.assertEqual(await db.scalar(select(Contact.email).filter_by(id=1)), 'contact0@mail.com')
+
+    async def test_remove_contacts(self):
+        async with self.session_maker() as db:
+            report = await remove_contacts([1, 3, 4], self.user, db)
+            self.assertEqual((report.affected, report.not_found), (2, 1))
+            self.assertEqual((await db.scalars(select(Contact.id).order_by(Contact.id))).all(), [2, 4])
+            self.assertEqual(await db.scalar(select(User.contacts_count).filter_by(id=1)), 1)
+
+    def test_update_needs_changes(self):
+        with self.assertRaises(ValidationError):
+            ContactBatchUpdateModel(ids=[1], changes={})
+
+
+class TestBatchRateLimit(unittest.IsolatedAsyncioTestCase):
+
+    async def test_weight(self):
+        client = fakeredis.aioredis.FakeRedis()
+        limiter = SlidingWindowRateLimiter(client, 10, 60, prefix='ratelimit:batch', breaker=CircuitBreaker('test'))
+        token = await auth_service.create_access_token(data={'sub': 'user@mail.com', 'uid': 7})
+        request = MagicMock(headers={'Authorization': f'Bearer {token}'})
+        response = MagicMock(headers={})
+        await limiter.charge(request, response, 7)
+        self.assertEqual(response.headers['RateLimit-Remaining'], '3')
+        self.assertEqual(await client.keys('ratelimit:batch:{user:7}:*'), [ANY])  # by user, not by address
+        with self.assertRaises(HTTPException) as context:
+            await limiter.charge(request, MagicMock(headers={}), 7)
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertIn('Retry-After', context.exception.headers)
+        await limiter.charge(request, MagicMock(headers={}), 3)  # the rest of the budget
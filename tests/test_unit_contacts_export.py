@@ -0,0 +1,64 @@
+from datetime import date
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import stream_contacts
+from src.schemes import ContactsFormat
+from src.services.contacts_export import export_chunks
+
+
+class TestExportContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(
+                                          f'sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, "export.db")}',
+                                          poolclass=NullPool
+                                          )
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        self.session_maker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        async with self.session_maker() as db:
+            self.user = User(id=1, username='user', email='user@mail.com', password='hash')
+            db.add_all([self.user, User(id=2, username='other', email='other@mail.com', password='hash')])
+            for i in range(5):
+                db.add(Contact(
+                               name=f'Name{i}',
+                               last_name='Last, "quoted"',
+                               email=f'contact{i}@mail.com',
+                               phone=i+1,
+                               birthday=date(1990, 1, i+1),
+                               description='-',
+                               user_id=1
+                               ))
+            db.add(Contact(name='Foreign', last_name='Foreign', email='foreign@mail.com', phone=9, user_id=2))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    async def export(self, export_format: ContactsFormat) -> list[bytes]:
+        async with self.session_maker() as db:
+            return [chunk async for chunk in export_chunks(stream_contacts(self.user, db, 2), export_format)]
+
+    async def test_ndjson(self):
+        chunks = await self.export(ContactsFormat.ndjson)
+        self.assertEqual(len(chunks), 3)  # partitions of 2 rows
+        contacts = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([contact['name'] for contact in contacts], [f'Name{i}' for i in range(5)])
+        self.assertEqual(contacts[0]['birthday'], '1990-01-01')
+        self.assertEqual(contacts[0]['last_name'], 'Last, "quoted"')
+
+    async def test_csv(self):
+        lines = b''.join(await self.export(ContactsFormat.csv)).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,last_name,email,phone,birthday,description')
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], '1,Name0,"Last, ""quoted""",contact0@mail.com,1,1990-01-01,-')
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import import_contacts
+from src.schemes import ContactsFormat, ImportStatus
+from src.services.contacts_import import format_by_content_type, iter_lines, parse_contacts
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(iterator) -> list:
+    return [item async for item in iterator]
+
+
+CSV_BODY = (
+            'name,last_name,email,phone,birthday,description\r\n'
+            'Alice,Smith,alice@mail.com,1001,1990-01-02,friend\r\n'
+            'Bob,Brown,bob@mail.com,1002,1991-03-04,\r\n'
+            'Bad,Row,not-an-email,1003,1992-05-06,x\r\n'
+            'Alice,Other,alice@mail.com,1004,1993-07-08,same email\r\n'
+            '\r\n'
+            'Carol,"Jones, Jr",carol@mail.com,1005,1994-09-10,"quoted, comma"\r\n'
+            ).encode()
+
+
+class TestParseContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iter_lines_across_chunks(self):
+        body = 'first\nsecond line\nпричал\n'.encode()
+        chunks = [body[i:i + 3] for i in range(0, len(body), 3)]  # splits the lines and the UTF-8 characters
+        self.assertEqual(await collect(iter_lines(stream(*chunks))), ['first', 'second line', 'причал'])
+
+    async def test_csv(self):
+        records = await collect(parse_contacts(iter_lines(stream(CSV_BODY)), ContactsFormat.csv))
+        self.assertEqual([row for row, _, _ in records], [1, 2, 3, 4, 5])
+        self.assertEqual(records[0][1].email, 'alice@mail.com')
+        self.assertEqual(records[1][1].description, '-')  # empty value - the default
+        self.assertIsNone(records[2][1])
+        self.assertIn('email', records[2][2])
+        self.assertEqual(records[4][1].last_name, 'Jones, Jr')
+
+    async def test_ndjson(self):
+        body = b'{"name": "Alice", "email": "alice@mail.com", "phone": 1, "birthday": "1990-01-02"}\n[1]\n{oops\n'
+        records = await collect(parse_contacts(iter_lines(stream(body)), ContactsFormat.ndjson))
+        self.assertEqual(records[0][1].name, 'Alice')
+        self.assertEqual(records[1][2], 'a JSON object is expected')
+        self.assertTrue(records[2][2].startswith('invalid JSON'))
+
+    def test_format_by_content_type(self):
+        self.assertEqual(format_by_content_type('text/csv; charset=utf-8'), ContactsFormat.csv)
+        self.assertEqual(format_by_content_type('application/x-ndjson'), ContactsFormat.ndjson)
+        self.assertIsNone(format_by_content_type('application/json'))
+
+
+class TestImportContacts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(
+                                          f'sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, "import.db")}',
+                                          poolclass=NullPool
+                                          )
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        self.session_maker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        async with self.session_maker() as db:
+            self.user = User(id=1, username='user', email='user@mail.com', password='hash')
+            db.add(self.user)
+            db.add(Contact(name='Bob', last_name='Brown', email='bob@mail.com', phone=1, user_id=1))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    async def test_import_report(self):
+        async with self.session_maker() as db:
+            report = await import_contacts(
+                                           parse_contacts(iter_lines(stream(CSV_BODY)), ContactsFormat.csv),
+                                           self.user,
+                                           db,
+                                           batch_size=2
+                                           )
+            statuses = [result.status for result in report.rows]
+            self.assertEqual(statuses, [
+                                        ImportStatus.created,
+                                        ImportStatus.duplicate,  # already in the database
+                                        ImportStatus.invalid,
+                                        ImportStatus.duplicate,  # repeats the email of row 1
+                                        ImportStatus.created,
+                                        ])
+            self.assertEqual((report.created, report.duplicates, report.invalid), (2, 2, 1))
+            self.assertEqual(await db.scalar(select(func.count()).select_from(Contact)), 3)
+            self.assertEqual(await db.scalar(select(User.contacts_count)), 2)
+            alice = await db.scalar(select(Contact).filter_by(email='alice@mail.com'))
+            self.assertEqual(report.rows[0].id, alice.id)
+            self.assertEqual(alice.birthday_ordinal, 102)
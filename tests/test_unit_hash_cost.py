@@ -0,0 +1,37 @@
+import unittest
+from unittest.mock import patch
+
+from src.services.auth import password_context
+from src.services.hash_cost import calibrate, cost_table
+
+
+def fake_measure(rounds: int, samples: int = 3) -> float:
+    """Every round doubles the time: 60 ms at cost 10."""
+    return 0.06 * 2 ** (rounds - 10)
+
+
+class TestHashCost(unittest.TestCase):
+
+    @patch('src.services.hash_cost.measure', side_effect=fake_measure)
+    def test_calibrate(self, measure):
+        self.assertEqual(calibrate(250, min_rounds=10, max_rounds=16), 12)
+        self.assertEqual(measure.call_args.args[0], 13)  # stops at the first cost over the budget
+        self.assertEqual(calibrate(10, min_rounds=10), 10)  # never below the floor
+        self.assertEqual(calibrate(10_000, min_rounds=10, max_rounds=14), 14)
+
+    @patch('src.services.hash_cost.measure', side_effect=fake_measure)
+    def test_cost_table(self, measure):
+        table = cost_table(10, 16, limit_ms=500)
+        self.assertEqual([row['rounds'] for row in table], [10, 11, 12, 13, 14])  # 14 is the first over the limit
+        self.assertEqual(table[0], {'rounds': 10, 'ms': 60.0, 'per_second': 16.7})
+
+    def test_outdated_cost_rehashed(self):
+        weak_hash = password_context(4).hash('secret')
+        context = password_context(5)
+        verified, new_hash = context.verify_and_update('secret', weak_hash)
+        self.assertTrue(verified)
+        self.assertIn('$05$', new_hash)
+        self.assertEqual(context.verify_and_update('secret', new_hash), (True, None))
+        self.assertEqual(context.verify_and_update('wrong', weak_hash), (False, None))
+        # a stronger hash is kept
+        self.assertFalse(context.needs_update(password_context(6).hash('secret')))
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.hashing_pool import HashingPool
+
+
+class TestHashingPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.pool = HashingPool(max_workers=1, max_queue=1)
+
+    async def asyncTearDown(self):
+        self.pool.shutdown()
+
+    async def test_run_off_the_loop(self):
+        loop_thread = threading.get_ident()
+        self.assertNotEqual(await self.pool.run(threading.get_ident), loop_thread)
+        self.assertEqual(self.pool.snapshot()['completed'], 1)
+        self.assertEqual(self.pool.snapshot()['in_flight'], 0)
+
+    async def test_loop_stays_free(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        await self.pool.run(time.sleep, 0.2)
+        task.cancel()
+        self.assertGreater(ticks, 5)
+
+    async def test_queue_full(self):
+        calls = [asyncio.create_task(self.pool.run(time.sleep, 0.1)) for _ in range(2)]
+        await asyncio.sleep(0)  # one call runs, one waits
+        self.assertEqual(self.pool.snapshot()['queued'], 1)
+        with self.assertRaises(HTTPException) as context:
+            await self.pool.run(time.sleep, 0.1)
+        self.assertEqual(context.exception.status_code, 503)
+        await asyncio.gather(*calls)
+        self.assertEqual(self.pool.snapshot()['rejected'], 1)
+
+    async def test_usable_after_shutdown(self):
+        self.pool.shutdown()
+        self.assertEqual(await self.pool.run(sum, [1, 2]), 3)
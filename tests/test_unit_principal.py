@@ -0,0 +1,33 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+
+from src.database.models import User
+from src.services.auth import auth_service
+
+
+class TestCurrentPrincipal(unittest.IsolatedAsyncioTestCase):
+
+    async def test_from_claims(self):
+        user = User(id=5, email='user@mail.com', username='user', confirmed=True)
+        token = await auth_service.create_access_token(data=auth_service.principal_claims(user))
+        with patch.object(auth_service.user_cache, 'get_or_load', AsyncMock()) as get_or_load:
+            principal = await auth_service.get_current_principal(token, db=None)
+            get_or_load.assert_not_awaited()  # no Redis, no database
+        self.assertEqual(
+                         (principal.id, principal.email, principal.username, principal.confirmed),
+                         (5, 'user@mail.com', 'user', True)
+                         )
+
+    async def test_without_claims(self):
+        token = await auth_service.create_access_token(data={'sub': 'user@mail.com'})
+        user = User(id=5, email='user@mail.com')
+        with patch.object(auth_service.user_cache, 'get_or_load', AsyncMock(return_value=user)):
+            self.assertIs(await auth_service.get_current_principal(token, db=None), user)
+
+    async def test_wrong_scope(self):
+        token = await auth_service.create_refresh_token(data={'sub': 'user@mail.com', 'uid': 5})
+        with self.assertRaises(HTTPException) as context:
+            await auth_service.get_current_principal(token, db=None)
+        self.assertEqual(context.exception.status_code, 401)
@@ -0,0 +1,140 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import fakeredis
+from fastapi import HTTPException
+
+from src.services.auth import auth_service
+from src.services.circuit_breaker import CircuitBreaker
+from src.services.rate_limit import LocalTokenBuckets, SlidingWindowRateLimiter, user_or_ip
+
+
+def make_request(endpoint, headers=None):
+    request = MagicMock(scope={'endpoint': endpoint}, headers=headers or {})
+    request.client.host = '10.0.0.1'
+    return request
+
+
+async def search_by_like_fields_or():
+    pass
+
+
+class TestSlidingWindowRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.script = AsyncMock(return_value=[1, 110, 30000])
+        self.client = MagicMock(register_script=MagicMock(return_value=self.script))
+        self.limiter = SlidingWindowRateLimiter(
+                                                self.client,
+                                                budget=120,
+                                                seconds=60,
+                                                costs={'search_by_like_fields_or': 10},
+                                                identifier=AsyncMock(return_value='user:1'),
+                                                breaker=CircuitBreaker('test')
+                                                )
+
+    async def test_cost_and_headers(self):
+        response = MagicMock(headers={})
+        await self.limiter(make_request(search_by_like_fields_or), response)
+        self.script.assert_awaited_once_with(keys=['ratelimit:{user:1}'], args=[120, 60000, 10])
+        self.assertEqual(response.headers['RateLimit-Limit'], '120')
+        self.assertEqual(response.headers['RateLimit-Remaining'], '110')
+        self.assertEqual(response.headers['RateLimit-Reset'], '30')
+        self.assertEqual(self.limiter.cost('get_contact'), 1)
+
+    async def test_rejected(self):
+        self.script.return_value = [0, 3, 1500]
+        with self.assertRaises(HTTPException) as context:
+            await self.limiter(make_request(search_by_like_fields_or), MagicMock(headers={}))
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(context.exception.headers['Retry-After'], '2')
+        self.assertEqual(context.exception.headers['RateLimit-Remaining'], '3')
+
+    async def test_redis_unreachable(self):
+        self.script.side_effect = ConnectionError('refused')
+        await self.limiter(make_request(search_by_like_fields_or), MagicMock(headers={}))  # fails open
+        self.assertEqual(self.limiter.failed_open, 1)
+
+        self.limiter.fail_open = False
+        with self.assertRaises(HTTPException) as context:
+            await self.limiter(make_request(search_by_like_fields_or), MagicMock(headers={}))
+        self.assertEqual(context.exception.status_code, 503)
+
+
+class TestLocalTokenBuckets(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.script = AsyncMock(return_value=[1, 100, 30000])
+        self.pipe = MagicMock(execute=AsyncMock(return_value=[[1, 80, 20000]]))
+        self.pipe.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.pipe.__aexit__ = AsyncMock(return_value=False)
+        self.client = MagicMock(
+                                register_script=MagicMock(return_value=self.script),
+                                pipeline=MagicMock(return_value=self.pipe)
+                                )
+        self.limiter = SlidingWindowRateLimiter(
+                                                self.client,
+                                                budget=120,
+                                                seconds=60,
+                                                identifier=AsyncMock(return_value='user:1'),
+                                                local=LocalTokenBuckets(share=0.1, ttl=5.0),
+                                                breaker=CircuitBreaker('test')
+                                                )
+
+    async def test_local_admission_and_flush(self):
+        request = make_request(search_by_like_fields_or)
+        await self.limiter(request, MagicMock(headers={}))  # Redis grants 10 local units
+        for _ in range(11):
+            await self.limiter(request, MagicMock(headers={}))
+        self.assertEqual(self.script.await_count, 2)  # the 11th request is checked by Redis again
+        self.assertEqual(self.limiter.local_hits, 10)
+        self.assertEqual(self.limiter.pending, {'ratelimit:{user:1}': 10})
+
+        await self.limiter.flush()
+        self.assertEqual(self.script.call_args.kwargs['args'], [120, 60000, 10, 1])  # charged even over the budget
+        self.assertIs(self.script.call_args.kwargs['client'], self.pipe)
+        self.assertEqual(self.limiter.pending, {})
+        self.assertEqual(self.limiter.local.take('ratelimit:{user:1}', 8).remaining, 72)
+
+    async def test_failed_flush_keeps_units(self):
+        self.limiter.pending = {'ratelimit:{user:1}': 10}
+        self.pipe.execute.side_effect = ConnectionError('refused')
+        with self.assertRaises(ConnectionError):
+            await self.limiter.flush()
+        self.limiter.pending['ratelimit:{user:1}'] += 2  # admitted while the flush was running
+        self.assertEqual(self.limiter.pending, {'ratelimit:{user:1}': 12})
+
+    async def test_flush_charges_overshoot(self):
+        client = fakeredis.aioredis.FakeRedis()
+        limiter = SlidingWindowRateLimiter(
+                                           client,
+                                           budget=10,
+                                           seconds=60,
+                                           identifier=AsyncMock(return_value='user:1'),
+                                           local=LocalTokenBuckets(share=0.5, ttl=5.0),
+                                           breaker=CircuitBreaker('test')
+                                           )
+        limiter.local.grant('ratelimit:{user:1}', 10, 60000)
+        limiter.pending = {'ratelimit:{user:1}': 15}  # admitted by several workers from their grants
+        await limiter.flush()
+        self.assertIsNone(limiter.local.take('ratelimit:{user:1}', 1))  # over the limit: no local grant
+        with self.assertRaises(HTTPException):
+            await limiter.charge(make_request(None), MagicMock(headers={}), 1)  # the overshoot is counted
+
+    def test_expired_grant(self):
+        buckets = LocalTokenBuckets(share=0.5, ttl=0.0)
+        buckets.grant('client', 100, 1000)
+        self.assertIsNone(buckets.take('client', 1))
+
+
+class TestUserOrIp(unittest.IsolatedAsyncioTestCase):
+
+    async def test_user(self):
+        token = await auth_service.create_access_token(data={'sub': 'user@mail.com', 'uid': 7})
+        request = make_request(None, {'Authorization': f'Bearer {token}'})
+        self.assertEqual(await user_or_ip(request), 'user:7')
+
+    async def test_ip(self):
+        self.assertEqual(await user_or_ip(make_request(None, {'Authorization': 'Bearer NOTOKEN'})), 'ip:10.0.0.1')
+        request = make_request(None, {'X-Forwarded-For': '192.168.1.5, 10.0.0.1'})
+        self.assertEqual(await user_or_ip(request), 'ip:192.168.1.5')
@@ -0,0 +1,28 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.services.refresh_tokens import RefreshTokenStore
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.client = MagicMock(set=AsyncMock(), eval=AsyncMock(return_value=1))
+        self.store = RefreshTokenStore(self.client)
+
+    async def test_start(self):
+        await self.store.start('family', 'jti1', 60)
+        self.client.set.assert_awaited_once_with('refresh:family', 'jti1', px=60000)
+
+    async def test_rotate(self):
+        self.assertEqual(await self.store.rotate('family', 'jti1', 'jti2', 60), RefreshTokenStore.ROTATED)
+        self.assertEqual(
+                         self.client.eval.call_args.args[1:],
+                         (1, 'refresh:family', 'jti1', 'jti2', '60000')
+                         )
+        self.client.eval.return_value = -1
+        self.assertEqual(await self.store.rotate('family', 'jti1', 'jti3', 60), RefreshTokenStore.REUSED)
+
+    async def test_revoke(self):
+        await self.store.revoke('family')
+        self.client.set.assert_awaited_once_with('refresh:family', 'revoked', keepttl=True, xx=True)
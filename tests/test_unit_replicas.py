@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.replicas import ReplicaRouter
+
+
+class TestReplicaRouter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """Three local SQLite files: the primary and two replicas, each knows its name."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        urls = {}
+        for name in ('primary', 'replica1', 'replica2'):
+            urls[name] = f'sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, name)}.db'
+            engine = create_async_engine(urls[name], poolclass=NullPool)
+            async with engine.begin() as connection:
+                await connection.execute(text('CREATE TABLE whoami (name VARCHAR)'))
+                await connection.execute(text('INSERT INTO whoami VALUES (:name)'), {'name': name})
+            await engine.dispose()
+
+        self.primary_engine = create_async_engine(urls['primary'], poolclass=NullPool)
+        self.router = ReplicaRouter(
+                                    [urls['replica1'], urls['replica2']],
+                                    async_sessionmaker(bind=self.primary_engine),
+                                    sticky_seconds=60,
+                                    retry_after=60,
+                                    poolclass=NullPool
+                                    )
+
+    async def asyncTearDown(self):
+        await self.router.dispose()
+        await self.primary_engine.dispose()
+        self.tmp_dir.cleanup()
+
+    async def whoami(self, user_id: int = 1) -> str:
+        async with self.router.session(user_id) as db:
+            return await db.scalar(text('SELECT name FROM whoami'))
+
+    async def test_round_robin(self):
+        self.assertEqual([await self.whoami() for _ in range(4)], ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    async def test_read_your_writes(self):
+        self.router.stick_to_primary(user_id=1)
+        self.assertEqual(await self.whoami(user_id=1), 'primary')
+        self.assertEqual(await self.whoami(user_id=2), 'replica1')
+
+    async def test_replica_down(self):
+        self.router.replicas[0].mark_down(retry_after=60)
+        self.assertEqual([await self.whoami() for _ in range(3)], ['replica2', 'replica2', 'replica2'])
+
+        self.router.replicas[1].mark_down(retry_after=60)
+        self.assertEqual(await self.whoami(), 'primary')
+
+    async def test_check_health(self):
+        broken = ReplicaRouter(
+                               [f'sqlite+aiosqlite:///{self.tmp_dir.name}/no_such_dir/replica.db'],
+                               async_sessionmaker(bind=self.primary_engine),
+                               poolclass=NullPool
+                               )
+        await broken.check_health()
+        self.assertFalse(broken.status()[0]['healthy'])
+        self.assertEqual(broken.status()[0]['failures'], 1)
+        await broken.dispose()
+
+        await self.router.check_health()
+        self.assertTrue(all(replica['healthy'] for replica in self.router.status()))
+
+
+if __name__ == '__main__':
+    unittest.main()
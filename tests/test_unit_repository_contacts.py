@@ -1,14 +1,18 @@
 from datetime import date
+from typing import Optional
 import unittest
 from unittest.mock import MagicMock
 from fastapi import HTTPException
 
 from fastapi_pagination import Page, Params
 from pydantic import EmailStr
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
+from src.repository.keyset import decode_cursor, encode_cursor
 from src.repository.contacts import (
+                                    birthday_ranges,
                                     get_contacts,
                                     get_contact,
                                     create_contact,
@@ -21,7 +25,7 @@ from src.repository.contacts import (
                                     search_by_like_fields_and,
                                     search_by_birthday_celebration_within_days,
                                     )
-from src.schemes import ContactModel, CatToNameModel
+from src.schemes import ContactCursorPage, ContactModel, CatToNameModel, TotalMode
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
@@ -69,19 +73,39 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     def part_string_in_dictionary_values(query_str: str, current_dict: dict):
         return [query_str for el in current_dict.values() if query_str in str(el)]
 
+    @staticmethod
+    def full_contacts() -> list[Contact]:
+        """Contacts with all the fields of ContactResponse (the keyset page validates its items)."""
+        return [Contact(
+                        id=i+1,
+                        name=f'nown{i}',
+                        last_name='Unknown',
+                        email=EmailStr(f'Unknown{i+1}@mail.com'),
+                        phone=i+1,
+                        birthday=date.today(),
+                        description='...'
+                        )
+                for i in range(TestContacts.TEST_RANGE)]
+
     def setUp(self):
         """
-         створюємо об'єкт MagicMock для заміни об'єкта Session у модульних тестах MagicMock(spec=Session).
-         У цьому випадку, MagicMock використовується для створення "фіктивного" об'єкта Session, 
-         а використання параметра spec=Session у конструкторі MagicMock вказує, що створюваний об'єкт 
-         матиме ті самі атрибути і методи, що й об'єкт Session
+         створюємо об'єкт MagicMock для заміни об'єкта AsyncSession у модульних тестах MagicMock(spec=AsyncSession).
+         У цьому випадку, MagicMock використовується для створення "фіктивного" об'єкта AsyncSession, 
+         а використання параметра spec=AsyncSession у конструкторі MagicMock вказує, що створюваний об'єкт 
+         матиме ті самі атрибути і методи, що й об'єкт AsyncSession
         """
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)  # async methods of AsyncSession become AsyncMock
         # self.user = User(id=1)
 
+    def paginated(self, total: Optional[int], items: list) -> None:
+        """Mock the two queries of paginate: SELECT count(*) (if total is given) and SELECT ... LIMIT ... OFFSET."""
+        count_result = MagicMock(**{'scalar_one.return_value': total})
+        items_result = MagicMock(**{'scalars.return_value.all.return_value': items})
+        self.session.execute.side_effect = [items_result] if total is None else [count_result, items_result]
+
     async def test_get_contacts(self):
-        self.session.query.return_value.filter.return_value.order_by.return_value.count.return_value = TestContacts.SIZE
-        self.session.query().filter().order_by().limit().offset().all.return_value = TestContacts.contacts
+        self.session.scalar.return_value = TestContacts.SIZE  # users.contacts_count
+        self.paginated(None, TestContacts.contacts)
         result = await get_contacts(
                                     user=self.user,
                                     db=self.session,
@@ -90,11 +114,77 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(result, Page)
         self.assertEqual(result.page, TestContacts.PAGE)
         self.assertEqual(result.total, TestContacts.SIZE)
+        self.assertFalse(result.total_is_estimate)
         self.assertEqual(len(result.items), TestContacts.TEST_RANGE)
         [self.assertEqual(result.items[i].email, f'Unknown{i+1}@mail.com') for i in range(len(result.items))]
+        self.assertEqual(self.session.execute.await_count, 1)  # no COUNT(*), the total is the counter
+
+    async def test_get_contacts_without_total(self):
+        self.paginated(None, TestContacts.contacts)
+        result = await get_contacts(
+                                    user=self.user,
+                                    db=self.session,
+                                    pagination_params=Params(page=TestContacts.PAGE, size=TestContacts.SIZE),
+                                    include_total=TotalMode.false
+                                    )
+        self.assertIsNone(result.total)
+        self.assertIsNone(result.pages)
+        self.assertEqual(len(result.items), TestContacts.TEST_RANGE)
+        self.session.scalar.assert_not_called()
+
+    async def test_search_estimated_total_falls_back_to_exact(self):
+        self.session.get_bind.return_value.dialect.name = 'sqlite'  # no planner statistics
+        self.paginated(TestContacts.SIZE, TestContacts.contacts)
+        result = await search_by_like_fields_or(
+                                                query_str=TestContacts.query_str,
+                                                user=self.user,
+                                                db=self.session,
+                                                pagination_params=Params(page=TestContacts.PAGE, size=TestContacts.SIZE),
+                                                include_total=TotalMode.estimate
+                                                )
+        self.assertEqual(result.total, TestContacts.SIZE)
+        self.assertFalse(result.total_is_estimate)
      
+    async def test_get_contacts_cursor(self):
+        contacts = TestContacts.full_contacts()
+        self.session.scalars.return_value = MagicMock(**{'all.return_value': contacts[:TestContacts.SIZE + 1]})
+        result = await get_contacts(
+                                    user=self.user,
+                                    db=self.session,
+                                    pagination_params=Params(page=TestContacts.PAGE, size=TestContacts.SIZE),
+                                    cursor=''
+                                    )
+        self.assertIsInstance(result, ContactCursorPage)
+        self.assertEqual(len(result.items), TestContacts.SIZE)
+        last = contacts[TestContacts.SIZE - 1]
+        self.assertEqual(decode_cursor(result.next_cursor), (last.name, last.id))
+        self.session.execute.assert_not_called()  # neither COUNT nor OFFSET
+
+    async def test_get_contacts_cursor_last_page(self):
+        contacts = TestContacts.full_contacts()
+        self.session.scalars.return_value = MagicMock(**{'all.return_value': contacts[TestContacts.SIZE:]})
+        result = await get_contacts(
+                                    user=self.user,
+                                    db=self.session,
+                                    pagination_params=Params(page=TestContacts.PAGE, size=TestContacts.SIZE),
+                                    cursor=encode_cursor('nown9', 10)
+                                    )
+        self.assertIsInstance(result, ContactCursorPage)
+        self.assertEqual(len(result.items), TestContacts.TEST_RANGE - TestContacts.SIZE)
+        self.assertIsNone(result.next_cursor)
+
+    async def test_get_contacts_invalid_cursor(self):
+        with self.assertRaises(HTTPException) as context:
+            await get_contacts(
+                               user=self.user,
+                               db=self.session,
+                               pagination_params=Params(page=TestContacts.PAGE, size=TestContacts.SIZE),
+                               cursor='not-a-cursor'
+                               )
+        self.assertEqual(context.exception.status_code, 400)
+
     async def test_get_contact_found(self):
-        self.session.query().filter().filter_by().first.return_value = TestContacts.contact
+        self.session.scalar.return_value = TestContacts.contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsInstance(result, Contact)
         self.assertEqual(result, TestContacts.contact)
@@ -102,57 +192,100 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             for el in TestContacts.contact.__dict__]
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().filter_by().first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_create_contact(self):
-        self.session.query().filter().filter_by().first.return_value = None
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        self.session.scalar.return_value = Contact(id=1, **TestContacts.body.dict(), user_id=1)  # RETURNING row
         result = await create_contact(body=TestContacts.body, user=self.user, db=self.session)
         [self.assertEqual(result.__dict__[el], TestContacts.body.__dict__[el]) for el in TestContacts.body.__dict__]
         self.assertTrue(hasattr(result, "id"))
+        self.assertEqual(self.session.scalar.await_count, 1)  # no SELECTs for the duplicates
+        self.assertIn('ON CONFLICT DO NOTHING', str(self.session.scalar.call_args.args[0]))
 
     async def test_create_contact_dublicat(self):
-        self.session.query().filter().filter_by().first.return_value = TestContacts.contact
+        self.session.get_bind.return_value.dialect.name = 'postgresql'
+        self.session.scalar.return_value = None  # the insert was skipped by a unique constraint
+        with self.assertRaises(HTTPException) as context:
+            await create_contact(body=TestContacts.body, user=self.user, db=self.session)
+        self.assertEqual(context.exception.status_code, 409)
+        self.session.commit.assert_not_called()
+        self.session.rollback.assert_not_called()  # nothing failed, the loaded objects stay valid
+
+    async def test_create_contact_dublicat_integrity_error(self):
+        self.session.get_bind.return_value.dialect.name = 'mysql'  # no ON CONFLICT
+        self.session.scalar.side_effect = IntegrityError('INSERT', {}, Exception('duplicate'))
         with self.assertRaises(HTTPException) as context:
             await create_contact(body=TestContacts.body, user=self.user, db=self.session)
-        self.assertTrue(context.exception)
+        self.assertEqual(context.exception.status_code, 409)
+        self.session.rollback.assert_awaited_once()
 
     async def test_remove_contact_found(self):
-        self.session.query().filter().filter_by().first.return_value = TestContacts.contact
+        self.session.scalar.return_value = TestContacts.contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsInstance(result, Contact)
         self.assertEqual(result, TestContacts.contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().filter_by().first.return_value = None
+        self.session.scalar.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_update_contact_found(self):
-        self.session.query().filter().filter_by().first.return_value = TestContacts.contact
+        self.session.scalar.return_value = TestContacts.contact
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=TestContacts.body, user=self.user, db=self.session)
         self.assertIsInstance(result, Contact)
         self.assertEqual(result, TestContacts.contact)
 
+    async def test_update_contact_replaces_all_fields(self):
+        self.session.scalar.return_value = TestContacts.contact
+        body = ContactModel(email=TestContacts.email, birthday=date.today())  # the rest are defaults
+        await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
+        params = self.session.scalar.call_args.args[0].compile().params
+        self.assertLessEqual(set(ContactModel.__fields__) | {'birthday_ordinal'}, params.keys())  # PUT, not PATCH
+        self.assertEqual(params['description'], '-')
+
     async def test_update_contact_not_found(self):
-        self.session.query().filter().filter_by().first.return_value = None
+        self.session.scalar.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=TestContacts.body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_change_name_contact(self):
         body = CatToNameModel(name='New_Name')
-        self.session.query().filter().filter_by().first.return_value = TestContacts.contact
+        renamed = Contact(user_id=1, id=1, name=body.name)  # the row returned by UPDATE ... RETURNING
+        self.session.scalar.return_value = renamed
         self.session.commit.return_value = None
         result = await change_name_contact(body=body, contact_id=1, user=self.user, db=self.session)
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.name, body.name)
-        self.assertEqual(result, TestContacts.contact)
+        self.assertEqual(result, renamed)
+        self.session.refresh.assert_not_called()
+
+    async def test_change_name_contact_dublicat_integrity_error(self):
+        self.session.scalar.side_effect = IntegrityError('UPDATE', {}, Exception('duplicate'))
+        with self.assertRaises(HTTPException) as context:
+            await change_name_contact(
+                                      body=CatToNameModel(name='New_Name'),
+                                      contact_id=1,
+                                      user=self.user,
+                                      db=self.session
+                                      )
+        self.assertEqual(context.exception.status_code, 409)
+        self.session.rollback.assert_awaited_once()
+
+    async def test_update_contact_dublicat_integrity_error(self):
+        self.session.scalar.side_effect = IntegrityError('UPDATE', {}, Exception('duplicate'))
+        with self.assertRaises(HTTPException) as context:
+            await update_contact(contact_id=1, body=TestContacts.body, user=self.user, db=self.session)
+        self.assertEqual(context.exception.status_code, 409)
+        self.session.rollback.assert_awaited_once()
 
     async def test_search_by_fields_and_not_found(self):
-        self.session.query().filter().filter_by().filter_by().filter_by().filter_by().first.return_value = None
+        self.session.scalar.return_value = None
         result = await search_by_fields_and(
                                             name=TestContacts.name, 
                                             last_name=TestContacts.last_name, 
@@ -164,7 +297,8 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(result)
 
     async def test_search_by_fields_and_found(self):
-        self.session.query().filter().filter_by().filter_by().first.return_value = TestContacts.contact
+        found = Contact(user_id=1, id=1, name=TestContacts.name, last_name='Unknown2', email=TestContacts.email)
+        self.session.scalar.return_value = found
         result = await search_by_fields_and(
                                             name=TestContacts.name, 
                                             last_name=None, 
@@ -176,14 +310,13 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.name, TestContacts.name)
         self.assertEqual(result.email, TestContacts.email)
-        self.assertEqual(result, TestContacts.contact)
+        self.assertEqual(result, found)
 
     async def test_search_by_fields_or_found(self):
-        self.session.query.return_value.filter.return_value.filter.return_value.count.return_value = TestContacts.SIZE
         sample = [contact
                   for contact in TestContacts.contacts
                   if TestContacts.part_string_in_dictionary_values(TestContacts.query_str, contact.__dict__)]
-        self.session.query().filter().filter().limit().offset().all.return_value = sample
+        self.paginated(TestContacts.SIZE, sample)
         result = await search_by_fields_or(
                                            query_str=TestContacts.query_str, 
                                            user=self.user, 
@@ -196,8 +329,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(result.items), 5)  # 10? TEST_RANGE // 10 + 1 because "query_str = 'nown1'"
 
     async def test_search_by_fields_or_not_found(self):
-        self.session.query.return_value.filter.return_value.filter.return_value.count.return_value = TestContacts.SIZE
-        self.session.query().filter().filter().limit().offset().all.return_value = []
+        self.paginated(TestContacts.SIZE, [])
         result = await search_by_fields_or(
                                            query_str=TestContacts.query_str, 
                                            user=self.user, 
@@ -210,11 +342,10 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.items, [])
 
     async def test_search_by_like_fields_or_found(self):
-        self.session.query.return_value.filter.return_value.filter.return_value.count.return_value = TestContacts.SIZE
         sample = [contact
                   for contact in TestContacts.contacts
                   if TestContacts.part_string_in_dictionary_values(TestContacts.query_str, contact.__dict__)]
-        self.session.query().filter().filter().limit().offset().all.return_value = sample
+        self.paginated(TestContacts.SIZE, sample)
         result = await search_by_like_fields_or(
                                                 query_str=TestContacts.query_str, 
                                                 user=self.user, 
@@ -227,8 +358,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(result.items), 5)  # TestContacts.TEST_RANGE
 
     async def test_search_by_like_fields_or_not_found(self):  
-        self.session.query.return_value.filter.return_value.filter.return_value.count.return_value = TestContacts.SIZE
-        self.session.query().filter().filter().limit().offset().all.return_value = []
+        self.paginated(TestContacts.SIZE, [])
         result = await search_by_like_fields_or(
                                                 query_str=TestContacts.query_str, 
                                                 user=self.user, 
@@ -241,8 +371,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.items, [])
 
     async def test_search_by_like_fields_and_found(self):
-        self.session.query().filter().filter().filter().count.return_value = TestContacts.SIZE
-        self.session.query().filter().filter().filter().limit().offset().all.return_value = TestContacts.contacts
+        self.paginated(TestContacts.SIZE, TestContacts.contacts)
         result = await search_by_like_fields_and(
                                                  part_name=TestContacts.name, 
                                                  part_last_name=None, 
@@ -261,8 +390,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(result.items), TestContacts.TEST_RANGE)
 
     async def test_search_by_like_fields_and_not_found(self):
-        self.session.query().filter().filter().filter().filter().filter().count.return_value = TestContacts.SIZE
-        self.session.query().filter().filter().filter().filter().filter().limit().offset().all.return_value = []
+        self.paginated(TestContacts.SIZE, [])
         result = await search_by_like_fields_and(
                                                  part_name=TestContacts.name, 
                                                  part_last_name=TestContacts.last_name, 
@@ -281,8 +409,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.items, [])
 
     async def test_search_by_birthday_celebration_within_days_found(self):
-        self.session.query.return_value.filter.return_value.filter.return_value.count.return_value = TestContacts.SIZE
-        self.session.query().filter().filter().limit().offset().all.return_value = TestContacts.contacts
+        self.paginated(TestContacts.SIZE, TestContacts.contacts)
         result = await search_by_birthday_celebration_within_days(
                                                                   meantime=TestContacts.meantime,
                                                                   user=self.user, 
@@ -298,8 +425,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(result.items), TestContacts.TEST_RANGE)
 
     async def test_search_by_birthday_celebration_within_days_not_found(self):
-        self.session.query.return_value.filter.return_value.filter.return_value.count.return_value = TestContacts.SIZE
-        self.session.query().filter().filter().limit().offset().all.return_value = []
+        self.paginated(TestContacts.SIZE, [])
         result = await search_by_birthday_celebration_within_days(
                                                                   meantime=TestContacts.meantime,
                                                                   user=self.user, 
@@ -314,6 +440,21 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.total, TestContacts.SIZE)
         self.assertEqual(result.items, [])
 
+    def test_birthday_ranges(self):
+        self.assertEqual(birthday_ranges(date(2026, 3, 1), 7), [(301, 308)])
+        self.assertEqual(birthday_ranges(date(2026, 12, 28), 7), [(1228, 1231), (101, 104)])  # across the year end
+        self.assertEqual(birthday_ranges(date(2026, 2, 28), 1), [(228, 301)])  # covers February 29
+        self.assertEqual(birthday_ranges(date(2026, 6, 1), 400), [(101, 1231)])
+        self.assertEqual(birthday_ranges(date(2026, 6, 1), -1), [])
+
+    def test_birthday_ordinal_follows_birthday(self):
+        contact = Contact(birthday=date(1990, 12, 31))
+        self.assertEqual(contact.birthday_ordinal, 1231)
+        contact.birthday = date(1990, 2, 9)
+        self.assertEqual(contact.birthday_ordinal, 209)
+        contact.birthday = None
+        self.assertIsNone(contact.birthday_ordinal)
+
 
 if __name__ == '__main__':
     unittest.main()
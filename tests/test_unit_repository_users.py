@@ -0,0 +1,29 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.database.models import User
+from src.repository.users import confirmed_email
+from src.services.circuit_breaker import CircuitBreaker
+from src.services.user_cache import user_cache
+
+
+class TestUsers(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session = MagicMock(execute=AsyncMock(), commit=AsyncMock())
+        user_cache.local.set('user@mail.com', User(id=1, email='user@mail.com'))
+
+    async def test_confirmed_email_redis_down(self):
+        breaker = CircuitBreaker('test', failure_threshold=1)
+        publish = AsyncMock(side_effect=RedisConnectionError('down'))
+        with patch.object(user_cache, 'breaker', breaker), \
+                patch.object(user_cache, 'publish_invalidation', publish):
+            await confirmed_email('user@mail.com', self.session)  # the committed change is not failed by Redis
+            self.assertIsNone(user_cache.local.get('user@mail.com'))
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            await confirmed_email('user@mail.com', self.session)
+
+        self.session.commit.assert_awaited()
+        publish.assert_awaited_once_with('user@mail.com')  # the second call is refused by the open circuit
@@ -0,0 +1,68 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.services.revocation import BloomFilter, RevocationList
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        self.assertEqual(bloom.count, 1000)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pipe = MagicMock(execute=AsyncMock())
+        self.pipe.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.pipe.__aexit__ = AsyncMock(return_value=False)
+        self.client = MagicMock(
+                                pipeline=MagicMock(return_value=self.pipe),
+                                exists=AsyncMock(return_value=1),
+                                hset=AsyncMock(),
+                                hdel=AsyncMock()
+                                )
+        self.revocations = RevocationList(self.client, capacity=1000, error_rate=0.01, max_lifetime=3600)
+
+    async def test_not_revoked_without_round_trip(self):
+        self.assertFalse(await self.revocations.is_revoked({'uid': 1, 'iat': time.time(), 'jti': 'jti1'}))
+        self.client.exists.assert_not_awaited()
+
+    async def test_revoke_token(self):
+        await self.revocations.revoke_token('jti1', time.time() + 60)
+        self.pipe.set.assert_called_once_with('revoked:jti:jti1', 1, ex=60)
+
+        self.assertTrue(await self.revocations.is_revoked({'uid': 1, 'iat': time.time(), 'jti': 'jti1'}))
+        self.client.exists.assert_awaited_once_with('revoked:jti:jti1')
+
+        self.client.exists.return_value = 0  # a false positive of the filter
+        self.assertFalse(await self.revocations.is_revoked({'uid': 1, 'iat': time.time(), 'jti': 'jti1'}))
+
+    async def test_revoke_user(self):
+        not_before = await self.revocations.revoke_user(1)
+        self.assertTrue(await self.revocations.is_revoked({'uid': 1, 'iat': not_before - 10, 'jti': 'jti1'}))
+        self.assertFalse(await self.revocations.is_revoked({'uid': 1, 'iat': not_before + 1, 'jti': 'jti2'}))
+        self.assertFalse(await self.revocations.is_revoked({'uid': 2, 'iat': not_before - 10, 'jti': 'jti3'}))
+
+    async def test_sync(self):
+        now = int(time.time())
+        self.pipe.execute.return_value = [1, [b'jti1'], {b'1': str(now).encode(), b'2': b'1'}]
+        await self.revocations.sync()
+
+        self.assertIn('jti1', self.revocations.filter)
+        self.assertEqual(self.revocations.not_before, {1: now})
+        self.client.hdel.assert_awaited_once_with('revoked:not_before', b'2')
@@ -0,0 +1,82 @@
+from datetime import date
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.models import Base, Contact, User
+from src.repository.search import fts_phrase, like_pattern, substring_filter
+
+
+class TestSubstringSearch(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """A local SQLite file with the FTS5 index created by create_all."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(
+                                          f'sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, "search.db")}',
+                                          poolclass=NullPool
+                                          )
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        self.session_maker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        async with self.session_maker() as db:
+            db.add(User(id=1, username='user', email='user@mail.com', password='hash'))
+            for i, name in enumerate(('Alice', 'Bob', 'Caroline', 'Alina')):
+                db.add(Contact(
+                               id=i+1,
+                               name=name,
+                               last_name=f'Smith{name}',
+                               email=f'{name.lower()}@mail.com',
+                               phone=5550+i,
+                               birthday=date.today(),
+                               user_id=1
+                               ))
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    async def names(self, values: dict[str, str], match_all: bool = False) -> list[str]:
+        async with self.session_maker() as db:
+            contacts = await db.scalars(select(Contact).filter(substring_filter('sqlite', values, match_all)))
+            return sorted(contact.name for contact in contacts)
+
+    async def test_fts_case_insensitive(self):
+        self.assertEqual(await self.names({'name': 'ALI', 'email': 'ALI'}), ['Alice', 'Alina'])
+
+    async def test_fts_phone(self):
+        self.assertEqual(await self.names({'phone': '5551'}), ['Bob'])
+
+    async def test_fts_match_all(self):
+        self.assertEqual(await self.names({'name': 'ali', 'last_name': 'lina'}, match_all=True), ['Alina'])
+
+    async def test_short_value_falls_back_to_like(self):
+        self.assertEqual(await self.names({'name': 'li'}), ['Alice', 'Alina', 'Caroline'])
+
+    async def test_fts_follows_updates_and_deletes(self):
+        async with self.session_maker() as db:
+            contact = await db.get(Contact, 2)
+            contact.name = 'Robert'
+            await db.delete(await db.get(Contact, 1))
+            await db.commit()
+
+        self.assertEqual(await self.names({'name': 'rob'}), ['Robert'])
+        self.assertEqual(await self.names({'name': 'ali'}), ['Alina'])
+
+    def test_like_pattern_escapes_wildcards(self):
+        self.assertEqual(like_pattern('A_b%'), '%a\\_b\\%%')
+
+    def test_fts_phrase_quotes(self):
+        self.assertEqual(fts_phrase('a"b OR c'), '"a""b OR c"')
+
+    def test_postgres_uses_indexed_expressions(self):
+        sql = str(substring_filter('postgresql', {'name': 'ann', 'phone': '12'}).compile(dialect=postgresql.dialect()))
+        self.assertIn('lower(contacts.name) LIKE', sql)
+        self.assertIn('contacts.phone_text LIKE', sql)
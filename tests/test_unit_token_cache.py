@@ -0,0 +1,35 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from src.services.token_cache import VerifiedTokenCache
+
+
+class TestVerifiedTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = VerifiedTokenCache(maxsize=2)
+        self.claims = {'sub': 'user@mail.com', 'scope': 'access_token', 'exp': int(time.time()) + 900}
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('token'))
+        self.cache.set('token', self.claims)
+        self.assertIs(self.cache.get('token'), self.claims)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expired(self):
+        self.cache.set('token', self.claims)
+        with patch('src.services.token_cache.time.time', return_value=self.claims['exp']):
+            self.assertIsNone(self.cache.get('token'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_bounded(self):
+        for token in ('token1', 'token2', 'token3'):
+            self.cache.set(token, self.claims)
+        self.assertIsNone(self.cache.get('token1'))
+        self.assertEqual(self.cache.stats()['size'], 2)
+
+    def test_without_exp(self):
+        self.cache.set('token', {'sub': 'user@mail.com'})
+        self.assertIsNone(self.cache.get('token'))
@@ -0,0 +1,208 @@
+import asyncio
+from datetime import datetime
+import pickle
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.database.models import User
+from src.services.circuit_breaker import CircuitBreaker
+from src.services.user_cache import decode_user, encode_user, LocalLRU, SCHEMA_VERSION, UserCache
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        # the queued commands of a pipeline are plain calls, only execute is awaited
+        self.pipe = MagicMock(execute=AsyncMock())
+        self.pipe.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.pipe.__aexit__ = AsyncMock(return_value=False)
+        self.client = MagicMock(
+                                get=AsyncMock(return_value=None),
+                                set=AsyncMock(),
+                                pipeline=MagicMock(return_value=self.pipe)
+                                )
+        self.cache = UserCache(self.client, ttl=60)
+
+    async def test_miss(self):
+        self.assertIsNone(await self.cache.get('user@mail.com'))
+        self.client.get.assert_awaited_once_with('user:user@mail.com')
+
+    async def test_set_with_expiration(self):
+        await self.cache.set('user@mail.com', User(id=1, email='user@mail.com'))
+        self.client.set.assert_awaited_once()  # one SET ... EX, no separate EXPIRE
+        self.assertEqual(self.client.set.call_args.args[0], 'user:user@mail.com')
+        self.assertEqual(self.client.set.call_args.kwargs, {'ex': 60})
+
+    async def test_hit(self):
+        await self.cache.set('user@mail.com', User(id=1, email='user@mail.com'))
+        self.client.get.return_value = self.client.set.call_args.args[1]
+        user = await self.cache.get('user@mail.com')
+        self.assertEqual((user.id, user.email), (1, 'user@mail.com'))
+        self.client.get.assert_not_awaited()  # served by the local tier
+        self.cache.local.clear()
+        user = await self.cache.get('user@mail.com')
+        self.assertEqual((user.id, user.email), (1, 'user@mail.com'))
+        self.client.get.assert_awaited_once()
+        self.assertEqual(len(self.cache.local), 1)  # filled from Redis
+
+    async def test_invalidate(self):
+        pipe = self.pipe
+        pipe.execute = AsyncMock()
+        self.cache.local.set('user@mail.com', User(id=1))
+        await self.cache.invalidate('user@mail.com')
+        self.assertIsNone(self.cache.local.get('user@mail.com'))
+        pipe.incr.assert_called_once_with('user:user@mail.com:gen')
+        pipe.delete.assert_called_once_with('user:user@mail.com')
+        pipe.publish.assert_called_once_with('user_cache:invalidate', 'user@mail.com')
+        pipe.execute.assert_awaited_once()
+
+    async def test_single_flight(self):
+        pipe = self.pipe
+        pipe.execute = AsyncMock(return_value=[None, -2, None])  # GET, PTTL of a missing key, no generation yet
+        self.client.set.return_value = True  # the lock is acquired
+        self.client.eval = AsyncMock(return_value=1)
+
+        async def load_user():
+            await asyncio.sleep(0.01)
+            return User(id=1, email='user@mail.com', password='hash')
+
+        loader = AsyncMock(side_effect=load_user)
+        users = await asyncio.gather(*(self.cache.get_or_load('user@mail.com', loader) for _ in range(5)))
+        loader.assert_awaited_once()
+        self.assertEqual([user.id for user in users], [1] * 5)
+        self.assertIsNone(users[0].password)  # the cached projection
+        self.assertEqual(self.client.eval.await_count, 2)  # stored if the generation is still '', the lock released
+        self.assertEqual(self.client.eval.await_args_list[0].args[1:5],
+                         (2, 'user:user@mail.com', 'user:user@mail.com:gen', ''))
+        self.assertEqual(self.cache.loads, 1)
+
+    async def test_refresh_ahead(self):
+        payload = encode_user(User(id=1, email='user@mail.com'))
+        pipe = self.pipe
+        loader = AsyncMock(return_value=User(id=1, email='user@mail.com', username='renamed'))
+        self.client.eval = AsyncMock(return_value=1)
+        with patch('src.services.user_cache.random.random', return_value=0.5):  # refresh below ~41.6 s (60 s scale)
+            pipe.execute = AsyncMock(return_value=[payload, 100_000, b'3'])
+            user = await self.cache.get_or_load('user@mail.com', loader)
+            loader.assert_not_awaited()
+            self.assertIsNone(user.username)
+
+            self.cache.local.clear()
+            pipe.execute = AsyncMock(return_value=[payload, 30_000, b'3'])
+            self.client.set.return_value = None  # another worker is refreshing it
+            user = await self.cache.get_or_load('user@mail.com', loader)
+            loader.assert_not_awaited()
+            self.assertIsNone(user.username)
+
+            self.cache.local.clear()
+            self.client.set.return_value = True
+            user = await self.cache.get_or_load('user@mail.com', loader)
+            loader.assert_awaited_once()
+            self.assertEqual(user.username, 'renamed')
+            self.assertEqual(self.cache.refreshes, 2)
+
+    async def test_redis_down(self):
+        self.cache.breaker = CircuitBreaker('test', failure_threshold=1)
+        pipe = self.pipe
+        pipe.execute = AsyncMock(side_effect=RedisConnectionError('down'))
+        loader = AsyncMock(return_value=User(id=1, email='user@mail.com'))
+        user = await self.cache.get_or_load('user@mail.com', loader)
+        self.assertEqual(user.id, 1)
+        loader.assert_awaited_once()  # loaded once, not cached
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(len(self.cache.local), 0)
+
+    async def test_loader_error_not_counted_by_breaker(self):
+        self.cache.breaker = CircuitBreaker('test', failure_threshold=1)
+        pipe = self.pipe
+        pipe.execute = AsyncMock(return_value=[None, -2, None])
+        self.client.set.return_value = True
+        self.client.eval = AsyncMock(return_value=1)
+        loader = AsyncMock(side_effect=OSError('database is unreachable'))
+        with self.assertRaises(OSError):
+            await self.cache.get_or_load('user@mail.com', loader)
+        loader.assert_awaited_once()
+        self.client.eval.assert_awaited_once()  # the lock is released
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.cache.breaker.failures, 0)
+
+    async def test_invalidate_during_load(self):
+        cache = UserCache(fakeredis.aioredis.FakeRedis(), ttl=60)
+
+        async def load_user():
+            # the user is read before the change, the change is committed and invalidated before the load ends
+            user = User(id=1, email='user@mail.com', username='old')
+            await cache.invalidate('user@mail.com')
+            return user
+
+        user = await cache.get_or_load('user@mail.com', load_user)
+        self.assertEqual(user.username, 'old')  # the request which started before the change
+        self.assertIsNone(await cache.client.get('user:user@mail.com'))  # the stale user is not stored
+        self.assertEqual(len(cache.local), 0)
+
+        loader = AsyncMock(return_value=User(id=1, email='user@mail.com', username='new'))
+        self.assertEqual((await cache.get_or_load('user@mail.com', loader)).username, 'new')
+        self.assertIsNotNone(await cache.client.get('user:user@mail.com'))
+
+    def test_should_refresh(self):
+        with patch('src.services.user_cache.random.random', return_value=0.5):
+            self.assertTrue(self.cache.should_refresh(30))
+            self.assertFalse(self.cache.should_refresh(100))
+            self.assertFalse(self.cache.should_refresh(-0.001))  # no expiration (PTTL -1) or no key (PTTL -2)
+
+
+class TestLocalLRU(unittest.TestCase):
+
+    def test_eviction(self):
+        lru = LocalLRU(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')  # b becomes the least recently used
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_ttl(self):
+        lru = LocalLRU(maxsize=2, ttl=5)
+        with patch('src.services.user_cache.time.monotonic', return_value=100.0):
+            lru.set('a', 1)
+        with patch('src.services.user_cache.time.monotonic', return_value=104.0):
+            self.assertEqual(lru.get('a'), 1)
+        with patch('src.services.user_cache.time.monotonic', return_value=105.0):
+            self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
+
+
+class TestUserSerialization(unittest.TestCase):
+
+    def setUp(self):
+        self.user = User(
+                         id=7,
+                         username='Юзер',
+                         email='user@mail.com',
+                         password='hash',
+                         refresh_token='token',
+                         avatar=None,
+                         confirmed=True,
+                         created_at=datetime(2023, 4, 18, 20, 23, 20, 123456)
+                         )
+
+    def test_round_trip(self):
+        payload = encode_user(self.user)
+        self.assertEqual(payload[0], SCHEMA_VERSION)
+        self.assertNotIn(b'hash', payload)
+        self.assertNotIn(b'token', payload)
+        user = decode_user(payload)
+        self.assertEqual(
+                         (user.id, user.username, user.email, user.avatar, user.confirmed, user.created_at),
+                         (7, 'Юзер', 'user@mail.com', None, True, datetime(2023, 4, 18, 20, 23, 20, 123456))
+                         )
+        self.assertIsNone(user.password)
+
+    def test_stale_entries_ignored(self):
+        payload = encode_user(self.user)
+        self.assertIsNone(decode_user(bytes([SCHEMA_VERSION + 1]) + payload[1:]))
+        self.assertIsNone(decode_user(pickle.dumps(self.user)))  # the previous cache format
+        self.assertIsNone(decode_user(payload[:-3]))